@@ -1,19 +1,36 @@
+import time
+# Засекаем время до импорта Qt — для режима профилирования запуска
+_STARTUP_T0 = time.perf_counter()
 import os
 import sys
 import json
+import math
+import array
+import bisect
+import shutil
+import struct
+import hashlib
+import hmac
+import secrets
+import heapq
+import itertools
+import tempfile
+import threading
+import traceback
+import collections
 import subprocess
+import atexit
 import platform
-import zipfile
-import urllib.request
-import ctypes
+# asyncio, zipfile, urllib, ctypes и sqlite3 импортируются по месту использования: они не нужны до первой отрисовки окна
 from PyQt6.QtWidgets import (
     QApplication, QDialog, QVBoxLayout, QLabel, QProgressBar, QPushButton, QMessageBox,
     QMainWindow, QWidget, QHBoxLayout, QGridLayout, QTabWidget,
     QGroupBox, QLineEdit, QComboBox, QTextEdit, QScrollArea, QFileDialog,
-    QCheckBox, QFormLayout, QStyle, QGraphicsDropShadowEffect
+    QCheckBox, QFormLayout, QStyle, QGraphicsDropShadowEffect, QSpinBox, QDoubleSpinBox, QInputDialog, QToolTip,
+    QSizePolicy
 )
-from PyQt6.QtCore import Qt, QThread, pyqtSignal
-from PyQt6.QtGui import QFont, QColor, QPixmap
+from PyQt6.QtCore import Qt, QThread, QObject, QCoreApplication, QTimer, pyqtSignal
+from PyQt6.QtGui import QFont, QColor, QPixmap, QPainter
 
 # При упаковке в один exe (PyInstaller --onefile) файл будет запущен из временной папки.
 # Для устойчивого хранения конфигурации и поиска ресурсов используем папку рядом с исполняемым файлом.
@@ -29,108 +46,489 @@ RESOURCE_DIR = getattr(sys, '_MEIPASS', APP_DIR)
 # config.json хранится рядом с exe (APP_DIR) чтобы приложение было портативным
 CONFIG_FILE = os.path.join(APP_DIR, "config.json")
 
+# Кэши (индексы файлов, миниатюры и т.п.) также храним рядом с exe
+CACHE_DIR = os.path.join(APP_DIR, "cache")
+CATALOG_FILE = os.path.join(CACHE_DIR, "catalog.sqlite3")
+
+# Ошибки фонового кода, если нет консоли (оконный exe: sys.stderr is None)
+ERROR_LOG_FILE = os.path.join(APP_DIR, "errors.log")
+
+
+class _FileLock:
+    """Межпроцессная блокировка на отдельном lock-файле (fcntl на POSIX, msvcrt на Windows)."""
+    def __init__(self, path, timeout=10.0):
+        self.path = path
+        self.timeout = timeout
+        self._fd = None
+
+    def __enter__(self):
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                if os.name == 'nt':
+                    import msvcrt
+                    msvcrt.locking(self._fd, msvcrt.LK_NBLCK, 1)
+                else:
+                    import fcntl
+                    fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return self
+            except OSError:
+                if time.monotonic() >= deadline:
+                    os.close(self._fd)
+                    self._fd = None
+                    raise TimeoutError(f"не удалось захватить блокировку {self.path}")
+                time.sleep(0.05)
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+        return False
+
+
+class ConfigStore:
+    """Единое хранилище config.json: кэш в памяти, проверка схемы, атомарная отложенная запись.
+
+    Чтение — обычный поиск в словаре. Изменения помечают ключи «грязными» и сбрасываются на диск
+    не чаще раза в FLUSH_DELAY секунд: под файловой блокировкой свежая версия файла перечитывается,
+    поверх неё накладываются только изменённые здесь ключи, результат пишется во временный файл,
+    fsync и os.replace. Поэтому параллельные экземпляры не затирают чужие ключи и не оставляют
+    наполовину записанный файл.
+    """
+    # ключ -> (тип, значение по умолчанию)
+    SCHEMA = {
+        "ffmpeg_installed": (bool, False),
+        "ffmpeg_path": (str, ""),
+        "ffprobe_path": (str, ""),
+        "language": (str, ""),
+        "show_video_notifications": (bool, True),
+        "show_audio_notifications": (bool, True),
+        "verify_integrity": (bool, True),
+        "verify_tail_decode": (bool, True),
+        "verify_quality": (bool, False),
+        "verify_windows": (int, 3),
+        "verify_ssim_min": (float, 0.95),
+        "scratch_dir": (str, ""),
+        "scratch_quota_gb": (float, 0.0),
+        "prefetch_inputs": (bool, False),
+        "prefetch_depth": (int, 2),
+        "prefetch_budget_gb": (float, 20.0),
+        "admission_control": (bool, True),
+        "memory_limit": (bool, False),
+        "batch_policy": (str, "fifo"),
+        "batch_parallel": (int, 1),
+        "encoder": (dict, {}),
+        "encoder_presets": (dict, {}),
+        "catalog_dir": (str, ""),
+        "cluster_enabled": (bool, False),
+        "cluster_port": (int, 8765),
+        "cluster_token": (str, ""),
+        "api_enabled": (bool, False),
+        "api_port": (int, 8766),
+        "api_socket": (str, ""),
+        "api_token": (str, ""),
+    }
+    FLUSH_DELAY = 0.5
+    RETRY_DELAY = 5.0   # повтор записи, если файл занят или диск недоступен
+
+    def __init__(self, path):
+        self.path = path
+        self._data = None
+        self._dirty = set()
+        self._lock = threading.RLock()
+        self._timer = None
+
+    @classmethod
+    def _valid(cls, key, value):
+        spec = cls.SCHEMA.get(key)
+        if spec is None:
+            return True
+        expected = spec[0]
+        if expected is int and isinstance(value, bool):
+            return False
+        if expected is float and isinstance(value, int) and not isinstance(value, bool):
+            return True
+        return isinstance(value, expected)
+
+    def _read_disk(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict):
+            return {}
+        # Значения неверного типа отбрасываем — вместо них будет значение по умолчанию
+        return {k: v for k, v in data.items() if self._valid(k, v)}
+
+    def _ensure_loaded(self):
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    self._data = self._read_disk()
+
+    def get(self, key, default=None):
+        self._ensure_loaded()
+        if key in self._data:
+            return self._data[key]
+        if default is None and key in self.SCHEMA:
+            default = self.SCHEMA[key][1]
+            # Изменяемые значения по умолчанию не должны разделяться между вызовами
+            return dict(default) if isinstance(default, dict) else default
+        return default
+
+    def update(self, values=None, **kwargs):
+        """Изменяет значения в памяти и планирует запись. Неверный тип — ValueError."""
+        values = dict(values or {}, **kwargs)
+        for key, value in values.items():
+            if not self._valid(key, value):
+                raise ValueError(f"Неверное значение настройки {key}: {value!r}")
+        self._ensure_loaded()
+        with self._lock:
+            for key, value in values.items():
+                if self._data.get(key, object()) != value:
+                    self._data[key] = value
+                    self._dirty.add(key)
+            if self._dirty:
+                self._schedule_flush()
+
+    def set(self, key, value):
+        self.update({key: value})
+
+    def _schedule_flush(self, delay=None):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(self.FLUSH_DELAY if delay is None else delay, self._flush_later)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_later(self):
+        """Отложенная запись в потоке таймера: ошибку не теряем (report_error) и повторяем позже."""
+        try:
+            self.flush()
+        except OSError as e:  # в том числе TimeoutError блокировки
+            report_error(f"⚠️ Не удалось сохранить {self.path}: {e}; повтор через {self.RETRY_DELAY:g} с")
+            with self._lock:
+                if self._dirty and self._timer is None:
+                    self._schedule_flush(self.RETRY_DELAY)
+
+    def flush(self):
+        """Немедленно записывает изменённые ключи на диск."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            with _FileLock(self.path + ".lock"):
+                merged = self._read_disk()
+                for key in self._dirty:
+                    merged[key] = self._data[key]
+                tmp = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(merged, f, indent=4, ensure_ascii=False)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.path)
+                if os.name != 'nt':
+                    try:
+                        dir_fd = os.open(directory, os.O_RDONLY)
+                        try:
+                            os.fsync(dir_fd)
+                        finally:
+                            os.close(dir_fd)
+                    except OSError:
+                        pass
+            # Подхватываем ключи, записанные другими экземплярами
+            self._data = merged
+            self._dirty.clear()
+
+
+CONFIG = ConfigStore(CONFIG_FILE)
+atexit.register(CONFIG.flush)
+
+
+class StartupProfiler:
+    """Замер времени запуска по фазам до первой отрисовки окна.
+
+    Включается флагом --profile-startup или переменной окружения CINECONVERT_PROFILE_STARTUP=1.
+    """
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.phases = []
+        self._last = _STARTUP_T0
+
+    def mark(self, phase):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def report(self):
+        if not self.enabled:
+            return []
+        total = self._last - _STARTUP_T0
+        lines = ["Профиль запуска (до первой отрисовки):"]
+        lines += [f"  {phase:<28} {seconds * 1000:8.1f} мс" for phase, seconds in self.phases]
+        lines.append(f"  {'итого':<28} {total * 1000:8.1f} мс")
+        if sys.stderr is not None:
+            print("\n".join(lines), file=sys.stderr)
+        return lines
+
+
+PROFILER = StartupProfiler('--profile-startup' in sys.argv or os.environ.get('CINECONVERT_PROFILE_STARTUP') == '1')
+
 # ========== FFmpeg Автоматическая проверка и установка ==========
-class FFmpegSetupThread(QThread):
-    # progress can be a status string or an int (percent)
-    progress = pyqtSignal(object)
-    finished = pyqtSignal(bool, str)
+class FFmpegInstaller:
+    """Скачивает и распаковывает FFmpeg без Qt — его можно проверять на локальном HTTP-сервере.
 
-    def run(self):
+    Архив качается крупными блоками в файл .part с докачкой через HTTP Range после обрыва.
+    ETag (или Last-Modified) ответа хранится рядом с .part и уходит в If-Range: если по тому же
+    адресу уже лежит новый выпуск, сервер отдаёт файл целиком, и куски разных архивов не
+    склеиваются. По ходу считается SHA-256 и сверяется с опубликованной суммой; без суммы
+    установка прерывается (отказаться от проверки можно только явным sha256=""). Из zip
+    извлекаются только нужные бинарники — прямо в ffmpeg/bin, без распаковки всего архива.
+    """
+    URL = "https://www.gyan.dev/ffmpeg/builds/ffmpeg-release-essentials.zip"
+    CHUNK_SIZE = 1024 * 1024
+    ATTEMPTS = 4
+    PROGRESS_INTERVAL = 0.2
+    MEMBERS = ("ffmpeg.exe", "ffprobe.exe")
+
+    def __init__(self, app_dir, url=None, checksum_url=None, sha256=None, members=None,
+                 on_progress=None, on_status=None, timeout=30):
+        self.app_dir = app_dir
+        self.bin_dir = os.path.join(app_dir, "ffmpeg", "bin")
+        self.url = url or self.URL
+        self.checksum_url = checksum_url if checksum_url is not None else self.url + ".sha256"
+        self.sha256 = sha256
+        self.members = tuple(m.lower() for m in (members or self.MEMBERS))
+        self.on_progress = on_progress
+        self.on_status = on_status
+        self.timeout = timeout
+        self.zip_path = os.path.join(app_dir, "ffmpeg.zip")
+        self.part_path = self.zip_path + ".part"
+        self.validator_path = self.part_path + ".etag"
+        self._last_emit = 0.0
+        self._last_percent = None
+
+    def _status(self, text):
+        if self.on_status:
+            self.on_status(text)
+
+    def _progress(self, downloaded, total, force=False):
+        if not self.on_progress or not total:
+            return
+        percent = min(100, int(downloaded * 100 / total))
+        now = time.monotonic()
+        # Не чаще раза в PROGRESS_INTERVAL и только при изменении процента
+        if force or (percent != self._last_percent and now - self._last_emit >= self.PROGRESS_INTERVAL):
+            self._last_emit = now
+            self._last_percent = percent
+            self.on_progress(percent)
+
+    def _open(self, url, offset=0, validator=None):
+        import urllib.request
+        headers = {"User-Agent": "Mozilla/5.0"}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            if validator:
+                headers["If-Range"] = validator
+        return urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=self.timeout)
+
+    def fetch_checksum(self):
+        """Возвращает ожидаемую SHA-256: заданную явно или опубликованную рядом с архивом.
+
+        None — только при явном sha256="" (проверка отключена). Если сумму не удалось получить
+        за ATTEMPTS попыток, бросает IOError: непроверенный бинарник не устанавливаем.
+        """
+        if self.sha256:
+            return self.sha256.lower()
+        if self.sha256 == "":
+            return None
+        if not self.checksum_url:
+            raise IOError("не задан адрес контрольной суммы архива")
+        last_error = None
+        for attempt in range(self.ATTEMPTS):
+            try:
+                with self._open(self.checksum_url) as resp:
+                    text = resp.read(4096).decode('ascii', errors='replace')
+            except Exception as e:
+                last_error = e
+            else:
+                for token in text.split():
+                    if len(token) == 64 and all(c in "0123456789abcdefABCDEF" for c in token):
+                        return token.lower()
+                raise IOError(f"в {self.checksum_url} нет суммы SHA-256")
+            if attempt + 1 < self.ATTEMPTS:
+                self._status(f"⚠️ Повтор загрузки контрольной суммы ({attempt + 2}/{self.ATTEMPTS}): {last_error}")
+                time.sleep(min(2 ** attempt, 10))
+        raise IOError(f"не удалось получить контрольную сумму архива: {last_error}")
+
+    def _read_validator(self):
         try:
-            app_dir = APP_DIR
-            ffmpeg_dir = os.path.join(app_dir, "ffmpeg")
-            ffmpeg_bin = os.path.join(ffmpeg_dir, "bin")
+            with open(self.validator_path, encoding='ascii') as f:
+                return f.read().strip() or None
+        except (OSError, ValueError):
+            return None
 
-            if not os.path.exists(ffmpeg_bin):
-                os.makedirs(ffmpeg_bin, exist_ok=True)
+    def _save_validator(self, resp):
+        """Запоминает версию скачиваемого файла для If-Range (слабый ETag для этого не годится)."""
+        etag = resp.getheader('ETag')
+        validator = etag if etag and not etag.startswith('W/') else resp.getheader('Last-Modified')
+        try:
+            if validator:
+                with open(self.validator_path, 'w', encoding='ascii') as f:
+                    f.write(validator)
+            elif os.path.exists(self.validator_path):
+                os.remove(self.validator_path)
+        except (OSError, ValueError):
+            validator = None
+        return validator
 
-            zip_path = os.path.join(app_dir, "ffmpeg.zip")
-            url = "https://www.gyan.dev/ffmpeg/builds/ffmpeg-release-essentials.zip"
+    def _hash_existing(self, digest):
+        if not os.path.exists(self.part_path):
+            return 0
+        size = 0
+        with open(self.part_path, 'rb') as f:
+            while True:
+                block = f.read(self.CHUNK_SIZE)
+                if not block:
+                    return size
+                digest.update(block)
+                size += len(block)
 
-            self.progress.emit("📥 Скачивание FFmpeg...")
-            # Streaming download with progress reporting
+    def download(self):
+        """Скачивает архив с докачкой. Возвращает SHA-256 скачанного файла."""
+        import urllib.error
+        digest = hashlib.sha256()
+        validator = self._read_validator()
+        # Без сохранённой версии нельзя убедиться, что .part — от того же архива: качаем заново
+        downloaded = self._hash_existing(digest) if validator else 0
+        last_error = None
+        for attempt in range(self.ATTEMPTS):
             try:
-                req = urllib.request.Request(url, headers={"User-Agent": "Mozilla/5.0"})
-                with urllib.request.urlopen(req) as resp:
-                    total = resp.getheader('Content-Length')
-                    total = int(total) if total and total.isdigit() else None
-                    downloaded = 0
-                    chunk_size = 8192
-                    with open(zip_path, 'wb') as out_f:
+                with self._open(self.url, downloaded, validator) as resp:
+                    status = getattr(resp, 'status', 200)
+                    if downloaded and status != 206:
+                        # Сервер не поддерживает Range или файл по адресу сменился — начинаем заново
+                        digest = hashlib.sha256()
+                        downloaded = 0
+                    if not downloaded:
+                        validator = self._save_validator(resp)
+                    length = resp.getheader('Content-Length')
+                    total = downloaded + int(length) if length and length.isdigit() else None
+                    if downloaded and total:
+                        self._status(f"📥 Докачка FFmpeg с {downloaded * 100 // total}%...")
+                    with open(self.part_path, 'ab' if downloaded else 'wb') as out_f:
                         while True:
-                            chunk = resp.read(chunk_size)
-                            if not chunk:
+                            block = resp.read(self.CHUNK_SIZE)
+                            if not block:
                                 break
-                            out_f.write(chunk)
-                            downloaded += len(chunk)
-                            if total:
-                                percent = int(downloaded * 100 / total)
-                                # emit numeric progress
-                                self.progress.emit(percent)
+                            out_f.write(block)
+                            digest.update(block)
+                            downloaded += len(block)
+                            self._progress(downloaded, total)
+                    if total and downloaded < total:
+                        raise IOError(f"соединение оборвалось на {downloaded} из {total} байт")
+                    self._progress(downloaded, total or downloaded, force=True)
+                os.replace(self.part_path, self.zip_path)
+                if os.path.exists(self.validator_path):
+                    os.remove(self.validator_path)
+                return digest.hexdigest()
+            except urllib.error.HTTPError as e:
+                if e.code == 416 and downloaded:
+                    # Частичный файл больше или равен полному — качаем заново
+                    os.remove(self.part_path)
+                    digest = hashlib.sha256()
+                    downloaded = 0
+                last_error = e
             except Exception as e:
-                # fallback to urlretrieve if streaming fails
-                try:
-                    urllib.request.urlretrieve(url, zip_path)
-                except Exception as e2:
-                    self.progress.emit(f"❌ Ошибка загрузки: {e2}")
-                    self.finished.emit(False, "")
-                    return
+                last_error = e
+            if attempt + 1 < self.ATTEMPTS:
+                self._status(f"⚠️ Повтор загрузки ({attempt + 2}/{self.ATTEMPTS}): {last_error}")
+                time.sleep(min(2 ** attempt, 10))
+        raise IOError(f"не удалось скачать FFmpeg: {last_error}")
 
-            self.progress.emit("📦 Распаковка...")
-            with zipfile.ZipFile(zip_path, "r") as zip_ref:
-                zip_ref.extractall(app_dir)
+    def extract(self):
+        """Извлекает только нужные бинарники из архива прямо в ffmpeg/bin."""
+        import zipfile
+        os.makedirs(self.bin_dir, exist_ok=True)
+        extracted = {}
+        with zipfile.ZipFile(self.zip_path) as zf:
+            for info in zf.infolist():
+                name = os.path.basename(info.filename).lower()
+                if info.is_dir() or name not in self.members or name in extracted:
+                    continue
+                target = os.path.join(self.bin_dir, os.path.basename(info.filename))
+                tmp = target + ".tmp"
+                with zf.open(info) as src, open(tmp, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, self.CHUNK_SIZE)
+                if os.name != 'nt':
+                    os.chmod(tmp, 0o755)
+                os.replace(tmp, target)
+                extracted[name] = target
+        return extracted
 
-            # Удаляем временный ZIP
-            if os.path.exists(zip_path):
-                os.remove(zip_path)
+    def install(self):
+        """Полная установка. Возвращает (ffmpeg_path, ffprobe_path); бросает исключение при ошибке."""
+        os.makedirs(self.bin_dir, exist_ok=True)
+        self._status("📥 Скачивание FFmpeg...")
+        expected = self.fetch_checksum()
+        actual = self.download()
+        if expected:
+            if actual != expected:
+                os.remove(self.zip_path)
+                raise IOError("контрольная сумма SHA-256 архива не совпала")
+            self._status("🔒 Контрольная сумма SHA-256 совпала")
+        else:
+            self._status("⚠️ Проверка контрольной суммы отключена (sha256=\"\")")
+        self._status("📦 Распаковка...")
+        try:
+            extracted = self.extract()
+        finally:
+            if os.path.exists(self.zip_path):
+                os.remove(self.zip_path)
+        ffmpeg_path = extracted.get(self.members[0])
+        ffprobe_path = extracted.get(self.members[1]) if len(self.members) > 1 else None
+        if not ffmpeg_path or not ffprobe_path:
+            raise FileNotFoundError("FFmpeg не найден в архиве")
+        return ffmpeg_path, ffprobe_path
 
-            # Ищем папку с распакованным ffmpeg
-            extracted_dir = None
-            for item in os.listdir(app_dir):
-                if item.startswith("ffmpeg-") and os.path.isdir(os.path.join(app_dir, item)):
-                    extracted_dir = os.path.join(app_dir, item)
-                    break
 
-            if extracted_dir:
-                inner_bin = os.path.join(extracted_dir, "bin")
-                import shutil
-                # Если внутри есть папка bin — перемещаем файлы оттуда
-                if os.path.exists(inner_bin):
-                    for file in os.listdir(inner_bin):
-                        src = os.path.join(inner_bin, file)
-                        dst = os.path.join(ffmpeg_bin, file)
-                        try:
-                            # Пытаемся переместить, если не удалось — копируем
-                            os.replace(src, dst)
-                        except Exception:
-                            try:
-                                shutil.copy2(src, dst)
-                            except Exception:
-                                pass
-                    shutil.rmtree(extracted_dir, ignore_errors=True)
-                else:
-                    # Если bin отсутствует, ищем бинарники по дереву и копируем
-                    for root, dirs, files in os.walk(extracted_dir):
-                        for fname in files:
-                            if fname.lower() in ("ffmpeg.exe", "ffprobe.exe"):
-                                src = os.path.join(root, fname)
-                                dst = os.path.join(ffmpeg_bin, fname)
-                                try:
-                                    shutil.copy2(src, dst)
-                                except Exception:
-                                    pass
-                    shutil.rmtree(extracted_dir, ignore_errors=True)
-
-            ffmpeg_path = os.path.join(ffmpeg_bin, "ffmpeg.exe")
-            ffprobe_path = os.path.join(ffmpeg_bin, "ffprobe.exe")
+class FFmpegSetupThread(QThread):
+    # progress can be a status string or an int (percent)
+    progress = pyqtSignal(object)
+    finished = pyqtSignal(bool, str)
+    result_paths = ("", "")
+
+    def run(self):
+        try:
+            installer = FFmpegInstaller(APP_DIR, on_progress=self.progress.emit, on_status=self.progress.emit)
+            try:
+                ffmpeg_path, ffprobe_path = installer.install()
+            except Exception as e:
+                self.progress.emit(f"❌ Ошибка загрузки: {e}")
+                self.finished.emit(False, "")
+                return
 
             if os.path.exists(ffmpeg_path) and os.path.exists(ffprobe_path):
-                with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-                    json.dump({
-                        "ffmpeg_installed": True,
-                        "ffmpeg_path": ffmpeg_path,
-                        "ffprobe_path": ffprobe_path
-                    }, f, indent=4, ensure_ascii=False)
+                self.result_paths = (ffmpeg_path, ffprobe_path)
+                # Обновляем только пути — язык и прочие настройки сохраняются
+                CONFIG.update(ffmpeg_installed=True, ffmpeg_path=ffmpeg_path, ffprobe_path=ffprobe_path)
+                CONFIG.flush()
                 self.progress.emit("✅ Установка завершена!")
                 self.finished.emit(True, ffmpeg_path)
             else:
@@ -190,11 +588,68 @@ class FFmpegSetupDialog(QDialog):
             self.label.setText("Ошибка при установке FFmpeg.")
         self.btn_close.setEnabled(True)
 
+# ========== Локализация ==========
+class LocaleCatalog:
+    """Проверенный и закэшированный каталог переводов из JSON-файла локали.
+
+    Каталог компилируется один раз и перечитывается только при изменении mtime файла.
+    Значения — строки либо списки строк (элементы combobox); прочее отбрасывается.
+    Ключи вида 'input_path.placeholder' сводятся к 'input_path'.
+    """
+    _cache = {}
+
+    @staticmethod
+    def _validate(data):
+        catalog = {}
+        if not isinstance(data, dict):
+            return catalog
+        for key, value in data.items():
+            if not isinstance(key, str):
+                continue
+            if key.endswith('.placeholder'):
+                key = key[:-len('.placeholder')]
+            if isinstance(value, str):
+                catalog[key] = value
+            elif isinstance(value, (list, tuple)) and all(isinstance(v, str) for v in value):
+                catalog[key] = list(value)
+        return catalog
+
+    @classmethod
+    def compile(cls, path):
+        """Возвращает словарь переводов файла path (из кэша, если файл не менялся)."""
+        if not path:
+            return {}
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return {}
+        cached = cls._cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                catalog = cls._validate(json.load(f))
+        except (OSError, ValueError):
+            catalog = {}
+        cls._cache[path] = (mtime, catalog)
+        return catalog
+
+    @classmethod
+    def load(cls, path, fallback_path=None):
+        """Каталог локали с откатом на fallback (английский) для отсутствующих ключей."""
+        catalog = cls.compile(path)
+        if fallback_path and fallback_path != path:
+            return collections.ChainMap(catalog, cls.compile(fallback_path))
+        return catalog
+
+
 # ========== Основной интерфейс ==========
 class NotificationDialog(QDialog):
     def __init__(self, output_file, parent=None):
         super().__init__(parent)
-        self.setWindowTitle("Рендеринг завершен")
+        t = getattr(parent, 'translations', None) or {}
+        tr = lambda text: t.get(text, text)
+        self.setWindowTitle(tr("Рендеринг завершен"))
         if parent is not None:
             try:
                 self.setWindowIcon(parent.windowIcon())
@@ -204,7 +659,7 @@ class NotificationDialog(QDialog):
         
         layout = QVBoxLayout()
         
-        message = QLabel("Рендеринг завершен успешно!")
+        message = QLabel(tr("Рендеринг завершен успешно!"))
         message.setAlignment(Qt.AlignmentFlag.AlignCenter)
         message.setStyleSheet("font-size: 14px; font-weight: bold;")
         layout.addWidget(message)
@@ -212,17 +667,17 @@ class NotificationDialog(QDialog):
         # Кнопки действий
         btn_layout = QHBoxLayout()
         
-        self.btn_play = QPushButton("Включить видео")
+        self.btn_play = QPushButton(tr("Включить видео"))
         self.btn_play.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_MediaPlay))
         self.btn_play.clicked.connect(lambda: self.play_video(output_file))
         btn_layout.addWidget(self.btn_play)
         
-        self.btn_open_folder = QPushButton("Открыть папку")
+        self.btn_open_folder = QPushButton(tr("Открыть папку"))
         self.btn_open_folder.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_DirIcon))
         self.btn_open_folder.clicked.connect(lambda: self.open_folder(output_file))
         btn_layout.addWidget(self.btn_open_folder)
         
-        self.btn_cancel = QPushButton("Отмена")
+        self.btn_cancel = QPushButton(tr("Отмена"))
         self.btn_cancel.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_DialogCancelButton))
         self.btn_cancel.clicked.connect(self.reject)
         btn_layout.addWidget(self.btn_cancel)
@@ -262,42 +717,384 @@ class NotificationDialog(QDialog):
                 subprocess.call(('xdg-open', folder_path))
         self.accept()
 
+class ThumbnailStrip(QLabel):
+    """Полоса миниатюр под превью: при наведении сообщает номер кадра для показа в превью."""
+    hovered = pyqtSignal(int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.count = 0
+        self.setMouseTracking(True)
+        self.setAlignment(Qt.AlignmentFlag.AlignCenter)
+
+    def set_strip(self, pixmap, count):
+        self.count = count
+        self.setPixmap(pixmap.scaled(
+            self.width(), self.height(),
+            Qt.AspectRatioMode.IgnoreAspectRatio,
+            Qt.TransformationMode.SmoothTransformation
+        ))
+
+    def clear_strip(self):
+        self.count = 0
+        self.clear()
+
+    def mouseMoveEvent(self, event):
+        if self.count:
+            x = event.position().x()
+            self.hovered.emit(max(0, min(self.count - 1, int(x * self.count / max(1, self.width())))))
+        super().mouseMoveEvent(event)
+
+
+class WaveformView(QLabel):
+    """Огибающая звука: min/max по столбцам, RMS поверх, столбцы с клиппингом — красным."""
+    BACKGROUND = "#f7f7f7"
+    PEAK_COLOR = "#8db6e3"
+    RMS_COLOR = "#2c5d8f"
+    CLIP_COLOR = "#d9534f"
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.overview = None
+        self.setMouseTracking(True)
+        self.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        # Картинка перерисовывается под ширину виджета — её размер не должен мешать окну сжиматься
+        self.setSizePolicy(QSizePolicy.Policy.Ignored, QSizePolicy.Policy.Fixed)
+
+    def set_waveform(self, overview):
+        self.overview = overview
+        self._render()
+
+    def clear_waveform(self, text=""):
+        self.overview = None
+        self.clear()
+        self.setText(text)
+
+    def _columns(self, width):
+        """(min, max, rms) на каждый пиксель ширины: корзины обзора, сведённые к столбцам."""
+        mins, maxs, rms = self.overview['min'], self.overview['max'], self.overview['rms']
+        count = len(mins)
+        columns = []
+        for x in range(width):
+            first = x * count // width
+            last = max(first + 1, (x + 1) * count // width)
+            columns.append((min(mins[first:last]), max(maxs[first:last]), max(rms[first:last])))
+        return columns
+
+    def _render(self):
+        width, height = self.width(), self.height()
+        if not self.overview or not self.overview['min'] or width < 2 or height < 2:
+            return
+        pixmap = QPixmap(width, height)
+        pixmap.fill(QColor(self.BACKGROUND))
+        painter = QPainter(pixmap)
+        middle = height / 2
+        scale = middle - 1
+        peak, rms, clip = QColor(self.PEAK_COLOR), QColor(self.RMS_COLOR), QColor(self.CLIP_COLOR)
+        for x, (low, high, level) in enumerate(self._columns(width)):
+            clipped = max(high, -low) >= WAVEFORM_CLIP_LEVEL
+            painter.setPen(clip if clipped else peak)
+            painter.drawLine(x, int(middle - high * scale), x, int(middle - low * scale))
+            painter.setPen(rms)
+            painter.drawLine(x, int(middle - level * scale), x, int(middle + level * scale))
+        painter.end()
+        self.setPixmap(pixmap)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self._render()
+
+    def mouseMoveEvent(self, event):
+        if self.overview and self.overview['min']:
+            count = len(self.overview['min'])
+            index = max(0, min(count - 1, int(event.position().x() * count / max(1, self.width()))))
+            seconds = self.overview['duration'] * (index + 0.5) / count
+            level = max(self.overview['max'][index], -self.overview['min'][index])
+            QToolTip.showText(event.globalPosition().toPoint(),
+                              f"{format_eta(seconds)} — пик {level_db(level):.1f} dBFS, "
+                              f"RMS {level_db(self.overview['rms'][index]):.1f} dBFS", self)
+        super().mouseMoveEvent(event)
+
+
+class CatalogDialog(QDialog):
+    """Медиатека: сканирование папок в каталог и отбор файлов в пакет по кодекам и разрешению."""
+    scanProgress = pyqtSignal(int, int)
+    scanFinished = pyqtSignal(object)
+    VIDEO_CODECS = ("h264", "hevc", "vp9", "av1", "mpeg2video", "mpeg4", "prores")
+    AUDIO_CODECS = ("aac", "ac3", "eac3", "dts", "truehd", "mp3", "opus", "flac")
+    PREVIEW_ROWS = 1000
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        t = getattr(parent, 'translations', None) or {}
+        tr = self.tr_text = lambda text: t.get(text, text)
+        self.setWindowTitle(tr("Медиатека"))
+        self.resize(640, 520)
+        self.catalog = MediaCatalog(CATALOG_FILE)
+        self.records = []
+        self._scan_thread = None
+        self._scan_cancel = threading.Event()
+
+        layout = QVBoxLayout(self)
+        scan_row = QHBoxLayout()
+        self.folder = QLineEdit(CONFIG.get("catalog_dir"))
+        self.folder.setPlaceholderText(tr("Папка с видео"))
+        btn_browse = QPushButton(tr("Обзор..."))
+        btn_browse.clicked.connect(self.select_folder)
+        self.btn_scan = QPushButton(tr("Сканировать"))
+        self.btn_scan.clicked.connect(self.start_scan)
+        scan_row.addWidget(self.folder)
+        scan_row.addWidget(btn_browse)
+        scan_row.addWidget(self.btn_scan)
+        layout.addLayout(scan_row)
+        self.status = QLabel(tr("В каталоге файлов: {count}").format(count=self.catalog.count()))
+        layout.addWidget(self.status)
+
+        query_group = QGroupBox(tr("Отбор"))
+        form = QFormLayout(query_group)
+        self.video_codec = QComboBox()
+        self.audio_codec = QComboBox()
+        for combo, codecs in ((self.video_codec, self.VIDEO_CODECS), (self.audio_codec, self.AUDIO_CODECS)):
+            combo.addItem(tr("Любой"), None)
+            for codec in codecs:
+                combo.addItem(codec, codec)
+        form.addRow(QLabel(tr("Видеокодек:")), self.video_codec)
+        form.addRow(QLabel(tr("Аудиокодек:")), self.audio_codec)
+        self.min_height = QSpinBox()
+        self.min_height.setRange(0, 4320)
+        self.min_height.setSuffix("p")
+        form.addRow(QLabel(tr("Высота кадра от (0 — любая):")), self.min_height)
+        self.extra = QLineEdit()
+        self.extra.setPlaceholderText('duration>600 alang=rus path~"Сериалы"')
+        form.addRow(QLabel(tr("Доп. условия:")), self.extra)
+        btn_find = QPushButton(tr("Найти"))
+        btn_find.clicked.connect(self.run_query)
+        form.addRow(btn_find)
+        layout.addWidget(query_group)
+
+        self.results = QTextEdit()
+        self.results.setReadOnly(True)
+        layout.addWidget(self.results)
+
+        btn_row = QHBoxLayout()
+        self.btn_batch = QPushButton(tr("Создать пакет"))
+        self.btn_batch.clicked.connect(self.accept)
+        self.btn_manifest = QPushButton(tr("Сохранить манифест..."))
+        self.btn_manifest.clicked.connect(self.save_manifest)
+        btn_close = QPushButton(tr("Закрыть"))
+        btn_close.clicked.connect(self.reject)
+        for button in (self.btn_batch, self.btn_manifest):
+            button.setEnabled(False)
+            btn_row.addWidget(button)
+        btn_row.addWidget(btn_close)
+        layout.addLayout(btn_row)
+
+        self.scanProgress.connect(self.on_scan_progress)
+        self.scanFinished.connect(self.on_scan_finished)
+
+    def select_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, self.tr_text("Выберите папку"), self.folder.text())
+        if folder:
+            self.folder.setText(folder)
+
+    def start_scan(self):
+        folder = self.folder.text().strip()
+        if not folder or not os.path.isdir(folder):
+            QMessageBox.warning(self, self.tr_text("Ошибка"), self.tr_text("Выберите папку с видео!"))
+            return
+        if self._scan_thread is not None and self._scan_thread.is_alive():
+            return
+        CONFIG.set("catalog_dir", folder)
+        self.btn_scan.setEnabled(False)
+        self.status.setText(self.tr_text("Поиск изменённых файлов..."))
+        supervisor = get_supervisor()
+        ffprobe_cmd = CONFIG.get("ffprobe_path") or "ffprobe"
+        cancel = self._scan_cancel
+        cancel.clear()
+
+        def _progress(done, total):
+            if not cancel.is_set():
+                self.scanProgress.emit(done, total)
+
+        def _run():
+            # Своё соединение SQLite в этом потоке; сигналы доставляются в поток GUI очередью
+            try:
+                stats = self.catalog.scan(supervisor, ffprobe_cmd, [folder],
+                                          on_progress=_progress, cancelled=cancel.is_set)
+            except Exception as e:
+                stats = e
+            finally:
+                self.catalog.close()
+            if not cancel.is_set():
+                self.scanFinished.emit(stats)
+        self._scan_thread = threading.Thread(target=_run, name="catalog-scan", daemon=True)
+        self._scan_thread.start()
+
+    def done(self, result):
+        """Закрытие диалога любым способом: прерываем сканирование и ждём поток, пока диалог ещё жив."""
+        self._scan_cancel.set()
+        if self._scan_thread is not None:
+            self._scan_thread.join()
+            self._scan_thread = None
+        super().done(result)
+
+    def on_scan_progress(self, done, total):
+        self.status.setText(self.tr_text("Анализ файлов: {done} из {total}").format(done=done, total=total))
+
+    def on_scan_finished(self, stats):
+        self.btn_scan.setEnabled(True)
+        if isinstance(stats, Exception):
+            self.status.setText(self.tr_text("Ошибка сканирования: {error}").format(error=stats))
+            return
+        self.status.setText(self.tr_text("Файлов: {files}, проанализировано: {probed}, удалено: {removed}, "
+                                         "не открылись: {failed}. В каталоге: {count}").format(
+            count=self.catalog.count(), **stats))
+
+    def build_query(self):
+        query = CatalogQuery.parse(self.extra.text())
+        if self.video_codec.currentData():
+            query.where("vcodec", "=", self.video_codec.currentData())
+        if self.audio_codec.currentData():
+            query.where("acodec", "=", self.audio_codec.currentData())
+        if self.min_height.value():
+            query.where("height", ">=", self.min_height.value())
+        return query
+
+    def run_query(self):
+        try:
+            query = self.build_query()
+        except ValueError as e:
+            QMessageBox.warning(self, self.tr_text("Ошибка"), str(e))
+            return
+        self.records = self.catalog.query(query)
+        lines = [f"{record.path}  [{record.video_codec or '—'} {record.width or '?'}x{record.height or '?'}, "
+                 f"{format_eta(record.duration) if record.duration else '—'}]"
+                 for record in self.records[:self.PREVIEW_ROWS]]
+        if len(self.records) > self.PREVIEW_ROWS:
+            lines.append(f"… {len(self.records) - self.PREVIEW_ROWS}")
+        self.results.setPlainText("\n".join(lines))
+        self.status.setText(self.tr_text("Найдено файлов: {count}").format(count=len(self.records)))
+        for button in (self.btn_batch, self.btn_manifest):
+            button.setEnabled(bool(self.records))
+
+    def save_manifest(self):
+        path, _ = QFileDialog.getSaveFileName(self, self.tr_text("Сохранить манифест"), "", "JSON (*.json)")
+        if path:
+            write_batch_manifest(path, self.records)
+
+    def paths(self):
+        return [record.path for record in self.records]
+
+
 class VideoConverter(QMainWindow):
+    # Сколько раз задание пакета запускается, если проверка результата не прошла
+    MAX_RENDER_ATTEMPTS = 2
+    # Индексы вкладок
+    TAB_VIDEO, TAB_AUDIO_SETTINGS, TAB_AUDIO_EXTRACT, TAB_LOGS, TAB_SETTINGS = range(5)
+    # Порядок пакета: исходный текст элемента списка -> политика JobQueue
+    BATCH_POLICIES = {
+        "По порядку добавления": "fifo",
+        "Сначала короткие": "sjf",
+        "Сначала длинные": "ljf",
+        "По сроку готовности": "edf",
+    }
+    # Режим качества: исходный текст элемента списка -> значение rate_control пресета
+    RATE_CONTROLS = {
+        "Битрейт": "bitrate",
+        "Постоянное качество (CRF/CQ)": "crf",
+    }
+    RESOLUTIONS = {
+        "4K": "3840:2160",
+        "1440p": "2560:1440",
+        "1080p": "1920:1080",
+        "720p": "1280:720",
+        "480p": "854:480",
+        "360p": "640:360",
+        "240p": "426:240",
+        "144p": "256:144",
+        "128p": "256:128"
+    }
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Cine Convert")
         self.setGeometry(100, 100, 1000, 700)
+        # Реестр переводимых виджетов: (вид, виджет, ключ, исходный текст), заполняется при создании
+        self._i18n = [('window', self, 'window_title', "Cine Convert")]
         self.settings = {  # <-- Сначала инициализируем настройки!
-            "show_video_notifications": True,
-            "show_audio_notifications": True
+            "show_video_notifications": CONFIG.get("show_video_notifications"),
+            "show_audio_notifications": CONFIG.get("show_audio_notifications"),
+            "scratch_dir": CONFIG.get("scratch_dir"),
+            "scratch_quota_gb": CONFIG.get("scratch_quota_gb"),
+            "prefetch_inputs": CONFIG.get("prefetch_inputs"),
+            "prefetch_depth": CONFIG.get("prefetch_depth"),
+            "prefetch_budget_gb": CONFIG.get("prefetch_budget_gb"),
+            "admission_control": CONFIG.get("admission_control"),
+            "memory_limit": CONFIG.get("memory_limit"),
+            "cluster_enabled": CONFIG.get("cluster_enabled"),
+            "cluster_port": CONFIG.get("cluster_port"),
+            "cluster_token": CONFIG.get("cluster_token"),
+            "api_enabled": CONFIG.get("api_enabled"),
+            "api_port": CONFIG.get("api_port"),
+            "api_socket": CONFIG.get("api_socket"),
+            "api_token": CONFIG.get("api_token"),
+            "verify_integrity": CONFIG.get("verify_integrity"),
+            "verify_tail_decode": CONFIG.get("verify_tail_decode"),
+            "verify_quality": CONFIG.get("verify_quality"),
+            "verify_windows": CONFIG.get("verify_windows"),
+            "verify_ssim_min": CONFIG.get("verify_ssim_min")
         }
         # Локализации
         self.translations = {}
         self.locales_map = {}
+        self.current_locale = None
         self.setup_ui()
         self.setup_styles()
+        PROFILER.mark("построение интерфейса")
         self.input_file = ""
         self.output_file = ""
         self.video_info = {}
         self.input_files = []  # Для пакетной обработки
+        self.batch_queue = None
+        self.batch_progress = None
+        self.batch_probing = 0  # групп файлов пакета, ещё не попавших в очередь (анализ ffprobe, per-title)
+        self.batch_workers = {}  # ключ задания -> (RenderJob, FFmpegWorker)
+        self.batch_checks = set()  # ключи заданий, для которых идёт проверка или публикация результата
+        self.scratch = None
+        self.prefetcher = None
+        self.cluster = None  # CoordinatorServer, если включён распределённый рендеринг
+        self.remote_jobs = {}  # id задания координатора -> RemoteRenderJob
+        self.cluster_timer = QTimer(self)
+        self.cluster_timer.timeout.connect(self.refresh_cluster_status)
+        self.jobs_board = JobBoard()  # состояние заданий пакета для API управления
+        self.control_api = None  # ControlServer, если API включён
+        self._admit_waiting = None  # (задание, причина), о которых уже сообщили в журнале
+        self.batch_manifest = None  # задания из загруженного манифеста пакета
+        self._estimate_token = None
         # Пути к FFmpeg/FFprobe будут установлены из главного блока
         self.ffmpeg_path = "ffmpeg"
         self.ffprobe_path = "ffprobe"
+        self._encoders_cache = {}
+        self.sprite_cache = SpriteCache()
+        self.sprite_pixmap = None
+        self.sprite_source = None
+        self.waveform_cache = WaveformCache()
+        self.waveform_source = None  # файл, для которого показан (или строится) обзор аудио
+        self.waveform_cancel = None  # threading.Event текущего построения
         # Загрузка доступных локалей и применение сохранённой
         try:
             self.load_locales()
-            # Попробуем загрузить выбранный язык из конфига
-            if os.path.exists(CONFIG_FILE):
-                try:
-                    with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                        cfg = json.load(f)
-                        lang = cfg.get('language')
-                        if lang:
-                            self.apply_locale(lang)
-                except Exception:
-                    pass
+            lang = CONFIG.get('language')
+            if lang:
+                self.apply_locale(lang)
         except Exception:
             pass
+        PROFILER.mark("применение локали")
+        # Тени групп не нужны для первой отрисовки — навешиваем их после запуска цикла событий
+        QTimer.singleShot(0, lambda: self._apply_shadows(self))
+        QTimer.singleShot(0, self.cleanup_scratch)
+        QTimer.singleShot(0, self.apply_cluster_settings)
+        QTimer.singleShot(0, self.apply_api_settings)
 
     def setup_ui(self):
         # Центральный виджет и основной слой
@@ -308,32 +1105,46 @@ class VideoConverter(QMainWindow):
         main_layout.setContentsMargins(15, 15, 15, 15)
 
         # Группа исходного видео
-        source_group = QGroupBox("Исходное видео")
+        source_group = self.tr_widget(QGroupBox("Исходное видео"), "group_source")
         source_group.setObjectName("group_source")
         source_layout = QHBoxLayout(source_group)
         self.input_path = QLineEdit()
         self.input_path.setObjectName("input_path")
         self.input_path.setPlaceholderText("Выберите видеофайл...")
-        btn_browse_input = QPushButton("Обзор...")
+        self.tr_widget(self.input_path, "input_path")
+        btn_browse_input = self.tr_widget(QPushButton("Обзор..."), "btn_browse_input")
         btn_browse_input.setObjectName("btn_browse_input")
         btn_browse_input.clicked.connect(self.select_input_file)
         source_layout.addWidget(self.input_path)
         source_layout.addWidget(btn_browse_input)
 
         # Кнопка для выбора нескольких файлов
-        btn_browse_multi = QPushButton("Выбрать несколько видео...")
+        btn_browse_multi = self.tr_widget(QPushButton("Выбрать несколько видео..."), "btn_browse_multi")
         btn_browse_multi.setObjectName("btn_browse_multi")
         btn_browse_multi.clicked.connect(self.select_input_files)
         source_layout.addWidget(btn_browse_multi)
 
+        # Пакет из JSON-манифеста (пути, приоритеты, сроки, пресеты)
+        btn_manifest = self.tr_widget(QPushButton("Загрузить манифест..."), "btn_manifest")
+        btn_manifest.setObjectName("btn_manifest")
+        btn_manifest.clicked.connect(self.select_batch_manifest)
+        source_layout.addWidget(btn_manifest)
+
+        # Пакет из каталога медиатеки по запросу
+        btn_catalog = self.tr_widget(QPushButton("Медиатека..."), "btn_catalog")
+        btn_catalog.setObjectName("btn_catalog")
+        btn_catalog.clicked.connect(self.open_catalog)
+        source_layout.addWidget(btn_catalog)
+
         # Группа выходного файла
-        output_group = QGroupBox("Выходное видео")
+        output_group = self.tr_widget(QGroupBox("Выходное видео"), "group_output")
         output_group.setObjectName("group_output")
         output_layout = QHBoxLayout(output_group)
         self.output_path = QLineEdit()
         self.output_path.setObjectName("output_path")
         self.output_path.setPlaceholderText("Куда сохранить результат...")
-        btn_browse_output = QPushButton("Обзор...")
+        self.tr_widget(self.output_path, "output_path")
+        btn_browse_output = self.tr_widget(QPushButton("Обзор..."), "btn_browse_output")
         btn_browse_output.setObjectName("btn_browse_output")
         btn_browse_output.clicked.connect(self.select_output_file)
         output_layout.addWidget(self.output_path)
@@ -344,7 +1155,7 @@ class VideoConverter(QMainWindow):
         main_layout.addWidget(output_group)
 
         # Группа информации о видео
-        info_group = QGroupBox("Информация о видео")
+        info_group = self.tr_widget(QGroupBox("Информация о видео"), "group_info")
         info_group.setObjectName("group_info")
         info_layout = QVBoxLayout(info_group)
         
@@ -362,14 +1173,21 @@ class VideoConverter(QMainWindow):
         info_layout.addWidget(scroll_area)
         
         # Правая часть: превью
-        preview_group = QGroupBox("Превью")
+        preview_group = self.tr_widget(QGroupBox("Превью"), "group_preview")
         preview_group.setObjectName("group_preview")
         preview_layout = QVBoxLayout(preview_group)
         self.preview_label = QLabel("Превью будет здесь...")
         self.preview_label.setObjectName("preview_label")
+        self.tr_widget(self.preview_label, "preview_label", kind='idle')
         self.preview_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.preview_label.setFixedSize(300, 180)  # Увеличенный размер превью
         preview_layout.addWidget(self.preview_label)
+        # Полоса миниатюр для перемотки наведением
+        self.thumb_strip = ThumbnailStrip()
+        self.thumb_strip.setObjectName("thumb_strip")
+        self.thumb_strip.setFixedSize(300, 34)
+        self.thumb_strip.hovered.connect(self.show_thumbnail)
+        preview_layout.addWidget(self.thumb_strip)
         
         # Расположение информации и превью
         info_preview_layout = QHBoxLayout()
@@ -385,16 +1203,22 @@ class VideoConverter(QMainWindow):
         self.tabs.setTabBarAutoHide(False)
         main_layout.addWidget(self.tabs)
 
-        # Вкладка видео
-        self.setup_video_tab()
-        # Вкладка аудио настроек
-        self.setup_audio_settings_tab()
-        # Вкладка аудио извлечения
-        self.setup_audio_extract_tab()
-        # Вкладка логов
-        self.setup_log_tab()
-        # Вкладка настроек
-        self.setup_settings_tab()
+        # Журнал нужен до построения вкладки логов — в него пишут все операции
+        self.log_text = QTextEdit()
+        self.log_text.setReadOnly(True)
+        self.log_text.setFont(QFont("Consolas", 9))
+        set_error_sink(self.log_text.append)  # ошибки фоновых обработчиков видны и без консоли
+
+        # Вкладки строятся при первом открытии; видимая вкладка видео — сразу
+        self._tab_builders = {}
+        self._add_lazy_tab("Видео", "tab_video", self.setup_video_tab)
+        self._add_lazy_tab("Аудио настройки", "tab_audio_settings", self.setup_audio_settings_tab)
+        self._add_lazy_tab("Аудио извлечение", "tab_audio_extract", self.setup_audio_extract_tab)
+        self._add_lazy_tab("Логи выполнения", "tab_logs", self.setup_log_tab)
+        self._add_lazy_tab("Настройки", "tab_settings", self.setup_settings_tab)
+        self._ensure_tab(self.TAB_VIDEO)
+        self.tabs.currentChanged.connect(self._ensure_tab)
+        self.tabs.currentChanged.connect(self._refresh_audio_overview)
 
         # Прогресс пакетного рендеринга
         self.batch_status_label = QLabel("")
@@ -412,163 +1236,476 @@ class VideoConverter(QMainWindow):
         self.progress_bar.setMaximumHeight(20)
         self.centralWidget().layout().addWidget(self.progress_bar)
 
-    def setup_video_tab(self):
-        tab = QWidget()
+    def _add_lazy_tab(self, title, key, builder):
+        page = QWidget()
+        index = self.tabs.addTab(page, title)
+        self._tab_builders[index] = (builder, page)
+        self._i18n.append(('tab', index, key, title))
+
+    def _ensure_tab(self, index):
+        """Строит содержимое вкладки при первом обращении (открытие или чтение её виджетов)."""
+        entry = self._tab_builders.pop(index, None)
+        if entry is None:
+            return
+        builder, page = entry
+        builder(page)
+        if hasattr(self, 'progress_bar'):  # окно уже построено — досоздаём эффекты
+            self._apply_shadows(page)
+
+    def _apply_shadows(self, root):
+        """Добавление теней к группам внутри root."""
+        for group in root.findChildren(QGroupBox):
+            if group.graphicsEffect() is not None:
+                continue
+            shadow = QGraphicsDropShadowEffect()
+            shadow.setBlurRadius(8)
+            shadow.setXOffset(0)
+            shadow.setYOffset(2)
+            shadow.setColor(QColor(0, 0, 0, 20))
+            group.setGraphicsEffect(shadow)
+
+    def setup_video_tab(self, tab):
         layout = QGridLayout(tab)
         layout.setSpacing(10)
         layout.setContentsMargins(10, 10, 10, 10)
 
         # Настройки кодирования
-        settings_group = QGroupBox("Настройки кодирования видео")
+        settings_group = self.tr_widget(QGroupBox("Настройки кодирования видео"), "group_video_settings")
         grid = QGridLayout(settings_group)
         
         # Разрешение
-        grid.addWidget(QLabel("Разрешение:"), 0, 0)
+        grid.addWidget(self.tr_widget(QLabel("Разрешение:"), "resolution"), 0, 0)
         self.resolution = QComboBox()
         self.resolution.addItems(["Без изменений", "4K (3840x2160)", "1440p (2560x1440)", "1080p (1920x1080)", 
                                  "720p (1280x720)", "480p (854x480)", "360p (640x360)", 
                                  "240p (426x240)", "144p (256x144)", "128p (256x128)"])
+        self.tr_widget(self.resolution)
         grid.addWidget(self.resolution, 0, 1)
         
         # Кодек
-        grid.addWidget(QLabel("Кодек:"), 1, 0)
+        grid.addWidget(self.tr_widget(QLabel("Кодек:"), "video_codec"), 1, 0)
         self.video_codec = QComboBox()
         self.video_codec.addItems(["Без изменений", "libx264", "libx265", "h264_nvenc", "hevc_nvenc", "vp9", "av1"])
+        self.tr_widget(self.video_codec)
         grid.addWidget(self.video_codec, 1, 1)
         
         # Формат
-        grid.addWidget(QLabel("Формат:"), 2, 0)
+        grid.addWidget(self.tr_widget(QLabel("Формат:"), "format"), 2, 0)
         self.format = QComboBox()
         self.format.addItems(["mp4", "mkv", "mov", "avi", "flv", "webm"])
+        self.tr_widget(self.format)
         grid.addWidget(self.format, 2, 1)
         
         # Битрейт
-        grid.addWidget(QLabel("Битрейт:"), 3, 0)
+        grid.addWidget(self.tr_widget(QLabel("Битрейт:"), "bitrate"), 3, 0)
         self.bitrate = QComboBox()
         self.bitrate.setEditable(True)
         self.bitrate.addItems(["Без изменений", "500k", "1M", "2M", "5M", "10M", "20M"])
+        self.tr_widget(self.bitrate)
         grid.addWidget(self.bitrate, 3, 1)
 
+        # Порядок и параллельность пакетной обработки
+        grid.addWidget(self.tr_widget(QLabel("Порядок пакета:"), "batch_policy"), 4, 0)
+        self.batch_policy = QComboBox()
+        self.batch_policy.addItems(list(self.BATCH_POLICIES))
+        self.tr_widget(self.batch_policy)
+        policies = list(self.BATCH_POLICIES.values())
+        saved_policy = CONFIG.get("batch_policy")
+        self.batch_policy.setCurrentIndex(policies.index(saved_policy) if saved_policy in policies else 0)
+        self.batch_policy.currentIndexChanged.connect(
+            lambda _: CONFIG.set("batch_policy", self.BATCH_POLICIES[self.combo_value(self.batch_policy)]))
+        grid.addWidget(self.batch_policy, 4, 1)
+
+        grid.addWidget(self.tr_widget(QLabel("Одновременно файлов:"), "batch_parallel"), 5, 0)
+        self.batch_parallel = QSpinBox()
+        self.batch_parallel.setRange(1, max(1, os.cpu_count() or 1))
+        self.batch_parallel.setValue(CONFIG.get("batch_parallel"))
+        self.batch_parallel.valueChanged.connect(lambda value: CONFIG.set("batch_parallel", value))
+        grid.addWidget(self.batch_parallel, 5, 1)
+
+        # Пресет кодировщика: скорость, режим качества, tune и сохранённые наборы
+        encoder_group = self.tr_widget(QGroupBox("Пресет кодировщика"), "group_encoder")
+        encoder_group.setObjectName("group_encoder")
+        encoder_grid = QGridLayout(encoder_group)
+        encoder_grid.addWidget(self.tr_widget(QLabel("Пресет:"), "encoder_preset"), 0, 0)
+        self.encoder_presets = QComboBox()
+        self.encoder_presets.currentIndexChanged.connect(self.on_encoder_preset_selected)
+        encoder_grid.addWidget(self.encoder_presets, 0, 1)
+        btn_save_preset = self.tr_widget(QPushButton("Сохранить как..."), "btn_save_preset")
+        btn_save_preset.clicked.connect(self.save_encoder_preset)
+        encoder_grid.addWidget(btn_save_preset, 0, 2)
+        btn_delete_preset = self.tr_widget(QPushButton("Удалить"), "btn_delete_preset")
+        btn_delete_preset.clicked.connect(self.delete_encoder_preset)
+        encoder_grid.addWidget(btn_delete_preset, 0, 3)
+
+        encoder_grid.addWidget(self.tr_widget(QLabel("Скорость:"), "encoder_speed"), 1, 0)
+        self.encoder_speed = QComboBox()
+        self.encoder_speed.addItems(list(ENCODER_SPEEDS))
+        encoder_grid.addWidget(self.encoder_speed, 1, 1, 1, 3)
+
+        encoder_grid.addWidget(self.tr_widget(QLabel("Режим качества:"), "encoder_rate"), 2, 0)
+        self.encoder_rate = QComboBox()
+        self.encoder_rate.addItems(list(self.RATE_CONTROLS))
+        self.tr_widget(self.encoder_rate)
+        encoder_grid.addWidget(self.encoder_rate, 2, 1, 1, 3)
+
+        encoder_grid.addWidget(self.tr_widget(QLabel("CRF/CQ:"), "encoder_quality"), 3, 0)
+        self.encoder_quality = QSpinBox()
+        self.encoder_quality.setRange(0, 63)
+        encoder_grid.addWidget(self.encoder_quality, 3, 1, 1, 3)
+
+        encoder_grid.addWidget(self.tr_widget(QLabel("Tune:"), "encoder_tune"), 4, 0)
+        self.encoder_tune = QComboBox()
+        tunes = []
+        for options in ENCODER_TUNES.values():
+            tunes.extend(t for t in options if t not in tunes)
+        self.encoder_tune.addItems(["Нет"] + tunes)
+        self.tr_widget(self.encoder_tune)
+        encoder_grid.addWidget(self.encoder_tune, 4, 1, 1, 3)
+
+        self.encoder_per_title = self.tr_widget(
+            QCheckBox("Подбирать битрейт для каждого файла (цель — CRF/CQ)"), "encoder_per_title")
+        encoder_grid.addWidget(self.encoder_per_title, 5, 0, 1, 4)
+
+        try:
+            self.set_encoder_widgets(CONFIG.get("encoder"))
+        except ValueError:
+            self.set_encoder_widgets(DEFAULT_ENCODER)
+        self.refresh_encoder_presets()
+        for signal in (self.encoder_speed.currentIndexChanged, self.encoder_rate.currentIndexChanged,
+                       self.encoder_quality.valueChanged, self.encoder_tune.currentIndexChanged,
+                       self.encoder_per_title.toggled):
+            signal.connect(lambda _: CONFIG.set("encoder", self.current_encoder()))
+
         # Кнопка рендеринга
-        self.btn_render = QPushButton("Начать рендеринг видео")
+        self.btn_render = self.tr_widget(QPushButton("Начать рендеринг видео"), "btn_render")
         self.btn_render.clicked.connect(self.start_video_render)
         self.btn_render.setMinimumHeight(35)
 
+        # Обрезка по точкам входа/выхода
+        trim_group = self.tr_widget(QGroupBox("Обрезка"), "group_trim")
+        trim_group.setObjectName("group_trim")
+        trim_layout = QHBoxLayout(trim_group)
+        self.trim_start = QLineEdit()
+        self.trim_start.setObjectName("trim_start")
+        self.trim_start.setPlaceholderText("Начало (00:00:00)")
+        self.tr_widget(self.trim_start, "trim_start")
+        self.trim_end = QLineEdit()
+        self.trim_end.setObjectName("trim_end")
+        self.trim_end.setPlaceholderText("Конец (00:00:10)")
+        self.tr_widget(self.trim_end, "trim_end")
+        self.btn_trim = self.tr_widget(QPushButton("Обрезать без перекодирования"), "btn_trim")
+        self.btn_trim.setObjectName("btn_trim")
+        self.btn_trim.clicked.connect(self.start_smart_trim)
+        trim_layout.addWidget(self.trim_start)
+        trim_layout.addWidget(self.trim_end)
+        trim_layout.addWidget(self.btn_trim)
+
         # Добавление элементов на вкладку
         layout.addWidget(settings_group, 0, 0, 1, 2)
-        layout.addWidget(self.btn_render, 1, 0, 1, 2)
-        
-        self.tabs.addTab(tab, "Видео")
+        layout.addWidget(encoder_group, 1, 0, 1, 2)
+        layout.addWidget(trim_group, 2, 0, 1, 2)
+        layout.addWidget(self.btn_render, 3, 0, 1, 2)
+
+        # Оценка времени и размера пакета до запуска
+        self.btn_estimate = self.tr_widget(QPushButton("Оценить время и размер"), "btn_estimate")
+        self.btn_estimate.setObjectName("btn_estimate")
+        self.btn_estimate.clicked.connect(self.estimate_batch)
+        self.estimate_label = QLabel("")
+        self.estimate_label.setObjectName("estimate_label")
+        self.estimate_label.setWordWrap(True)
+        layout.addWidget(self.btn_estimate, 4, 0)
+        layout.addWidget(self.estimate_label, 4, 1)
+
+    def current_encoder(self):
+        """Параметры кодировщика из виджетов вкладки «Видео»."""
+        tune = self.combo_value(self.encoder_tune)
+        return {
+            "speed": self.encoder_speed.currentText(),
+            "rate_control": self.RATE_CONTROLS.get(self.combo_value(self.encoder_rate), "bitrate"),
+            "quality": self.encoder_quality.value(),
+            "tune": "" if tune == "Нет" else tune,
+            "per_title": self.encoder_per_title.isChecked(),
+        }
 
-    def setup_audio_settings_tab(self):
+    def set_encoder_widgets(self, preset):
+        preset = normalize_encoder(preset)
+        self.encoder_speed.setCurrentIndex(ENCODER_SPEEDS.index(preset["speed"]))
+        self.encoder_rate.setCurrentIndex(list(self.RATE_CONTROLS.values()).index(preset["rate_control"]))
+        self.encoder_quality.setValue(preset["quality"])
+        self.encoder_tune.setCurrentIndex(max(0, self.encoder_tune.findData(preset["tune"] or "Нет")))
+        self.encoder_per_title.setChecked(preset["per_title"])
+
+    def refresh_encoder_presets(self, select=None):
+        """Перезаполняет список сохранённых пресетов (первый элемент — «без пресета»)."""
+        self.encoder_presets.blockSignals(True)
+        self.encoder_presets.clear()
+        self.encoder_presets.addItem("—")
+        names = sorted(CONFIG.get("encoder_presets"))
+        self.encoder_presets.addItems(names)
+        if select in names:
+            self.encoder_presets.setCurrentIndex(names.index(select) + 1)
+        self.encoder_presets.blockSignals(False)
+
+    def on_encoder_preset_selected(self, index):
+        if index <= 0:
+            return
+        preset = CONFIG.get("encoder_presets").get(self.encoder_presets.currentText())
+        try:
+            self.set_encoder_widgets(preset)
+        except ValueError as e:
+            QMessageBox.warning(self, "Ошибка", f"Пресет повреждён: {e}")
+
+    def save_encoder_preset(self):
+        name, ok = QInputDialog.getText(self, "Сохранить пресет", "Название пресета:",
+                                        text=self.encoder_presets.currentText() if self.encoder_presets.currentIndex() > 0 else "")
+        name = name.strip() if ok else ""
+        if not name:
+            return
+        presets = CONFIG.get("encoder_presets")
+        presets[name] = self.current_encoder()
+        CONFIG.set("encoder_presets", presets)
+        self.refresh_encoder_presets(select=name)
+        self.log_text.append(f"Пресет кодировщика «{name}» сохранён.")
+
+    def delete_encoder_preset(self):
+        if self.encoder_presets.currentIndex() <= 0:
+            return
+        name = self.encoder_presets.currentText()
+        presets = CONFIG.get("encoder_presets")
+        presets.pop(name, None)
+        CONFIG.set("encoder_presets", presets)
+        self.refresh_encoder_presets()
+
+    def setup_audio_settings_tab(self, tab):
         """Вкладка для настроек аудио при конвертации видео"""
-        tab = QWidget()
         layout = QGridLayout(tab)
         layout.setSpacing(10)
         layout.setContentsMargins(10, 10, 10, 10)
 
         # Настройки аудио
-        settings_group = QGroupBox("Настройки аудио для видео")
+        settings_group = self.tr_widget(QGroupBox("Настройки аудио для видео"), "group_audio_settings")
         grid = QGridLayout(settings_group)
         
         # Аудио кодек
-        grid.addWidget(QLabel("Аудио кодек:"), 0, 0)
+        grid.addWidget(self.tr_widget(QLabel("Аудио кодек:"), "audio_codec"), 0, 0)
         self.audio_codec = QComboBox()
         self.audio_codec.addItems(["Без изменений", "aac", "mp3", "flac", "opus", "ac3"])
+        self.tr_widget(self.audio_codec)
         grid.addWidget(self.audio_codec, 0, 1)
         
         # Битрейт аудио
-        grid.addWidget(QLabel("Битрейт аудио:"), 1, 0)
+        grid.addWidget(self.tr_widget(QLabel("Битрейт аудио:"), "audio_bitrate"), 1, 0)
         self.audio_bitrate = QComboBox()
         self.audio_bitrate.setEditable(True)
         self.audio_bitrate.addItems(["Без изменений", "64k", "128k", "192k", "256k", "320k"])
+        self.tr_widget(self.audio_bitrate)
         grid.addWidget(self.audio_bitrate, 1, 1)
         
         # Каналы
-        grid.addWidget(QLabel("Каналы:"), 2, 0)
+        grid.addWidget(self.tr_widget(QLabel("Каналы:"), "audio_channels"), 2, 0)
         self.audio_channels = QComboBox()
         self.audio_channels.addItems(["Без изменений", "1 (моно)", "2 (стерео)", "5.1", "7.1"])
+        self.tr_widget(self.audio_channels)
         grid.addWidget(self.audio_channels, 2, 1)
         
         layout.addWidget(settings_group)
-        self.tabs.addTab(tab, "Аудио настройки")
 
-    def setup_audio_extract_tab(self):
+    def setup_audio_extract_tab(self, tab):
         """Вкладка для извлечения аудио"""
-        tab = QWidget()
         layout = QVBoxLayout(tab)
         layout.setSpacing(10)
         layout.setContentsMargins(10, 10, 10, 10)
         
         # Группа формата аудио
-        audio_group = QGroupBox("Настройки извлечения аудио")
+        audio_group = self.tr_widget(QGroupBox("Настройки извлечения аудио"), "group_audio_extract")
         vbox = QVBoxLayout(audio_group)
         
         hbox = QHBoxLayout()
-        hbox.addWidget(QLabel("Формат аудио:"))
+        hbox.addWidget(self.tr_widget(QLabel("Формат аудио:"), "audio_format"))
         self.audio_format = QComboBox()
         self.audio_format.addItems(["mp3", "aac", "flac", "wav", "ogg", "ac3"])
+        self.tr_widget(self.audio_format)
         hbox.addWidget(self.audio_format)
         hbox.addStretch()
         vbox.addLayout(hbox)
         
         # Кнопка извлечения аудио
-        self.btn_extract = QPushButton("Извлечь аудио")
+        self.btn_extract = self.tr_widget(QPushButton("Извлечь аудио"), "btn_extract")
         self.btn_extract.clicked.connect(self.extract_audio)
         self.btn_extract.setMinimumHeight(35)
         vbox.addWidget(self.btn_extract)
         
         layout.addWidget(audio_group)
+
+        # Обзор звука: где он есть, не клиппует ли и насколько громкий — до извлечения
+        overview_group = self.tr_widget(QGroupBox("Обзор аудио"), "group_audio_overview")
+        overview_layout = QVBoxLayout(overview_group)
+        self.waveform_view = WaveformView()
+        self.waveform_view.setObjectName("waveform_view")
+        self.waveform_view.setFixedHeight(120)
+        overview_layout.addWidget(self.waveform_view)
+        self.waveform_stats = QLabel("")
+        self.waveform_stats.setObjectName("waveform_stats")
+        self.waveform_stats.setWordWrap(True)
+        overview_layout.addWidget(self.waveform_stats)
+        layout.addWidget(overview_group)
         layout.addStretch(1)
-        self.tabs.addTab(tab, "Аудио извлечение")
 
-    def setup_log_tab(self):
-        tab = QWidget()
+    def setup_log_tab(self, tab):
         layout = QVBoxLayout(tab)
         layout.setContentsMargins(10, 10, 10, 10)
-        
-        self.log_text = QTextEdit()
-        self.log_text.setReadOnly(True)
-        self.log_text.setFont(QFont("Consolas", 9))
-        
         layout.addWidget(self.log_text)
-        self.tabs.addTab(tab, "Логи выполнения")
 
-    def setup_settings_tab(self):
+    def setup_settings_tab(self, tab):
         """Вкладка для настроек программы"""
-        tab = QWidget()
         layout = QVBoxLayout(tab)
         layout.setSpacing(15)
         layout.setContentsMargins(15, 15, 15, 15)
         
         # Группа настроек уведомлений
-        notification_group = QGroupBox("Настройки уведомлений")
+        notification_group = self.tr_widget(QGroupBox("Настройки уведомлений"), "group_notifications")
         form_layout = QFormLayout(notification_group)
         
-        self.chk_video_notify = QCheckBox("Показывать уведомления после рендеринга видео")
+        self.chk_video_notify = self.tr_widget(QCheckBox("Показывать уведомления после рендеринга видео"), "chk_video_notify")
         self.chk_video_notify.setChecked(self.settings["show_video_notifications"])
         form_layout.addRow(self.chk_video_notify)
         
-        self.chk_audio_notify = QCheckBox("Показывать уведомления после извлечения аудио")
+        self.chk_audio_notify = self.tr_widget(QCheckBox("Показывать уведомления после извлечения аудио"), "chk_audio_notify")
         self.chk_audio_notify.setChecked(self.settings["show_audio_notifications"])
         form_layout.addRow(self.chk_audio_notify)
         
+        # Проверка результата после рендеринга
+        verify_group = self.tr_widget(QGroupBox("Проверка результата"), "group_verify")
+        verify_layout = QFormLayout(verify_group)
+        self.chk_verify_integrity = self.tr_widget(
+            QCheckBox("Проверять целостность файла (длительность, потоки, пакеты)"), "chk_verify_integrity")
+        self.chk_verify_integrity.setChecked(self.settings["verify_integrity"])
+        verify_layout.addRow(self.chk_verify_integrity)
+        self.chk_verify_tail = self.tr_widget(
+            QCheckBox("Декодировать последние секунды файла"), "chk_verify_tail")
+        self.chk_verify_tail.setChecked(self.settings["verify_tail_decode"])
+        verify_layout.addRow(self.chk_verify_tail)
+        self.chk_verify_quality = self.tr_widget(
+            QCheckBox("Проверять качество (SSIM/PSNR) по выборке фрагментов"), "chk_verify_quality")
+        self.chk_verify_quality.setChecked(self.settings["verify_quality"])
+        verify_layout.addRow(self.chk_verify_quality)
+        self.verify_windows = QSpinBox()
+        self.verify_windows.setRange(1, 20)
+        self.verify_windows.setValue(self.settings["verify_windows"])
+        verify_layout.addRow(self.tr_widget(QLabel("Фрагментов по 2 с:"), "verify_windows"), self.verify_windows)
+        self.verify_ssim_min = QDoubleSpinBox()
+        self.verify_ssim_min.setRange(0.5, 1.0)
+        self.verify_ssim_min.setDecimals(3)
+        self.verify_ssim_min.setSingleStep(0.005)
+        self.verify_ssim_min.setValue(self.settings["verify_ssim_min"])
+        verify_layout.addRow(self.tr_widget(QLabel("Минимальный SSIM:"), "verify_ssim_min"), self.verify_ssim_min)
+
+        # Временная папка для незавершённых результатов
+        scratch_group = self.tr_widget(QGroupBox("Временная папка для рендеринга"), "group_scratch")
+        scratch_layout = QFormLayout(scratch_group)
+        scratch_row = QHBoxLayout()
+        self.scratch_dir = QLineEdit(self.settings["scratch_dir"])
+        self.scratch_dir.setPlaceholderText("Не задана — запись сразу в папку назначения")
+        self.tr_widget(self.scratch_dir, "scratch_dir")
+        btn_scratch = self.tr_widget(QPushButton("Обзор..."), "btn_browse_scratch")
+        btn_scratch.clicked.connect(self.select_scratch_dir)
+        scratch_row.addWidget(self.scratch_dir)
+        scratch_row.addWidget(btn_scratch)
+        scratch_layout.addRow(scratch_row)
+        self.scratch_quota = QDoubleSpinBox()
+        self.scratch_quota.setRange(0, 100000)
+        self.scratch_quota.setDecimals(1)
+        self.scratch_quota.setValue(self.settings["scratch_quota_gb"])
+        scratch_layout.addRow(self.tr_widget(QLabel("Квота, ГБ (0 — без ограничения):"), "scratch_quota"), self.scratch_quota)
+        self.chk_prefetch = self.tr_widget(QCheckBox("Заранее копировать исходники в локальную папку (для сетевых дисков)"),
+                                           "chk_prefetch")
+        self.chk_prefetch.setChecked(self.settings["prefetch_inputs"])
+        scratch_layout.addRow(self.chk_prefetch)
+        self.prefetch_depth = QSpinBox()
+        self.prefetch_depth.setRange(1, 16)
+        self.prefetch_depth.setValue(self.settings["prefetch_depth"])
+        scratch_layout.addRow(self.tr_widget(QLabel("Копировать заданий вперёд:"), "prefetch_depth"), self.prefetch_depth)
+        self.prefetch_budget = QDoubleSpinBox()
+        self.prefetch_budget.setRange(0, 100000)
+        self.prefetch_budget.setDecimals(1)
+        self.prefetch_budget.setValue(self.settings["prefetch_budget_gb"])
+        scratch_layout.addRow(self.tr_widget(QLabel("Место под копии, ГБ (0 — без ограничения):"), "prefetch_budget"),
+                              self.prefetch_budget)
+
+        # Допуск заданий пакета по ресурсам
+        resources_group = self.tr_widget(QGroupBox("Ресурсы системы"), "group_resources")
+        resources_layout = QFormLayout(resources_group)
+        self.chk_admission = self.tr_widget(
+            QCheckBox("Запускать задания, только если хватает места на диске и памяти"), "chk_admission")
+        self.chk_admission.setChecked(self.settings["admission_control"])
+        resources_layout.addRow(self.chk_admission)
+        self.chk_memory_limit = self.tr_widget(
+            QCheckBox("Ограничивать память каждого процесса FFmpeg (cgroup v2 / RLIMIT_AS)"), "chk_memory_limit")
+        self.chk_memory_limit.setChecked(self.settings["memory_limit"])
+        resources_layout.addRow(self.chk_memory_limit)
+
+        # Распределённый рендеринг на узлах с общим хранилищем
+        cluster_group = self.tr_widget(QGroupBox("Распределённый рендеринг"), "group_cluster")
+        cluster_layout = QFormLayout(cluster_group)
+        self.chk_cluster = self.tr_widget(
+            QCheckBox("Раздавать задания пакета узлам (CineConvert.py --worker http://этот-компьютер:порт)"),
+            "chk_cluster")
+        self.chk_cluster.setChecked(self.settings["cluster_enabled"])
+        cluster_layout.addRow(self.chk_cluster)
+        self.cluster_port = QSpinBox()
+        self.cluster_port.setRange(1024, 65535)
+        self.cluster_port.setValue(self.settings["cluster_port"])
+        cluster_layout.addRow(self.tr_widget(QLabel("Порт:"), "cluster_port"), self.cluster_port)
+        self.cluster_token = QLineEdit(self.settings["cluster_token"])
+        self.cluster_token.setPlaceholderText("Не задан — будет создан при включении")
+        self.tr_widget(self.cluster_token, "cluster_token")
+        cluster_layout.addRow(self.tr_widget(QLabel("Токен:"), "cluster_token_label"), self.cluster_token)
+        self.cluster_status = QLabel("")
+        cluster_layout.addRow(self.cluster_status)
+        self.refresh_cluster_status()
+
+        # Локальный API для систем автоматизации
+        api_group = self.tr_widget(QGroupBox("API управления заданиями"), "group_api")
+        api_layout = QFormLayout(api_group)
+        self.chk_api = self.tr_widget(
+            QCheckBox("Принимать задания по HTTP (JSON) только с этого компьютера"), "chk_api")
+        self.chk_api.setChecked(self.settings["api_enabled"])
+        api_layout.addRow(self.chk_api)
+        self.api_port = QSpinBox()
+        self.api_port.setRange(1024, 65535)
+        self.api_port.setValue(self.settings["api_port"])
+        api_layout.addRow(self.tr_widget(QLabel("Порт:"), "api_port"), self.api_port)
+        self.api_socket = QLineEdit(self.settings["api_socket"])
+        self.api_socket.setPlaceholderText("Путь к Unix-сокету вместо порта (необязательно)")
+        self.tr_widget(self.api_socket, "api_socket")
+        api_layout.addRow(self.tr_widget(QLabel("Сокет:"), "api_socket_label"), self.api_socket)
+        self.api_token = QLineEdit(self.settings["api_token"])
+        self.api_token.setPlaceholderText("Не задан — будет создан при включении")
+        self.tr_widget(self.api_token, "api_token")
+        api_layout.addRow(self.tr_widget(QLabel("Токен:"), "api_token_label"), self.api_token)
+
         # Кнопка сохранения настроек
-        btn_save = QPushButton("Сохранить настройки")
+        btn_save = self.tr_widget(QPushButton("Сохранить настройки"), "btn_save_settings")
         btn_save.clicked.connect(self.save_settings)
         btn_save.setMinimumHeight(35)
         
         layout.addWidget(notification_group)
+        layout.addWidget(verify_group)
+        layout.addWidget(scratch_group)
+        layout.addWidget(resources_group)
+        layout.addWidget(cluster_group)
+        layout.addWidget(api_group)
         # Группа выбора языка
-        language_group = QGroupBox("Язык интерфейса")
+        language_group = self.tr_widget(QGroupBox("Язык интерфейса"), "language_group")
         lang_layout = QHBoxLayout(language_group)
         self.locale_combo = QComboBox()
         self.locale_combo.setEditable(False)
-        btn_apply_locale = QPushButton("Применить")
+        btn_apply_locale = self.tr_widget(QPushButton("Применить"), "btn_apply_locale")
         btn_apply_locale.clicked.connect(self.on_apply_locale)
-        btn_refresh_locales = QPushButton("Обновить список")
+        btn_refresh_locales = self.tr_widget(QPushButton("Обновить список"), "btn_refresh_locales")
         btn_refresh_locales.clicked.connect(self.load_locales)
-        btn_open_locales = QPushButton("Открыть папку локалей")
+        btn_open_locales = self.tr_widget(QPushButton("Открыть папку локалей"), "btn_open_locales")
         btn_open_locales.clicked.connect(self.open_locales_folder)
         lang_layout.addWidget(self.locale_combo)
         lang_layout.addWidget(btn_apply_locale)
@@ -577,35 +1714,215 @@ class VideoConverter(QMainWindow):
         layout.addWidget(language_group)
         layout.addWidget(btn_save)
         layout.addStretch(1)
-        
-        self.tabs.addTab(tab, "Настройки")
+        # Имена локалей читаются только сейчас, когда список впервые понадобился
+        self.fill_locale_combo()
 
     def save_settings(self):
         """Сохраняет настройки программы"""
         self.settings["show_video_notifications"] = self.chk_video_notify.isChecked()
         self.settings["show_audio_notifications"] = self.chk_audio_notify.isChecked()
+        self.settings["scratch_dir"] = self.scratch_dir.text().strip()
+        self.settings["scratch_quota_gb"] = round(self.scratch_quota.value(), 1)
+        self.settings["prefetch_inputs"] = self.chk_prefetch.isChecked()
+        self.settings["prefetch_depth"] = self.prefetch_depth.value()
+        self.settings["prefetch_budget_gb"] = round(self.prefetch_budget.value(), 1)
+        self.settings["admission_control"] = self.chk_admission.isChecked()
+        self.settings["memory_limit"] = self.chk_memory_limit.isChecked()
+        self.settings["cluster_enabled"] = self.chk_cluster.isChecked()
+        self.settings["cluster_port"] = self.cluster_port.value()
+        self.settings["cluster_token"] = self.cluster_token.text().strip()
+        self.settings["api_enabled"] = self.chk_api.isChecked()
+        self.settings["api_port"] = self.api_port.value()
+        self.settings["api_socket"] = self.api_socket.text().strip()
+        self.settings["api_token"] = self.api_token.text().strip()
+        self.settings["verify_integrity"] = self.chk_verify_integrity.isChecked()
+        self.settings["verify_tail_decode"] = self.chk_verify_tail.isChecked()
+        self.settings["verify_quality"] = self.chk_verify_quality.isChecked()
+        self.settings["verify_windows"] = self.verify_windows.value()
+        self.settings["verify_ssim_min"] = round(self.verify_ssim_min.value(), 3)
         QMessageBox.information(self, "Сохранено", "Настройки успешно сохранены!")
         # Сохраняем текущие настройки в config
-        try:
-            cfg = {}
-            if os.path.exists(CONFIG_FILE):
-                try:
-                    with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                        cfg = json.load(f)
-                except Exception:
-                    cfg = {}
-            cfg['show_video_notifications'] = self.chk_video_notify.isChecked()
-            cfg['show_audio_notifications'] = self.chk_audio_notify.isChecked()
-            # сохраняем также выбранный язык
-            if hasattr(self, 'locale_combo') and self.locale_combo.currentData():
-                cfg['language'] = self.locale_combo.currentData()
-            with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-                json.dump(cfg, f, ensure_ascii=False, indent=4)
-        except Exception:
-            pass
+        values = dict(self.settings)
+        # сохраняем также выбранный язык
+        if hasattr(self, 'locale_combo') and self.locale_combo.currentData():
+            values['language'] = self.locale_combo.currentData()
+        CONFIG.update(values)
+        self.apply_cluster_settings()
+        self.apply_api_settings()
+
+    def select_scratch_dir(self):
+        directory = QFileDialog.getExistingDirectory(self, "Выберите временную папку", self.scratch_dir.text())
+        if directory:
+            self.scratch_dir.setText(directory)
+
+    def cleanup_scratch(self):
+        """Удаляет недописанные результаты и копии исходников, оставшиеся от прошлых запусков."""
+        removed = freed = 0
+        for directory in {self.settings["scratch_dir"] or None, self._prefetch_dir()} - {None}:
+            count, size = ScratchSpace(directory).cleanup_orphans()
+            removed += count
+            freed += size
+        if removed:
+            self.log_text.append(f"Временная папка: удалено брошенных файлов — {removed} ({format_size(freed)})")
+
+    def _ensure_token(self, key, title):
+        """Токен сервера из настроек; пустой заменяется случайным и сохраняется (в поле ввода — тоже)."""
+        if not self.settings[key]:
+            self.settings[key] = secrets.token_urlsafe(24)
+            CONFIG.set(key, self.settings[key])
+            field = getattr(self, key, None)  # поле ввода есть, только если вкладка настроек построена
+            if field is not None:
+                field.setText(self.settings[key])
+            self.log_text.append(f"{title}: {self.settings[key]} (создан автоматически и сохранён в настройках)")
+        return self.settings[key]
+
+    def apply_cluster_settings(self):
+        """Запускает, перезапускает или останавливает координатор по текущим настройкам."""
+        if self.settings["cluster_enabled"]:
+            self._ensure_token("cluster_token", "Токен координатора для узлов (--worker-token)")
+        wanted = (self.settings["cluster_port"], self.settings["cluster_token"]) if self.settings["cluster_enabled"] else None
+        current = (self.cluster.port, self.cluster.token) if self.cluster is not None else None
+        if wanted == current:
+            return
+        if self.cluster is not None:
+            self.cluster.stop()  # незавершённые удалённые задания вернутся в очередь пакета
+            self.cluster = None
+            self.cluster_timer.stop()
+        if wanted:
+            supervisor = get_supervisor()
+            coordinator = RenderCoordinator(lambda job_id, kind, data: supervisor.post(self._on_cluster_event, job_id, kind, data))
+            server = CoordinatorServer(coordinator, port=wanted[0], token=wanted[1])
+            try:
+                server.start()
+            except OSError as e:
+                self.log_text.append(f"⚠️ Не удалось запустить координатор на порту {wanted[0]}: {e}")
+            else:
+                self.cluster = server
+                self.cluster_timer.start(2000)
+                self.log_text.append(f"Координатор распределённого рендеринга слушает порт {server.port}")
+        self.refresh_cluster_status()
+
+    def refresh_cluster_status(self):
+        if not hasattr(self, 'cluster_status'):
+            return  # вкладка настроек ещё не построена
+        if self.cluster is None:
+            self.cluster_status.setText("")
+            return
+        status = self.cluster.coordinator.status()
+        nodes = [f"{name} ({len(info['running'])}/{info['slots']})" for name, info in sorted(status["workers"].items())]
+        self.cluster_status.setText("Узлы: " + (", ".join(nodes) if nodes else "нет") + f" · в очереди: {status['pending']}")
+
+    def apply_api_settings(self):
+        """Запускает, перезапускает или останавливает API управления по текущим настройкам."""
+        if self.settings["api_enabled"]:
+            self._ensure_token("api_token", "Токен API управления (заголовок X-CineConvert-Token)")
+        keys = ("api_port", "api_socket", "api_token")
+        wanted = tuple(self.settings[k] for k in keys) if self.settings["api_enabled"] else None
+        current = ((self.control_api.port, self.control_api.socket_path, self.control_api.token)
+                   if self.control_api is not None else None)
+        if wanted == current:
+            return
+        if self.control_api is not None:
+            self.control_api.stop()
+            self.control_api = None
+        if wanted:
+            supervisor = get_supervisor()
+            server = ControlServer(
+                self.jobs_board,
+                submit=lambda entries: supervisor.post(self.enqueue_jobs, entries),
+                cancel=lambda job_id: supervisor.post(self.cancel_job, job_id),
+                presets=lambda: CONFIG.get("encoder_presets"),
+                port=wanted[0], socket_path=wanted[1], token=wanted[2])
+            try:
+                server.start()
+            except OSError as e:
+                self.log_text.append(f"⚠️ Не удалось запустить API управления ({server.address}): {e}")
+            else:
+                self.control_api = server
+                self.log_text.append(f"API управления заданиями: {server.address}")
+
+    def enqueue_jobs(self, entries):
+        """Задания извне (API): в идущий пакет, иначе — новым пакетом с текущими настройками интерфейса."""
+        if self.batch_queue is None and not self.batch_probing:
+            self.start_batch([entry["input"] for entry in entries], entries)
+            return
+        first = self.batch_total
+        self.batch_files.extend(entry["input"] for entry in entries)
+        self.batch_entries.extend(dict(entry) for entry in entries)
+        self.batch_total += len(entries)
+        for key in range(first, self.batch_total):
+            self.batch_progress.add(key)
+        self.log_text.append(f"В пакет добавлено заданий: {len(entries)}")
+        self._probe_batch(range(first, self.batch_total), self.batch_progress)
+
+    def cancel_job(self, job_id):
+        """Отменяет задание пакета: из очереди — сразу, выполняющееся — остановкой процесса."""
+        for job, worker in list(self.batch_workers.values()):
+            if job.job_id == job_id:
+                job.cancelled = True
+                if isinstance(worker, RemoteRenderJob):
+                    self.remote_jobs.pop(worker.job_id, None)
+                worker.cancel()  # дальше — batch_render_finished
+                return
+        queued = [job for job in (self.batch_queue.upcoming(len(self.batch_queue)) if self.batch_queue else [])
+                  if job.job_id == job_id]
+        if queued and self.batch_queue.remove(queued[0]):
+            job = queued[0]
+            self.batch_progress.finish(job.key)
+            self.log_text.append(f"Видео {job.key+1} отменено")
+            self._board(job, state="cancelled")
+            self._dispatch_batch()
+            return
+        # Ещё анализируется — _on_batch_probed не поставит его в очередь
+        record = self.jobs_board.get(job_id)
+        if record is not None and record["state"] == "probing":
+            self.jobs_board.update(job_id, state="cancelled")
+
+    def cancel_batch(self):
+        """Отменяет все задания пакета: очередь очищается, выполняющиеся процессы останавливаются."""
+        while self.batch_queue:
+            job = self.batch_queue.pop()
+            self.batch_progress.finish(job.key)
+            self._board(job, state="cancelled")
+        for job, _ in list(self.batch_workers.values()):
+            self.cancel_job(job.job_id)
+        self.log_text.append("Пакет отменён")
+        self._dispatch_batch()
+
+    def _board(self, job, **fields):
+        if job.job_id is not None:
+            self.jobs_board.update(job.job_id, **fields)
+
+    def _on_cluster_event(self, job_id, kind, data):
+        if kind == 'joined':
+            self.log_text.append(f"Подключился узел {data['worker']}")
+            if self.batch_queue:
+                self._dispatch_batch()
+            return
+        worker = self.remote_jobs.get(job_id)
+        if worker is None:
+            return
+        if kind in ('finished', 'returned'):
+            del self.remote_jobs[job_id]
+        worker.handle_event(kind, data)
+        if kind == 'started':
+            self.update_batch_status()
+
+    def _batch_capacity(self):
+        """Сколько заданий пакета может выполняться сразу: локальные слоты плюс слоты живых узлов."""
+        remote = self.cluster.coordinator.live_slots() if self.cluster is not None else 0
+        return self.batch_settings["parallel"] + remote
+
+    def _local_running(self):
+        return sum(1 for _, worker in self.batch_workers.values() if not isinstance(worker, RemoteRenderJob))
+
+    def _prefetch_dir(self):
+        if not self.settings["prefetch_inputs"]:
+            return None
+        return self.settings["scratch_dir"] or os.path.join(tempfile.gettempdir(), "CineConvert")
 
     def load_locales(self):
-        """Сканирует папку locales рядом со скриптом и заполняет self.locale_combo."""
+        """Сканирует папку locales рядом со скриптом. JSON-файлы здесь не читаются — только имена."""
         app_dir = APP_DIR
         # При запуске из PyInstaller реальные распакованные ресурсы могут быть в RESOURCE_DIR
         # Читаем локали из RESOURCE_DIR если там есть, иначе из APP_DIR
@@ -617,25 +1934,27 @@ class VideoConverter(QMainWindow):
             pass
 
         self.locales_map = {}
-        self.locale_combo.clear()
         try:
             files = [f for f in os.listdir(locales_dir) if f.lower().endswith('.json')]
             for fname in sorted(files):
-                code = os.path.splitext(fname)[0]
-                path = os.path.join(locales_dir, fname)
-                # Попробуем прочитать поле 'name' внутри JSON чтобы показать удобочитаемое имя
-                display = code
-                try:
-                    with open(path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        if isinstance(data, dict) and data.get('name'):
-                            display = f"{data.get('name')} ({code})"
-                except Exception:
-                    pass
-                self.locales_map[code] = path
-                self.locale_combo.addItem(display, code)
+                self.locales_map[os.path.splitext(fname)[0]] = os.path.join(locales_dir, fname)
         except Exception:
             pass
+        if hasattr(self, 'locale_combo'):
+            self.fill_locale_combo()
+
+    def fill_locale_combo(self):
+        """Заполняет self.locale_combo, читая удобочитаемые имена локалей."""
+        self.locale_combo.clear()
+        for code, path in self.locales_map.items():
+            # Попробуем прочитать поле 'name' внутри JSON чтобы показать удобочитаемое имя
+            name = LocaleCatalog.compile(path).get('name')
+            display = f"{name} ({code})" if name else code
+            self.locale_combo.addItem(display, code)
+        if self.current_locale:
+            index = self.locale_combo.findData(self.current_locale)
+            if index >= 0:
+                self.locale_combo.setCurrentIndex(index)
 
     def open_locales_folder(self):
         app_dir = APP_DIR
@@ -659,199 +1978,91 @@ class VideoConverter(QMainWindow):
             return
         self.apply_locale(code)
         # Сохраняем выбор в config
-        try:
-            cfg = {}
-            if os.path.exists(CONFIG_FILE):
-                try:
-                    with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                        cfg = json.load(f)
-                except Exception:
-                    cfg = {}
-            cfg['language'] = code
-            with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-                json.dump(cfg, f, ensure_ascii=False, indent=4)
-        except Exception:
-            pass
+        CONFIG.set('language', code)
+
+    def tr_widget(self, widget, key=None, kind=None):
+        """Регистрирует виджет для перевода и сразу применяет текущую локаль. Возвращает виджет.
+
+        Для QComboBox ключами служат исходные тексты элементов; исходный текст сохраняется
+        в данных элемента, чтобы настройки читались независимо от языка (см. combo_value).
+        """
+        if kind is None:
+            if isinstance(widget, QGroupBox):
+                kind = 'title'
+            elif isinstance(widget, QLineEdit):
+                kind = 'placeholder'
+            elif isinstance(widget, QComboBox):
+                kind = 'items'
+            else:
+                kind = 'text'
+        if kind == 'items':
+            source = [widget.itemText(i) for i in range(widget.count())]
+            for i, text in enumerate(source):
+                widget.setItemData(i, text)
+        elif kind == 'title':
+            source = widget.title()
+        elif kind == 'placeholder':
+            source = widget.placeholderText()
+        else:
+            source = widget.text()
+        entry = (kind, widget, key, source)
+        self._i18n.append(entry)
+        if self.translations:
+            self._apply_entry(entry, self.translations)
+        return widget
+
+    def _apply_entry(self, entry, t):
+        kind, widget, key, source = entry
+        if kind == 'items':
+            # Отдельный список элементов ('<ключ>.items') не поддерживаем: тексты берутся поэлементно
+            for i, text in enumerate(source):
+                if i < widget.count() and widget.itemData(i) == text:
+                    value = t.get(text, text)
+                    widget.setItemText(i, value if isinstance(value, str) else text)
+            return
+        value = t.get(key, source) if key else source
+        if not isinstance(value, str):
+            return
+        if kind == 'title':
+            widget.setTitle(value)
+        elif kind == 'placeholder':
+            widget.setPlaceholderText(value)
+        elif kind == 'tab':
+            self.tabs.setTabText(widget, value)
+        elif kind == 'window':
+            self.setWindowTitle(value)
+        elif kind == 'idle':
+            # Текст-заглушка: меняем, только пока он на месте, а не кадр превью или сообщение о состоянии
+            if widget.text() in (source, widget.property('i18n_text')):
+                widget.setText(value)
+                widget.setProperty('i18n_text', value)
+        else:
+            widget.setText(value)
+
+    def combo_value(self, combo):
+        """Исходное (непереведённое) значение combobox; для введённого вручную текста — сам текст."""
+        index = combo.currentIndex()
+        data = combo.itemData(index) if index >= 0 else None
+        if isinstance(data, str) and combo.itemText(index) == combo.currentText():
+            return data
+        return combo.currentText()
 
     def apply_locale(self, code):
-        """Загружает JSON локали и применяет переводы к ключевым виджетам."""
+        """Применяет каталог локали к зарегистрированным виджетам за один проход."""
         path = self.locales_map.get(code) if hasattr(self, 'locales_map') else None
         if not path or not os.path.exists(path):
             return
-        try:
-            with open(path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-        except Exception:
-            return
-        if not isinstance(data, dict):
+        catalog = LocaleCatalog.load(path, self.locales_map.get('en'))
+        if not catalog:
             return
-        self.translations = data
-        t = self.translations
-        # Универсальный перевод: сначала по objectName, затем по текущему тексту/placeholder
-        def _set_text_by_type(w, text):
+        self.translations = catalog
+        self.current_locale = code
+        for entry in self._i18n:
             try:
-                from PyQt6.QtWidgets import QPushButton, QLabel, QGroupBox, QCheckBox, QLineEdit, QComboBox, QTextEdit
-                # Пробуем установить текст в зависимости от типа виджета
-                if isinstance(w, QPushButton):
-                    w.setText(text)
-                    return True
-                if isinstance(w, QLabel):
-                    w.setText(text)
-                    return True
-                if isinstance(w, QGroupBox):
-                    w.setTitle(text)
-                    return True
-                if isinstance(w, QCheckBox):
-                    w.setText(text)
-                    return True
-                if isinstance(w, QLineEdit):
-                    w.setPlaceholderText(text)
-                    return True
-                if isinstance(w, QComboBox):
-                    # Если перевод даёт список элементов для combobox — применим
-                    if isinstance(text, (list, tuple)):
-                        try:
-                            w.clear()
-                            w.addItems([str(i) for i in text])
-                            return True
-                        except Exception:
-                            pass
-                    else:
-                        # Иначе, если есть точное совпадение с одним из элементов — заменим его
-                        try:
-                            for i in range(w.count()):
-                                item = w.itemText(i)
-                                if item in t and isinstance(t[item], str):
-                                    w.setItemText(i, t[item])
-                            return True
-                        except Exception:
-                            pass
-                if isinstance(w, QTextEdit):
-                    # Не трогаем содержимое логов
-                    return False
-            except Exception:
-                pass
-            return False
-
-        # Window title
-        if t.get('window_title'):
-            try:
-                self.setWindowTitle(t.get('window_title'))
+                self._apply_entry(entry, catalog)
             except Exception:
-                pass
-
-        # Сначала обработаем явные ключи, если они заданы (старый стиль JSON)
-        explicit_map = {
-            'btn_render': getattr(self, 'btn_render', None),
-            'btn_extract': getattr(self, 'btn_extract', None),
-            'chk_video_notify': getattr(self, 'chk_video_notify', None),
-            'chk_audio_notify': getattr(self, 'chk_audio_notify', None)
-        }
-        for key, widget in explicit_map.items():
-            if widget and t.get(key):
-                try:
-                    _set_text_by_type(widget, t.get(key))
-                except Exception:
-                    pass
-
-        # Вкладки: поддерживаем и старые ключи и поиск по текущему тексту
-        try:
-            for idx in range(self.tabs.count()):
-                current = self.tabs.tabText(idx)
-                # сначала по известным именам
-                if idx == 0 and t.get('tab_video'):
-                    self.tabs.setTabText(idx, t.get('tab_video'))
-                    continue
-                if idx == 1 and t.get('tab_audio_settings'):
-                    self.tabs.setTabText(idx, t.get('tab_audio_settings'))
-                    continue
-                if idx == 2 and t.get('tab_audio_extract'):
-                    self.tabs.setTabText(idx, t.get('tab_audio_extract'))
-                    continue
-                if idx == 3 and t.get('tab_logs'):
-                    self.tabs.setTabText(idx, t.get('tab_logs'))
-                    continue
-                if idx == 4 and t.get('tab_settings'):
-                    self.tabs.setTabText(idx, t.get('tab_settings'))
-                    continue
-                # иначе пробуем перевести по текущему тексту
-                if current and isinstance(current, str) and current in t and isinstance(t[current], str):
-                    self.tabs.setTabText(idx, t[current])
-        except Exception:
-            pass
-
-        # Проходим по всем виджетам и пробуем перевести
-        try:
-            for w in self.findChildren(QWidget):
-                try:
-                    # Пропускаем QTabWidget самих вкладок (уже обработали)
-                    if w is self.tabs:
-                        continue
-                    obj = w.objectName() if hasattr(w, 'objectName') else None
-                    applied = False
-                    # 1) По objectName
-                    if obj:
-                        # В JSON может быть как простая строка, так и список для combobox
-                        if obj in t:
-                            applied = _set_text_by_type(w, t[obj])
-                            if applied:
-                                continue
-                        # Также поддерживаем суффикс ".items" для списков
-                        items_key = f"{obj}.items"
-                        if items_key in t and isinstance(t[items_key], (list, tuple)) and isinstance(w, QComboBox):
-                            try:
-                                w.clear()
-                                w.addItems([str(i) for i in t[items_key]])
-                                continue
-                            except Exception:
-                                pass
-
-                    # 2) По текущему тексту (для QPushButton, QLabel, QGroupBox, QCheckBox)
-                    # Получаем возможные текстовые представления
-                    cur_texts = []
-                    try:
-                        # label-like
-                        if hasattr(w, 'text'):
-                            cur_texts.append(w.text())
-                    except Exception:
-                        pass
-                    try:
-                        if hasattr(w, 'placeholderText'):
-                            cur = w.placeholderText()
-                            if cur:
-                                cur_texts.append(cur)
-                    except Exception:
-                        pass
-                    # Попытка применить перевод по любому найденному текущему тексту
-                    for ct in cur_texts:
-                        if not ct:
-                            continue
-                        if ct in t and isinstance(t[ct], (str, list, tuple)):
-                            try:
-                                if _set_text_by_type(w, t[ct]):
-                                    applied = True
-                                    break
-                            except Exception:
-                                pass
-                    if applied:
-                        continue
-
-                    # 3) Для QComboBox: попытка заменить отдельные элементы по ключам в JSON
-                    from PyQt6.QtWidgets import QComboBox
-                    if isinstance(w, QComboBox):
-                        try:
-                            for i in range(w.count()):
-                                item = w.itemText(i)
-                                if item in t and isinstance(t[item], str):
-                                    w.setItemText(i, t[item])
-                        except Exception:
-                            pass
-
-                except Exception:
-                    # Не критично — продолжаем со следующими виджетами
-                    continue
-        except Exception:
-            pass
+                # Не критично — продолжаем со следующими виджетами
+                continue
 
     def setup_styles(self):
         # Светлая тема с современными тенями
@@ -929,15 +2140,7 @@ class VideoConverter(QMainWindow):
                 border: none;
             }
         """)
-        
-        # Добавление теней к группам
-        for group in self.findChildren(QGroupBox):
-            shadow = QGraphicsDropShadowEffect()
-            shadow.setBlurRadius(8)
-            shadow.setXOffset(0)
-            shadow.setYOffset(2)
-            shadow.setColor(QColor(0, 0, 0, 20))
-            group.setGraphicsEffect(shadow)
+
 
     def select_input_file(self):
         file, _ = QFileDialog.getOpenFileName(
@@ -945,6 +2148,7 @@ class VideoConverter(QMainWindow):
             "Видеофайлы (*.mp4 *.mkv *.mov *.avi *.flv)"
         )
         if file:
+            self.batch_manifest = None
             self.input_path.setText(file)
             self.input_file = file
             # ОЧИЩАЕМ выходной файл при выборе нового входного
@@ -961,6 +2165,7 @@ class VideoConverter(QMainWindow):
             "Видеофайлы (*.mp4 *.mkv *.mov *.avi *.flv)"
         )
         if files:
+            self.batch_manifest = None
             self.input_files = files
             self.input_file = files[0]
             self.input_path.setText(files[0])
@@ -971,6 +2176,43 @@ class VideoConverter(QMainWindow):
             self.update_video_settings()
             self.update_audio_settings()
 
+    def select_batch_manifest(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Выберите манифест пакета", "", "Манифест пакета (*.json)")
+        if not path:
+            return
+        try:
+            entries = load_batch_manifest(path, CONFIG.get("encoder_presets"))
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "Ошибка", f"Не удалось загрузить манифест: {e}")
+            return
+        self.batch_manifest = entries
+        self.input_files = [entry["input"] for entry in entries]
+        self.input_file = self.input_files[0]
+        self.input_path.setText(self.input_file)
+        self.output_path.clear()
+        self.output_file = ""
+        self.log_text.append(f"Загружен манифест пакета: {os.path.basename(path)}, заданий: {len(entries)}")
+        self.load_video_info(self.input_file)
+        self.show_video_preview(self.input_file)
+        self.update_video_settings()
+        self.update_audio_settings()
+
+    def open_catalog(self):
+        dialog = CatalogDialog(self)
+        if not dialog.exec() or not dialog.records:
+            return
+        self.batch_manifest = None
+        self.input_files = dialog.paths()
+        self.input_file = self.input_files[0]
+        self.input_path.setText(self.input_file)
+        self.output_path.clear()
+        self.output_file = ""
+        self.log_text.append(f"Пакет из медиатеки: файлов {len(self.input_files)}")
+        self.load_video_info(self.input_file)
+        self.show_video_preview(self.input_file)
+        self.update_video_settings()
+        self.update_audio_settings()
+
     def select_output_file(self):
         file, _ = QFileDialog.getSaveFileName(
             self, "Сохранить результат", "", 
@@ -980,6 +2222,13 @@ class VideoConverter(QMainWindow):
             self.output_path.setText(file)
             self.output_file = file
 
+    def _on_index_done(self, future, file_path):
+        """Завершение фоновой индексации (в потоке супервизора): ошибку выводим в журнал."""
+        if future.cancelled() or future.exception() is None:
+            return
+        get_supervisor().post(self.log_text.append,
+                              f"⚠️ Не удалось построить индекс {os.path.basename(file_path)}: {future.exception()}")
+
     def load_video_info(self, file_path):
         try:
             # Очищаем предыдущую информацию
@@ -991,13 +2240,15 @@ class VideoConverter(QMainWindow):
                 ffprobe_cmd, '-v', 'error', '-show_format',
                 '-show_streams', '-of', 'json', file_path
             ]
-            result = subprocess.run(
-                cmd, capture_output=True, text=True, check=True
-            )
-            info = json.loads(result.stdout)
+            result = run_process(cmd, check=True)
+            info = json.loads(result.stdout.decode('utf-8', errors='replace'))
             
             # Сохраняем информацию о видео для последующего использования
             self.video_info = info
+            # Строим (или проверяем) индекс ключевых кадров в фоне — он нужен обрезке и перемотке
+            supervisor = get_supervisor()
+            indexing = supervisor.run_coroutine(MediaIndex.open_async(supervisor, ffprobe_cmd, file_path))
+            indexing.add_done_callback(lambda future: self._on_index_done(future, file_path))
             
             # Собираем информацию для отображения
             streams = info.get('streams', [])
@@ -1120,6 +2371,9 @@ class VideoConverter(QMainWindow):
                 for i in range(col, 3):
                     empty = QWidget()
                     self.info_grid.addWidget(empty, row, i)
+
+            # Вкладка извлечения аудио открыта — сразу показываем обзор нового файла
+            self._refresh_audio_overview()
             
         except Exception as e:
             error_label = QLabel(f"Ошибка получения информации: {str(e)}")
@@ -1176,6 +2430,7 @@ class VideoConverter(QMainWindow):
         """Обновляет настройки аудио на основе информации о загруженном файле"""
         if not self.video_info:
             return
+        self._ensure_tab(self.TAB_AUDIO_SETTINGS)
             
         audio_streams = [s for s in self.video_info.get('streams', []) if s['codec_type'] == 'audio']
         if not audio_streams:
@@ -1220,40 +2475,160 @@ class VideoConverter(QMainWindow):
                 self.audio_channels.addItem(f"{channels} каналов (исходное)")
                 self.audio_channels.setCurrentIndex(self.audio_channels.count() - 1)
 
+    THUMB_COUNT = 10
+    THUMB_HEIGHT = 90
+
     def show_video_preview(self, file_path):
+        """Показывает полосу миниатюр: из кэша мгновенно, иначе строит её одним процессом ffmpeg."""
+        self.sprite_pixmap = None
+        self.sprite_source = file_path
+        self.thumb_strip.clear_strip()
         try:
-            # Создаем временное превью
-            preview_path = os.path.join(os.path.dirname(file_path), "preview.jpg")
             ffmpeg_cmd = getattr(self, "ffmpeg_path", "ffmpeg")
             # Проверяем, что ffmpeg доступен либо как абсолютный путь, либо в PATH
-            import shutil as _shutil
             if os.path.isabs(ffmpeg_cmd):
                 if not os.path.exists(ffmpeg_cmd):
                     raise FileNotFoundError(ffmpeg_cmd)
             else:
-                if _shutil.which(ffmpeg_cmd) is None:
+                if shutil.which(ffmpeg_cmd) is None:
                     raise FileNotFoundError(ffmpeg_cmd)
-            cmd = [
-                ffmpeg_cmd, '-i', file_path, 
-                '-ss', '00:00:01', '-vframes', '1',
-                '-q:v', '2', preview_path
-            ]
-            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            
-            pixmap = QPixmap(preview_path)
-            if not pixmap.isNull():
-                # Уменьшаем размер превью
-                pixmap = pixmap.scaled(
-                    300, 180, 
-                    Qt.AspectRatioMode.KeepAspectRatio,
-                    Qt.TransformationMode.SmoothTransformation
-                )
-                self.preview_label.setPixmap(pixmap)
-            os.remove(preview_path)
-            
+
+            duration = float(self.video_info.get('format', {}).get('duration', 0) or 0)
+            video = next((s for s in self.video_info.get('streams', []) if s.get('codec_type') == 'video'), None)
+            if not video or duration <= 0:
+                raise RuntimeError("нет видеопотока или длительности")
+            width, height = int(video.get('width', 0)), int(video.get('height', 0))
+            thumb_width = max(2, int(round(self.THUMB_HEIGHT * width / max(1, height) / 2)) * 2)
+
+            key = SpriteCache.key(file_path, self.THUMB_COUNT, self.THUMB_HEIGHT)
+            cached = self.sprite_cache.get(key)
+            if cached:
+                self._on_sprite_ready(file_path, cached, thumb_width)
+                return
+
+            self.preview_label.setText("Создание превью...")
+            supervisor = get_supervisor()
+            index = MediaIndex.load(file_path)
+            times = thumbnail_times(duration, self.THUMB_COUNT, index)
+            tmp_path = self.sprite_cache.temp_path()
+
+            async def _build():
+                try:
+                    await generate_sprite(supervisor, ffmpeg_cmd, file_path, times,
+                                          thumb_width, self.THUMB_HEIGHT, tmp_path)
+                    path = self.sprite_cache.put(key, tmp_path)
+                    supervisor.post(self._on_sprite_ready, file_path, path, thumb_width)
+                except Exception as e:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    supervisor.post(self._on_sprite_failed, file_path, str(e))
+
+            supervisor.run_coroutine(_build())
         except Exception as e:
-            self.log_text.append(f"Ошибка создания превью: {str(e)}")
-            self.preview_label.setText("Не удалось загрузить превью")
+            self._on_sprite_failed(file_path, str(e))
+
+    def _on_sprite_ready(self, file_path, sprite_path, thumb_width):
+        if file_path != self.sprite_source:
+            return  # Пользователь уже выбрал другой файл
+        pixmap = QPixmap(sprite_path)
+        if pixmap.isNull():
+            self._on_sprite_failed(file_path, "не удалось прочитать спрайт")
+            return
+        self.sprite_pixmap = pixmap
+        self.sprite_thumb_width = thumb_width
+        self.thumb_strip.set_strip(pixmap, self.THUMB_COUNT)
+        # По умолчанию показываем кадр из середины ролика, а не с первой секунды
+        self.show_thumbnail(self.THUMB_COUNT // 2)
+
+    def _on_sprite_failed(self, file_path, message):
+        if file_path != self.sprite_source:
+            return
+        self.log_text.append(f"Ошибка создания превью: {message}")
+        self.preview_label.setText("Не удалось загрузить превью")
+
+    def show_thumbnail(self, index):
+        """Показывает в окне превью миниатюру с номером index из текущего спрайта."""
+        if self.sprite_pixmap is None:
+            return
+        frame = self.sprite_pixmap.copy(index * self.sprite_thumb_width, 0,
+                                        self.sprite_thumb_width, self.sprite_pixmap.height())
+        self.preview_label.setPixmap(frame.scaled(
+            300, 180,
+            Qt.AspectRatioMode.KeepAspectRatio,
+            Qt.TransformationMode.SmoothTransformation
+        ))
+
+    def _refresh_audio_overview(self, index=None):
+        """Обзор аудио строится только на открытой вкладке извлечения и заново — лишь для нового файла."""
+        if self.tabs.currentIndex() != self.TAB_AUDIO_EXTRACT or not self.input_file:
+            return
+        if self.waveform_source != self.input_file:
+            self.show_audio_overview(self.input_file)
+
+    def show_audio_overview(self, file_path):
+        """Огибающая и уровни звука: из кэша сразу, иначе потоковым проходом ffmpeg в фоновом потоке."""
+        if self.waveform_cancel is not None:
+            self.waveform_cancel.set()
+            self.waveform_cancel = None
+        self.waveform_source = file_path
+        streams = self.video_info.get('streams', [])
+        if not any(s.get('codec_type') == 'audio' for s in streams):
+            self.waveform_view.clear_waveform("В файле нет аудиопотоков")
+            self.waveform_stats.setText("")
+            return
+        cached = self.waveform_cache.load(file_path)
+        if cached is not None:
+            self._on_waveform_ready(file_path, cached)
+            return
+
+        ffmpeg_cmd = getattr(self, "ffmpeg_path", "ffmpeg")
+        duration = float(self.video_info.get('format', {}).get('duration', 0) or 0)
+        self.waveform_view.clear_waveform("Построение обзора аудио...")
+        self.waveform_stats.setText("")
+        supervisor = get_supervisor()
+        cancel = threading.Event()
+        self.waveform_cancel = cancel
+
+        def _build():
+            try:
+                started = time.perf_counter()
+                overview = audio_overview(ffmpeg_cmd, file_path, duration, self.waveform_cache, cancel)
+                if overview is not None:
+                    supervisor.post(self._on_waveform_ready, file_path, overview, time.perf_counter() - started)
+            except Exception as e:
+                if not cancel.is_set():
+                    supervisor.post(self._on_waveform_failed, file_path, str(e))
+
+        threading.Thread(target=_build, daemon=True).start()
+
+    def _on_waveform_ready(self, file_path, overview, elapsed=None):
+        if file_path != self.waveform_source:
+            return  # Пользователь уже выбрал другой файл
+        self.waveform_cancel = None
+        self.waveform_view.set_waveform(overview)
+        clipped = overview['clipped']
+        parts = [f"Пик: {level_db(overview['peak']):.1f} dBFS",
+                 f"RMS: {level_db(overview['rms_level']):.1f} dBFS",
+                 f"тишина: {overview['silence'] * 100:.0f}%"]
+        parts.append(f"⚠️ клиппинг: {clipped} отсч." if clipped else "без клиппинга")
+        self.waveform_stats.setText(", ".join(parts))
+        if elapsed is not None:
+            self.log_text.append(f"Обзор аудио {os.path.basename(file_path)}: {format_eta(overview['duration'])} "
+                                 f"звука за {elapsed:.1f} с")
+
+    def _on_waveform_failed(self, file_path, message):
+        if file_path != self.waveform_source:
+            return
+        self.waveform_cancel = None
+        self.log_text.append(f"Ошибка построения обзора аудио: {message}")
+        self.waveform_view.clear_waveform("Не удалось построить обзор аудио")
+
+    def _list_encoders(self, ffmpeg_cmd):
+        """Возвращает вывод `ffmpeg -encoders` (кэшируется на время работы программы)."""
+        if ffmpeg_cmd not in self._encoders_cache:
+            proc = run_process([ffmpeg_cmd, '-hide_banner', '-encoders'], timeout=5)
+            self._encoders_cache[ffmpeg_cmd] = (proc.stdout + proc.stderr).decode('utf-8', errors='replace')
+        return self._encoders_cache[ffmpeg_cmd]
 
     def check_codec_available(self, ffmpeg_cmd, codec_name):
         """Проверяет, доступен ли указанный кодек в ffmpeg. Если нет — возвращает 'libx264' в качестве безопасного фолбэка."""
@@ -1262,13 +2637,13 @@ class VideoConverter(QMainWindow):
             if 'nvenc' in codec_name.lower() and platform.system() == 'Windows':
                 try:
                     # Попытка загрузить драйвер CUDA
+                    import ctypes
                     ctypes.WinDLL('nvcuda.dll')
                 except Exception:
                     return 'libx264'
 
             # Запросим список энкодеров
-            proc = subprocess.run([ffmpeg_cmd, '-hide_banner', '-encoders'], capture_output=True, text=True, timeout=5)
-            out = proc.stdout + proc.stderr
+            out = self._list_encoders(ffmpeg_cmd)
             # Проверяем, есть ли строка с именем кодека
             # У энкодеров формат: " V..... h264_nvenc"
             if codec_name in out:
@@ -1305,10 +2680,8 @@ class VideoConverter(QMainWindow):
         mapped = mapping.get(name, name)
 
         # Проверим доступность через ffmpeg -encoders
-        out = ''
         try:
-            proc = subprocess.run([ffmpeg_cmd, '-hide_banner', '-encoders'], capture_output=True, text=True, timeout=5)
-            out = (proc.stdout or '') + (proc.stderr or '')
+            out = self._list_encoders(ffmpeg_cmd)
         except Exception:
             out = ''
 
@@ -1331,83 +2704,550 @@ class VideoConverter(QMainWindow):
         return mapped
 
     def start_video_render(self):
+        if self.batch_workers or self.batch_checks:
+            QMessageBox.warning(self, "Ошибка", "Пакетное перекодирование уже выполняется!")
+            return
         # Если выбрано несколько файлов — пакетная обработка
         files_to_render = getattr(self, "input_files", None)
         if files_to_render and len(files_to_render) > 1:
-            self.batch_files = files_to_render
-            self.batch_index = 0
-            self.batch_total = len(files_to_render)
-            self.batch_settings = {
-                "res_text": self.resolution.currentText(),
-                "video_codec": self.video_codec.currentText(),
-                "format": self.format.currentText(),
-                "bitrate": self.bitrate.currentText(),
-                "audio_codec": self.audio_codec.currentText(),
-                "audio_bitrate": self.audio_bitrate.currentText(),
-                "audio_channels": self.audio_channels.currentText()
-            }
-            self.render_next_in_batch()
+            self.start_batch(files_to_render, self.batch_manifest)
             return
 
         files_to_render = self.input_files if self.input_files else [self.input_file]
         if not files_to_render or not all(os.path.exists(f) for f in files_to_render):
             QMessageBox.warning(self, "Ошибка", "Выберите существующие видеофайлы!")
             return
+        self.start_batch(files_to_render, self.batch_manifest if self.input_files else None)
 
-        self.batch_index = 0
-        self.batch_total = len(files_to_render)
-        self.batch_files = files_to_render
-        self.batch_settings = {
-            "res_text": self.resolution.currentText(),
-            "video_codec": self.video_codec.currentText(),
-            "format": self.format.currentText(),
-            "bitrate": self.bitrate.currentText(),
-            "audio_codec": self.audio_codec.currentText(),
-            "audio_bitrate": self.audio_bitrate.currentText(),
-            "audio_channels": self.audio_channels.currentText()
-        }
-        self.render_next_in_batch()
+    def start_batch(self, files, manifest=None):
+        """Запускает пакет: сначала ffprobe параллельно оценивает все файлы, затем задания выдаются по политике.
+
+        manifest — записи load_batch_manifest для тех же файлов (приоритет, срок, пресет, выходной путь).
+        """
+        self.batch_total = len(files)
+        self.batch_files = list(files)
+        self.batch_entries = [dict(entry) for entry in manifest] if manifest else [{} for _ in files]
+        self.batch_settings = self.collect_render_settings()
+        self.batch_progress = BatchProgress(range(self.batch_total))
+        self.batch_queue = None
+        self.batch_probing = 0
+        self.batch_outputs = {}  # _path_key(результат) -> номер задания, которое его пишет
+        self.batch_failed = 0
+        self.batch_flagged = []
+        scratch_dir = self.settings["scratch_dir"]
+        self.scratch = ScratchSpace(scratch_dir, self.settings["scratch_quota_gb"] * 1024 ** 3) if scratch_dir else None
+        self._admit_waiting = None
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+        prefetch_dir = self._prefetch_dir()
+        if prefetch_dir:
+            space = ScratchSpace(prefetch_dir, self.settings["prefetch_budget_gb"] * 1024 ** 3)
+            supervisor, progress = get_supervisor(), self.batch_progress
+            self.prefetcher = InputPrefetcher(
+                space, lambda key, ok: supervisor.post(self._on_prefetched, progress, key, ok))
+        else:
+            self.prefetcher = None
+        self.log_text.clear()
+        self.progress_bar.setValue(0)
+        self.batch_status_label.setText(f"Анализ файлов пакета ({self.batch_total})...")
+        self._probe_batch(range(self.batch_total), self.batch_progress)
+
+    def _probe_batch(self, keys, progress):
+        keys = list(keys)
+        files = [self.batch_files[key] for key in keys]
+        for key, path in zip(keys, files):
+            entry = self.batch_entries[key]
+            if entry.get("id") is None:
+                entry["id"] = self.jobs_board.add("gui", path, entry.get("output"), entry.get("priority", 0))
+        self.batch_probing += 1
+        supervisor = get_supervisor()
+        ffprobe_cmd = self.ffprobe_path or "ffprobe"
+
+        async def _probe_all():
+            import asyncio
+            limit = asyncio.Semaphore(4)
+
+            async def _probe(path):
+                async with limit:
+                    try:
+                        return await probe_media(supervisor, ffprobe_cmd, path)
+                    except Exception:
+                        return {'duration': None, 'width': None, 'height': None}
+
+            media = await asyncio.gather(*(_probe(path) for path in files))
+            supervisor.post(self._on_batch_probed, progress, keys, media)
+        supervisor.run_coroutine(_probe_all())
+
+    def _on_batch_probed(self, progress, keys, media):
+        if progress is not self.batch_progress:
+            return  # результат устаревшего пакета
+        if self.batch_queue is None:
+            self.batch_queue = JobQueue(self.batch_settings["policy"])
+        jobs = []
+        for key, info in zip(keys, media):
+            path, entry = self.batch_files[key], self.batch_entries[key]
+            progress.set_duration(key, info['duration'])
+            record = self.jobs_board.get(entry["id"])
+            if record is not None and record["state"] == "cancelled":
+                progress.finish(key)  # отменено, пока шёл анализ
+                continue
+            settings = dict(self.batch_settings, **entry["settings"]) if entry.get("settings") else self.batch_settings
+            codec = None
+            if "Без изменений" not in settings["video_codec"] and "исходный" not in settings["video_codec"]:
+                codec = settings["video_codec"].split()[0]
+            width, height = self._target_size(settings["res_text"], info['width'], info['height'])
+            job = RenderJob(
+                key, path, info['duration'], width, height, codec,
+                priority=entry.get("priority", 0), deadline=entry.get("deadline"),
+                encoder=entry.get("encoder") or settings["encoder"], output=entry.get("output")
+            )
+            job.source_size = (info['width'], info['height'])
+            job.media = info
+            job.job_id = entry["id"]
+            if settings is not self.batch_settings:
+                job.settings = settings
+            jobs.append(job)
+        targets = [job for job in jobs if job.encoder.get("per_title") and job.codec]
+        if targets:
+            self._analyze_batch(progress, jobs, targets)
+        else:
+            self._queue_batch_jobs(jobs)
 
-    def render_next_in_batch(self):
-        if self.batch_index >= self.batch_total:
-            self.batch_status_label.setText("Пакетное перекодирование завершено!")
-            self.log_text.append("Пакетное перекодирование завершено!")
-            self.progress_bar.setValue(100)
+    def _queue_batch_jobs(self, jobs):
+        """Проанализированные задания — в очередь пакета."""
+        self.batch_probing -= 1
+        for job in jobs:
+            self.batch_queue.push(job)
+            self._board(job, state="queued", duration=job.duration)
+        self._dispatch_batch()
+
+    def _job_settings(self, job):
+        """Настройки рендеринга задания: общие настройки пакета или они же с переопределениями задания."""
+        return job.settings or self.batch_settings
+
+    def _analyze_batch(self, progress, jobs, targets):
+        """Per-title: пробные CRF-кодирования фрагментов до запуска пакета, затем подбор битрейта."""
+        supervisor = get_supervisor()
+        analyzer = ComplexityAnalyzer(supervisor, self.ffmpeg_path or "ffmpeg")
+        parallel = self.batch_settings["parallel"]
+        started = time.monotonic()
+        self.batch_status_label.setText(f"Анализ сложности ({len(targets)} файлов)...")
+
+        async def _run():
+            import asyncio
+            limit = asyncio.Semaphore(parallel)
+
+            async def _probe(job):
+                async with limit:
+                    try:
+                        return await analyzer.probe(job.path, job.duration, job.encoder["quality"], *job.source_size)
+                    except Exception:
+                        return None, 0.0
+
+            results = await asyncio.gather(*(_probe(job) for job in targets))
+            supervisor.post(self._on_batch_analyzed, progress, jobs, targets, results, time.monotonic() - started)
+        supervisor.run_coroutine(_run())
+
+    def _on_batch_analyzed(self, progress, all_jobs, jobs, results, elapsed):
+        if progress is not self.batch_progress:
             return
+        sampled = 0.0
+        for job, (kbps, media) in zip(jobs, results):
+            sampled += media
+            if not kbps:
+                self.log_text.append(f"⚠️ Видео {job.key+1}: анализ сложности не удался — используем общие настройки.")
+                continue
+            cap = parse_bitrate_kbps(self._job_settings(job)["bitrate"])
+            job.bitrate = ComplexityAnalyzer.target_kbps(kbps, job.source_size, (job.width, job.height), job.codec, cap)
+            self.log_text.append(f"Видео {job.key+1}: сложность {kbps:.0f}k при {ComplexityAnalyzer.PROBE_HEIGHT}p → битрейт {job.bitrate}k")
+        total = sum(job.duration or 0 for job in jobs)
+        share = f" ({sampled * 100 / total:.1f}% длительности)" if total else ""
+        self.log_text.append(f"Анализ сложности: {len(jobs)} файлов, закодировано {sampled:.0f} с{share}, "
+                             f"заняло {format_eta(elapsed)}")
+        self._queue_batch_jobs(all_jobs)
 
-        input_file = self.batch_files[self.batch_index]
-        # Показываем статус
-        self.batch_status_label.setText(
-            f"Видео {self.batch_index+1} из {self.batch_total}: {os.path.basename(input_file)}"
-        )
+    def estimate_batch(self):
+        """Пробное кодирование фрагментов и прогноз времени, скорости и размера пакета."""
+        files = list(self.input_files) if self.input_files else ([self.input_file] if self.input_file else [])
+        if not files or not all(os.path.exists(f) for f in files):
+            QMessageBox.warning(self, "Ошибка", "Выберите существующие видеофайлы!")
+            return
+        entries = self.batch_manifest if self.batch_manifest and len(self.batch_manifest) == len(files) else [{} for _ in files]
+        settings = self.collect_render_settings()
+        token = self._estimate_token = object()
+        self.btn_estimate.setEnabled(False)
+        self.estimate_label.setText("Оценка: анализ файлов...")
+        supervisor = get_supervisor()
+        ffprobe_cmd = self.ffprobe_path or "ffprobe"
+
+        async def _probe_all():
+            import asyncio
+            limit = asyncio.Semaphore(4)
+
+            async def _probe(path):
+                async with limit:
+                    try:
+                        return await probe_media(supervisor, ffprobe_cmd, path)
+                    except Exception:
+                        return {'duration': None, 'width': None, 'height': None, 'codec': None, 'fps': None}
+
+            try:
+                media = await asyncio.gather(*(_probe(path) for path in files))
+            except Exception as e:
+                supervisor.post(self._on_estimate_failed, token, str(e))
+                return
+            supervisor.post(self._on_estimate_probed, token, files, entries, settings, media)
+        supervisor.run_coroutine(_probe_all())
+
+    def _on_estimate_probed(self, token, files, entries, settings, media):
+        if token is not self._estimate_token:
+            return
+        supervisor = get_supervisor()
+        estimator = SampleEstimator(supervisor)
+        rates, pending, scratch = {}, [], []
+        try:
+            # Настройки, влияющие на скорость и размер (порядок пакета не влияет)
+            base = {k: v for k, v in settings.items() if k not in ("policy", "encoder")}
+            groups = {}  # (профиль, кодировщик) -> индексы файлов
+            per_title = []  # файлы, которым пакет подберёт битрейт по сложности
+            codec_selected = ("Без изменений" not in settings["video_codec"]
+                              and "исходный" not in settings["video_codec"])
+            for index, (info, entry) in enumerate(zip(media, entries)):
+                encoder = normalize_encoder(entry.get("encoder") or settings["encoder"])
+                groups.setdefault((source_profile(info), json.dumps(encoder, sort_keys=True)), []).append(index)
+                if encoder["per_title"] and codec_selected and info['duration']:
+                    per_title.append((index, encoder["quality"]))
+
+            for group, indexes in groups.items():
+                # Представитель профиля — самый длинный файл
+                rep_index = max(indexes, key=lambda i: media[i]['duration'] or 0)
+                encoder = json.loads(group[1])
+                key = SampleEstimator.cache_key(media_fingerprint(files[rep_index]), dict(base, encoder=encoder))
+                cached = estimator.lookup(key)
+                if cached:
+                    rates[group] = cached
+                    continue
+                workdir = tempfile.mkdtemp(prefix="estimate_", dir=CACHE_DIR if os.path.isdir(CACHE_DIR) else None)
+                scratch.append(workdir)
+                ext = os.path.splitext(files[rep_index])[1]
+                samples = []
+                for n, (seek, length) in enumerate(SampleEstimator.sample_points(media[rep_index]['duration'])):
+                    output = os.path.join(workdir, f"sample_{n}{ext}")
+                    cmd = self._build_render_command(files[rep_index], output, settings, encoder, seek, length,
+                                                     media=media[rep_index])
+                    samples.append((cmd, output, length))
+                pending.append((group, key, samples))
+            self.estimate_label.setText(f"Оценка: пробное кодирование ({len(pending)} профилей)..." if pending
+                                        else "Оценка: из кэша...")
+        except Exception as e:
+            # Файл исчез, кэш не пишется, неверный кодировщик в манифесте — кнопка не должна остаться выключенной
+            for workdir in scratch:
+                shutil.rmtree(workdir, ignore_errors=True)
+            self._on_estimate_failed(token, str(e))
+            return
+
+        analyzer = ComplexityAnalyzer(supervisor, self.ffmpeg_path or "ffmpeg")
+        complexity = {}
+
+        async def _measure():
+            import asyncio
+            try:
+                results = await asyncio.gather(*(estimator.measure(samples, settings["parallel"])
+                                                 for _, _, samples in pending))
+                for (group, key, _), result in zip(pending, results):
+                    rates[group] = result
+                    if result:
+                        estimator.store(key, result)
+                # Per-title: те же пробные CRF-кодирования, что сделает пакет (он возьмёт их из кэша)
+                limit = asyncio.Semaphore(max(1, settings["parallel"]))
+
+                async def _probe(index, quality):
+                    info = media[index]
+                    async with limit:
+                        try:
+                            kbps, _ = await analyzer.probe(files[index], info['duration'], quality,
+                                                           info['width'], info['height'])
+                        except Exception:
+                            kbps = None
+                    complexity[index] = kbps
+
+                await asyncio.gather(*(_probe(index, quality) for index, quality in per_title))
+            except Exception as e:
+                supervisor.post(self._on_estimate_failed, token, str(e))
+                return
+            finally:
+                for workdir in scratch:
+                    shutil.rmtree(workdir, ignore_errors=True)
+            supervisor.post(self._on_estimate_ready, token, files, media, groups, rates, settings, complexity)
+        supervisor.run_coroutine(_measure())
+
+    def _on_estimate_failed(self, token, message):
+        if token is not self._estimate_token:
+            return
+        self.btn_estimate.setEnabled(True)
+        self.estimate_label.setText("Оценка недоступна: ошибка анализа.")
+        self.log_text.append(f"⚠️ Оценка пакета не удалась: {message}")
+
+    def _on_estimate_ready(self, token, files, media, groups, rates, settings, complexity=None):
+        if token is not self._estimate_token:
+            return
+        self.btn_estimate.setEnabled(True)
+        rate_of = {index: rates.get(group) for group, indexes in groups.items() for index in indexes}
+        if complexity:
+            # Per-title файлы кодируются подобранным битрейтом — размер считаем по нему, как и пакет
+            codec = settings["video_codec"].split()[0]
+            cap = parse_bitrate_kbps(settings["bitrate"])
+            audio_kbps = parse_bitrate_kbps(settings["audio_bitrate"]) or 192
+            for index, kbps in complexity.items():
+                info = media[index]
+                if not kbps or not rate_of[index]:
+                    continue
+                output_size = self._target_size(settings["res_text"], info['width'], info['height'])
+                target = ComplexityAnalyzer.target_kbps(kbps, (info['width'], info['height']), output_size, codec, cap)
+                rate_of[index] = dict(rate_of[index], bytes_per_second=(target + audio_kbps) * 125)
+        # Порядок выполнения — как у будущего пакета
+        queue = JobQueue(settings["policy"])
+        for index, info in enumerate(media):
+            queue.push(RenderJob(index, files[index], info['duration'], info['width'], info['height']))
+        order = [queue.pop().key for _ in range(len(queue))]
+        summary = SampleEstimator.extrapolate([(media[i]['duration'], rate_of[i]) for i in order], settings["parallel"])
+        if not summary['speed']:
+            self.estimate_label.setText("Оценка недоступна: пробное кодирование не удалось.")
+            return
+        text = (f"≈ {format_eta(summary['wall_seconds'])} · {summary['speed']:.1f}x · "
+                f"{format_size(summary['output_bytes'])}")
+        if summary['unknown']:
+            text += f" (без учёта файлов: {summary['unknown']})"
+        self.estimate_label.setText(text)
+        self.log_text.append(f"Оценка пакета: {text}")
+
+    def _target_size(self, res_text, width, height):
+        """Размер кадра на выходе для выбранного разрешения (или исходный)."""
+        for key, scale in self.RESOLUTIONS.items():
+            if key in res_text:
+                w, h = scale.split(':')
+                return int(w), int(h)
+        if 'x' in res_text:
+            try:
+                w, h = res_text.split()[0].split('x')
+                return int(w), int(h)
+            except ValueError:
+                pass
+        return width, height
+
+    def _dispatch_batch(self):
+        """Занимает свободные слоты заданиями из очереди; когда всё выполнено — завершает пакет."""
+        self._prefetch_ahead()
+        while self.batch_queue and len(self.batch_workers) < self._batch_capacity():
+            verdict = self._admit(self.batch_queue.peek())
+            if verdict == 'wait':
+                break
+            job = self.batch_queue.pop()
+            if verdict == 'start':
+                self._start_batch_job(job)
+        if (self.batch_queue is not None and not self.batch_queue and not self.batch_workers
+                and not self.batch_checks and not self.batch_probing):
+            self._finish_batch()
+
+    def _estimate_output_bytes(self, job):
+        """Оценка размера результата: битрейт × длительность, иначе размер исходника."""
+        settings = self._job_settings(job)
+        kbps = job.bitrate or parse_bitrate_kbps(settings["bitrate"])
+        if kbps and job.duration:
+            audio_kbps = parse_bitrate_kbps(settings["audio_bitrate"]) or 192
+            return int((kbps + audio_kbps) * 125 * job.duration * 1.05)
+        try:
+            return os.path.getsize(job.path)
+        except OSError:
+            return 0
+
+    # Запас свободного места на томе сверх оценки и время, за которое новый процесс набирает память
+    DISK_RESERVE = 512 * 1024 * 1024
+    MEMORY_RAMP = 10.0
+    # Предел памяти процесса относительно оценки: оценка грубая, предел должен ловить только аномалии
+    MEMORY_LIMIT_FACTOR = 2.0
+
+    def _admit(self, job):
+        """Решение о запуске задания: 'start', 'wait' (ждать освобождения ресурсов) или 'reject'.
+
+        Проверяются готовность копии исходника, свободное место на томах результата и временной
+        папки, доступная память и квота временной папки. Если ничего не выполняется, ждать нечего:
+        нехватка памяти и квоты только отмечается в журнале, а задание без места на диске пропускается.
+        """
+        if self.prefetcher is not None and self.prefetcher.pending(job.key):
+            return 'wait'
+        # Проверки и публикации тоже освобождают место (временные файлы, резерв квоты) — это не простой
+        idle = not self.batch_workers and not self.batch_checks
+        job.output_estimate = self._estimate_output_bytes(job)
+        if self.settings["admission_control"]:
+            shortage = self._disk_shortage(job)
+            if shortage:
+                if not idle:
+                    return self._admit_wait(job, 'disk', shortage)
+                self._reject_job(job, shortage)
+                return 'reject'
+            encoder = normalize_encoder(job.encoder)
+            local = self._local_running() < self.batch_settings["parallel"]
+            job.memory = estimate_job_memory(max(job.width or 0, (job.source_size or (0, 0))[0]),
+                                             max(job.height or 0, (job.source_size or (0, 0))[1]),
+                                             job.codec, encoder["speed"])
+            available = available_memory() if local else None  # память удалённого узла здесь не видна
+            if available is not None:
+                # Только что запущенные процессы ещё не заняли свою память — учитываем их оценки
+                now = time.monotonic()
+                ramping = sum(other.memory for other, worker in self.batch_workers.values()
+                              if not isinstance(worker, RemoteRenderJob)
+                              and other.started is not None and now - other.started < self.MEMORY_RAMP)
+                if job.memory + ramping > available:
+                    reason = f"нужно ~{format_size(job.memory)} памяти, доступно {format_size(max(available - ramping, 0))}"
+                    if not idle:
+                        return self._admit_wait(job, 'memory', reason)
+                    self.log_text.append(f"⚠️ Видео {job.key+1}: {reason} — запускаем, других заданий нет")
+        if self.scratch is not None and not idle and not self.scratch.fits(job.output_estimate):
+            return self._admit_wait(job, 'scratch', f"место во временной папке (занято {format_size(self.scratch.reserved)} "
+                                                    f"из {format_size(self.scratch.quota_bytes)})")
+        return 'start'
+
+    def _reject_job(self, job, reason):
+        """Пропускает задание, не запуская его: считается ошибкой пакета."""
+        self.batch_failed += 1
+        self.batch_progress.finish(job.key)
+        self.log_text.append(f"⚠️ Видео {job.key+1} пропущено: {reason}")
+        self._board(job, state="failed", error=reason)
+
+    def _admit_wait(self, job, kind, reason):
+        # Одна запись в журнале на задание и причину, а не на каждый вызов диспетчера
+        if self._admit_waiting != (job.key, kind):
+            self._admit_waiting = (job.key, kind)
+            self.log_text.append(f"Видео {job.key+1} ждёт: {reason}")
+        return 'wait'
+
+    def _disk_shortage(self, job):
+        """Описание нехватки места для результата задания или None."""
+        directories = [os.path.dirname(os.path.abspath(job.output or job.path))]
+        if self.scratch is not None:
+            directories.append(self.scratch.directory)
+        # Сколько ещё допишут уже запущенные задания на каждый том
+        outstanding = collections.Counter()
+        for other, _ in self.batch_workers.values():
+            final = os.path.dirname(os.path.abspath(other.output))
+            target = other.staging or other.output
+            try:
+                written = os.path.getsize(target)
+            except OSError:
+                written = 0
+            outstanding[volume_of(target)[1]] += max(other.output_estimate - written, 0)
+            if other.staging and volume_of(final)[1] != volume_of(other.staging)[1]:
+                outstanding[volume_of(final)[1]] += other.output_estimate
+        checked = set()
+        for directory in directories:
+            try:
+                existing, volume = volume_of(directory)
+                if volume in checked:
+                    continue
+                checked.add(volume)
+                free = shutil.disk_usage(existing).free
+            except OSError:
+                continue
+            needed = job.output_estimate + outstanding[volume] + self.DISK_RESERVE
+            if needed > free:
+                return f"на томе {existing} свободно {format_size(free)}, нужно ~{format_size(needed)}"
+        return None
+
+    def _prefetch_ahead(self):
+        """Ставит в копирование исходники ближайших prefetch_depth заданий очереди."""
+        if self.prefetcher is None or not self.batch_queue:
+            return
+        for job in self.batch_queue.upcoming(self.settings["prefetch_depth"]):
+            # Порядок важен: более позднее задание не должно занять место раньше очередного
+            if not self.prefetcher.want(job.key, job.path):
+                break
+
+    def _on_prefetched(self, progress, key, ok):
+        if progress is not self.batch_progress:
+            return
+        name = os.path.basename(self.batch_files[key])
+        if ok:
+            self.log_text.append(f"Видео {key+1} скопировано в локальную папку: {name}")
+        else:
+            self.log_text.append(f"⚠️ Не удалось скопировать {name} — видео будет читаться напрямую")
+        self._dispatch_batch()
+
+    def _on_batch_time(self, key, current, total):
+        progress = self.batch_progress
+        if total:
+            progress.set_duration(key, total)
+        progress.update(key, current)
+        if key in self.batch_workers:
+            job, worker = self.batch_workers[key]
+            self._board(job, position=round(current, 1), progress=round(min(current / total, 1.0), 3) if total else 0.0,
+                        node=worker.node if isinstance(worker, RemoteRenderJob) else None)
+        self.update_batch_status()
+
+    def update_batch_status(self):
+        """Строка статуса и полоса прогресса для всего пакета с оценкой оставшегося времени."""
+        progress = self.batch_progress
+        current = min(len(progress.finished) + 1, self.batch_total)
+        names = [os.path.basename(job.path) + (f" @{worker.node}" if getattr(worker, 'node', None) else "")
+                 for job, worker in self.batch_workers.values()]
+        percent = int(progress.fraction * 100)
+        text = f"Видео {current} из {self.batch_total}"
+        if names:
+            text += ": " + ", ".join(names[:2]) + (f" +{len(names) - 2}" if len(names) > 2 else "")
+        text += f" · {percent}%"
+        eta = progress.eta()
+        if eta is not None:
+            text += f" · осталось ~{format_eta(eta)}"
+        self.batch_status_label.setText(text)
+        self.progress_bar.setValue(percent)
+        self.jobs_board.set_batch(active=True, total=self.batch_total, fraction=round(progress.fraction, 4), eta=eta)
+
+    def collect_render_settings(self):
+        """Снимок настроек рендеринга в исходных (русских) значениях, независимо от языка интерфейса."""
+        self._ensure_tab(self.TAB_AUDIO_SETTINGS)
+        return {
+            "res_text": self.combo_value(self.resolution),
+            "video_codec": self.combo_value(self.video_codec),
+            "format": self.combo_value(self.format),
+            "bitrate": self.combo_value(self.bitrate),
+            "audio_codec": self.combo_value(self.audio_codec),
+            "audio_bitrate": self.combo_value(self.audio_bitrate),
+            "audio_channels": self.combo_value(self.audio_channels),
+            "policy": self.BATCH_POLICIES.get(self.combo_value(self.batch_policy), "fifo"),
+            "parallel": self.batch_parallel.value(),
+            "encoder": self.current_encoder()
+        }
+
+    def _reserve_output_path(self, input_file, key):
+        """Свободное имя <имя>_N<расширение>, не занятое ни на диске, ни другим заданием пакета."""
         base, ext = os.path.splitext(input_file)
         i = 1
         while True:
             candidate = f"{base}_{i}{ext}"
-            if not os.path.exists(candidate):
-                output_file = candidate
-                break
+            if _path_key(candidate) not in self.batch_outputs and not os.path.exists(candidate):
+                self.batch_outputs[_path_key(candidate)] = key
+                return candidate
             i += 1
 
-        self.output_file = output_file
-        self.output_path.setText(output_file)
-
-        # Формируем команду FFmpeg с настройками
-        settings = self.batch_settings
-        resolutions = {
-            "4K": "3840:2160",
-            "1440p": "2560:1440",
-            "1080p": "1920:1080",
-            "720p": "1280:720",
-            "480p": "854:480",
-            "360p": "640:360",
-            "240p": "426:240",
-            "144p": "256:144",
-            "128p": "256:128"
-        }
+    def _build_render_command(self, input_file, output_file, settings, encoder=None, seek=None, length=None,
+                              bitrate=None, media=None):
+        """Команда FFmpeg для перекодирования одного файла с настройками пакета.
+
+        encoder — параметры кодировщика задания (по умолчанию — из настроек пакета);
+        seek/length — только фрагмент файла (для пробного кодирования);
+        bitrate — битрейт задания в кбит/с, подобранный per-title (заменяет общий битрейт и CRF);
+        media — сведения probe_media об источнике для планирования фильтров (без них — общая цепочка).
+        """
+        encoder = normalize_encoder(encoder or settings.get("encoder"))
+        if bitrate:
+            encoder = dict(encoder, rate_control="bitrate")
         ffmpeg_cmd = getattr(self, "ffmpeg_path", "ffmpeg")
-        cmd = [ffmpeg_cmd, '-i', input_file]
+        cmd = [ffmpeg_cmd]
+        if seek:
+            cmd.extend(['-ss', f"{seek:.3f}"])
+        cmd.extend(['-i', input_file])
         # Видео кодек
+        safe_codec = None
         if "Без изменений" not in settings["video_codec"] and "исходный" not in settings["video_codec"]:
             selected_codec = settings["video_codec"].split()[0]
             # Проверяем доступность выбранного кодека и при необходимости подменяем
@@ -1415,25 +3255,28 @@ class VideoConverter(QMainWindow):
             if safe_codec != selected_codec:
                 self.log_text.append(f"⚠️ Кодек {selected_codec} недоступен на этой системе — используем {safe_codec}.")
             cmd.extend(['-c:v', safe_codec])
-        # Разрешение
-        res_found = False
-        for key in resolutions:
-            if key in settings["res_text"]:
-                scale = resolutions[key]
-                cmd.extend([
-                    '-vf',
-                    f"scale={scale}:force_original_aspect_ratio=decrease,pad={scale}:(ow-iw)/2:(oh-ih)/2"
-                ])
-                res_found = True
-                break
-        if not res_found and 'x' in settings["res_text"]:
-            res = settings["res_text"].split()[0]
-            cmd.extend([
-                '-vf',
-                f"scale={res}:force_original_aspect_ratio=decrease,pad={res}:(ow-iw)/2:(oh-ih)/2"
-            ])
-        # Битрейт видео
-        if "Без изменений" not in settings["bitrate"] and "исходный" not in settings["bitrate"]:
+            args, warnings = encoder_args(safe_codec, encoder)
+            cmd.extend(args)
+            for warning in warnings:
+                self.log_text.append(f"⚠️ {warning}")
+        else:
+            # Без явного кодека режим постоянного качества применить не к чему
+            encoder = dict(encoder, rate_control="bitrate")
+        # Разрешение: вписываем кадр в рамку, пропуская тождественные масштаб и поля
+        width, height = self._target_size(settings["res_text"], None, None)
+        if width and height:
+            filters = plan_video_filters(media or {}, width, height, safe_codec)
+            if filters:
+                cmd.extend(['-vf', ",".join(filters)])
+                parallel = settings.get("parallel", 1)
+                if parallel > 1:
+                    # Параллельные задания делят ядра — потоков фильтров на каждое меньше
+                    cmd.extend(['-filter_threads', str(max(1, (os.cpu_count() or 1) // parallel))])
+        # Битрейт видео (в режиме CRF/CQ качество задаёт энкодер)
+        if bitrate and '-c:v' in cmd:
+            # Ограничиваем пики, чтобы подобранный битрейт не превышался кратно
+            cmd.extend(['-b:v', f"{bitrate}k", '-maxrate', f"{int(bitrate * 1.5)}k", '-bufsize', f"{bitrate * 3}k"])
+        elif encoder["rate_control"] == "bitrate" and "Без изменений" not in settings["bitrate"] and "исходный" not in settings["bitrate"]:
             cmd.extend(['-b:v', settings["bitrate"].split()[0]])
         # Аудио кодек
         if "Без изменений" not in settings["audio_codec"] and "исходный" not in settings["audio_codec"]:
@@ -1464,41 +3307,336 @@ class VideoConverter(QMainWindow):
                 cmd.extend(['-ac', '6'])
             elif "7.1" in settings["audio_channels"]:
                 cmd.extend(['-ac', '8'])
+        if length:
+            cmd.extend(['-t', f"{length:.3f}"])
         # Формат и выходной файл
         cmd.append(output_file)
+        return cmd
 
-        self.log_text.clear()
-        self.log_text.append(f"Начато перекодирование видео {self.batch_index+1}/{self.batch_total}...")
+    def _start_batch_job(self, job):
+        if job.output:
+            owner = self.batch_outputs.setdefault(_path_key(job.output), job.key)
+            if owner != job.key:
+                # Два задания с одним результатом (например, второе пришло через API в идущий пакет)
+                self._reject_job(job, f"файл результата уже пишет видео {owner+1}: {job.output}")
+                return
+            if job.output_created:
+                # Повтор (узел пропал, задание вернулось): недописанный файл прошлой попытки ffmpeg без -y не перезапишет
+                try:
+                    os.remove(job.output)
+                except OSError:
+                    pass
+            elif os.path.exists(job.output):
+                # Появился после разбора задания; ffmpeg без -y его не перезапишет
+                self._reject_job(job, f"файл результата уже существует: {job.output}")
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(job.output)), exist_ok=True)
+        else:
+            job.output = self._reserve_output_path(job.path, job.key)
+        self.output_file = job.output
+        self.output_path.setText(job.output)
+        # Локальные слоты заняты — задание уходит узлу; пишет он сразу в общее хранилище
+        remote = self.cluster is not None and self._local_running() >= self.batch_settings["parallel"]
+        if self.scratch is not None and not remote:
+            job.staging = self.scratch.allocate(job.output, self._estimate_output_bytes(job), force=True)
+        # Чужие и уже существующие пути отклонены выше: файл результата создаёт само задание
+        job.output_created = True
+        source = (self.prefetcher.local_path(job.key) if self.prefetcher is not None and not remote else None) or job.path
+        cmd = self._build_render_command(source, job.staging or job.output, self._job_settings(job), job.encoder,
+                                         bitrate=job.bitrate, media=job.media)
+        self.log_text.append(f"Начато перекодирование видео {job.key+1}/{self.batch_total}: {os.path.basename(job.path)}")
         self.log_text.append("Команда: " + " ".join(cmd))
-        self.progress_bar.setValue(0)
 
-        self.worker = FFmpegWorker(cmd)
-        self.worker.progressUpdated.connect(self.update_progress)
-        self.worker.outputReceived.connect(self.log_text.append)
-        self.worker.finished.connect(self.batch_render_finished)
-        self.worker.start()
+        memory_limit = int(job.memory * self.MEMORY_LIMIT_FACTOR) if self.settings["memory_limit"] and job.memory else None
+        if remote:
+            worker = RemoteRenderJob(self.cluster.coordinator, cmd[1:], job.duration, memory_limit, job.output)
+            worker.returned.connect(lambda job=job: self._on_remote_returned(job))
+        else:
+            worker = FFmpegWorker(cmd, memory_limit)
+        job.started = time.monotonic()
+        self.batch_workers[job.key] = (job, worker)
+        self.batch_progress.start(job.key)
+        self._board(job, state="running", output=job.output, progress=0.0, position=None, node=None)
+        worker.timeUpdated.connect(lambda current, total, key=job.key: self._on_batch_time(key, current, total))
+        if self._batch_capacity() > 1:
+            # Вывод нескольких процессов перемешивается — помечаем строки номером видео
+            worker.outputReceived.connect(lambda line, tag=f"[{job.key+1}] ": self.log_text.append(tag + line))
+        else:
+            worker.outputReceived.connect(self.log_text.append)
+        worker.finished.connect(lambda success, job=job: self.batch_render_finished(job, success))
+        self.update_batch_status()
+        worker.start()
+        if remote:
+            self.remote_jobs[worker.job_id] = worker
 
-    def batch_render_finished(self, success):
-        if success:
-            self.log_text.append(f"Видео {self.batch_index+1} успешно перекодировано!")
+    def _on_remote_returned(self, job):
+        """Узлов не осталось — задание снова в очереди пакета и выполнится локально."""
+        self.batch_workers.pop(job.key, None)
+        self.log_text.append(f"⚠️ Видео {job.key+1}: нет доступных узлов — задание возвращено в очередь")
+        self.batch_progress.reset(job.key)
+        self._board(job, state="queued", node=None)
+        if self.batch_queue is not None:
+            self.batch_queue.push(job)
+            self._dispatch_batch()
+
+    def batch_render_finished(self, job, success):
+        self.batch_workers.pop(job.key, None)
+        if self.prefetcher is not None:
+            self.prefetcher.release(job.key)
+        self.batch_progress.finish(job.key)
+        self.output_file = job.output
+        if job.cancelled:
+            if job.staging:
+                self.scratch.release(job.staging)
+                job.staging = None
+            elif job.output_created:
+                try:
+                    os.remove(job.output)  # недописанный файл
+                except OSError:
+                    pass
+            self.log_text.append(f"Видео {job.key+1} отменено")
+            self._board(job, state="cancelled")
+        elif success:
+            self.log_text.append(f"Видео {job.key+1} успешно перекодировано!")
+            self._board(job, state="verifying", progress=1.0)
+            if job.deadline is not None and time.time() > job.deadline:
+                self.log_text.append(f"⚠️ Видео {job.key+1} готово позже срока.")
+            if self.settings["verify_integrity"]:
+                self._check_integrity(job)
+            else:
+                self._publish(job)
         else:
-            self.log_text.append(f"Ошибка при перекодировании видео {self.batch_index+1}!")
-            QMessageBox.critical(self, "Ошибка", f"Ошибка при обработке видео {self.batch_index+1}")
-
-        self.batch_index += 1
-        # Обновляем статус для следующего файла
-        if self.batch_index < self.batch_total:
-            next_file = self.batch_files[self.batch_index]
-            self.batch_status_label.setText(
-                f"Видео {self.batch_index+1} из {self.batch_total}: {os.path.basename(next_file)}"
-            )
-            self.render_next_in_batch()
+            if job.staging:
+                self.scratch.release(job.staging)
+                job.staging = None
+            self.batch_failed += 1
+            self.log_text.append(f"Ошибка при перекодировании видео {job.key+1}!")
+            self._board(job, state="failed", error="ошибка ffmpeg")
+            if self.batch_total == 1:
+                # В пакете окно на каждую ошибку останавливало бы работу — итог будет в конце пакета
+                QMessageBox.critical(self, "Ошибка", f"Ошибка при обработке видео {job.key+1}")
+        self._dispatch_batch()
+
+    def _check_integrity(self, job):
+        """Структурная проверка результата в фоне; при ошибке задание возвращается в очередь."""
+        supervisor = get_supervisor()
+        progress = self.batch_progress
+        ffmpeg_cmd = self.ffmpeg_path or "ffmpeg"
+        ffprobe_cmd = self.ffprobe_path or "ffprobe"
+        tail = 3.0 if self.settings["verify_tail_decode"] else 0
+        self.batch_checks.add(job.key)
+
+        async def _run():
+            notes, error = [], None
+            try:
+                problems = await check_integrity(supervisor, ffprobe_cmd, ffmpeg_cmd, job.path,
+                                                 job.staging or job.output, tail, notes)
+            except Exception as e:
+                # Сбой самой проверки (таймаут, нет ffprobe) ничего не говорит о файле
+                problems, error = [], e
+            supervisor.post(self._on_integrity_checked, progress, job, problems, notes, error)
+        supervisor.run_coroutine(_run())
+
+    def _on_integrity_checked(self, progress, job, problems, notes=(), error=None):
+        if progress is not self.batch_progress:
+            return
+        self.batch_checks.discard(job.key)
+        for note in notes:
+            self.log_text.append(f"⚠️ Видео {job.key+1}: {note}")
+        if error is not None:
+            self.log_text.append(f"⚠️ Видео {job.key+1}: проверка целостности не выполнена "
+                                 f"({str(error) or type(error).__name__}) — результат сохранён без проверки.")
+            self._publish(job)
+            self._dispatch_batch()
+            return
+        if not problems:
+            self.log_text.append(f"Видео {job.key+1}: проверка целостности пройдена.")
+            self._publish(job)
+            self._dispatch_batch()
+            return
+        self.log_text.append(f"⚠️ Видео {job.key+1}: результат повреждён — " + "; ".join(problems))
+        if job.staging:
+            self.scratch.release(job.staging)
+            job.staging = None
         else:
-            self.batch_status_label.setText("Пакетное перекодирование завершено!")
-            # Показываем уведомление только после последнего файла
-            if success and self.settings["show_video_notifications"]:
-                dialog = NotificationDialog(self.output_file, self)
-                dialog.exec()
+            try:
+                os.remove(job.output)
+            except OSError:
+                pass
+        job.attempts += 1
+        if job.attempts < self.MAX_RENDER_ATTEMPTS:
+            self.log_text.append(f"Видео {job.key+1} возвращено в очередь (попытка {job.attempts + 1} из {self.MAX_RENDER_ATTEMPTS}).")
+            self.batch_progress.reset(job.key)
+            self._board(job, state="queued", progress=0.0, error="; ".join(problems))
+            self.batch_queue.push(job)
+        else:
+            self.batch_failed += 1
+            self.log_text.append(f"Ошибка: видео {job.key+1} не прошло проверку целостности после {job.attempts} попыток!")
+            self._board(job, state="failed", error="; ".join(problems))
+        self._dispatch_batch()
+
+    # Сколько раз искать новое имя, если место назначения заняли, пока шло кодирование
+    PUBLISH_ATTEMPTS = 10
+
+    def _publish(self, job, attempt=1):
+        """Переносит проверенный результат из временной папки в место назначения (в фоне)."""
+        if not job.staging:
+            if self.settings["verify_quality"]:
+                self._verify_quality(job)
+            else:
+                self._board(job, state="done", output=job.output)
+            return
+        supervisor = get_supervisor()
+        progress = self.batch_progress
+        scratch = self.scratch
+        self.batch_checks.add(job.key)
+
+        async def _run():
+            import asyncio
+            loop = asyncio.get_running_loop()
+            error = None
+            try:
+                await loop.run_in_executor(None, scratch.publish, job.staging, job.output)
+            except OSError as e:
+                error = e
+            supervisor.post(self._on_published, progress, job, job.output, error, attempt)
+        supervisor.run_coroutine(_run())
+
+    def _on_published(self, progress, job, target, error, attempt=1):
+        if progress is not self.batch_progress:
+            return
+        self.batch_checks.discard(job.key)
+        if isinstance(error, FileExistsError) and attempt < self.PUBLISH_ATTEMPTS:
+            # Имя заняли, пока шло кодирование, — берём следующее свободное имя пакета
+            job.output = self._reserve_output_path(job.path, job.key)
+            self.log_text.append(f"⚠️ Видео {job.key+1}: {target} уже существует — сохраняем как {job.output}")
+            self._publish(job, attempt + 1)
+            return
+        if error is not None:
+            self.batch_failed += 1
+            # Файл остаётся во временной папке, но резерв квоты больше не нужен
+            self.scratch.release(job.staging, remove=False)
+            self.log_text.append(f"Ошибка публикации видео {job.key+1}: {error}. Файл оставлен в {job.staging}")
+            self._board(job, state="failed", error=f"публикация: {error}")
+        else:
+            job.staging = None
+            job.output = self.output_file = target
+            self.log_text.append(f"Видео {job.key+1} опубликовано: {target}")
+            if self.settings["verify_quality"]:
+                self._verify_quality(job)
+            else:
+                self._board(job, state="done", output=target)
+        self._dispatch_batch()
+
+    def _verify_quality(self, job):
+        """Запускает выборочную проверку SSIM/PSNR; следующее задание стартует не дожидаясь её."""
+        supervisor = get_supervisor()
+        progress = self.batch_progress
+        ffmpeg_cmd = self.ffmpeg_path or "ffmpeg"
+        ffprobe_cmd = self.ffprobe_path or "ffprobe"
+        windows = self.settings["verify_windows"]
+        self.batch_checks.add(job.key)
+
+        async def _run():
+            try:
+                scores = await measure_quality(supervisor, ffmpeg_cmd, ffprobe_cmd, job.path, job.output, windows)
+            except Exception:
+                scores = None
+            supervisor.post(self._on_quality_checked, progress, job, scores)
+        supervisor.run_coroutine(_run())
+
+    def _on_quality_checked(self, progress, job, scores):
+        if progress is not self.batch_progress:
+            return
+        self.batch_checks.discard(job.key)
+        job.quality = scores
+        if scores is None:
+            self.log_text.append(f"⚠️ Видео {job.key+1}: не удалось измерить качество.")
+        else:
+            psnr = f", PSNR {scores['psnr']:.2f} дБ" if scores['psnr'] is not None else ""
+            self.log_text.append(f"Видео {job.key+1}: SSIM {scores['ssim']:.4f} (мин. {scores['ssim_min']:.4f}){psnr}, "
+                                 f"фрагментов: {scores['windows']}")
+            threshold = self.settings["verify_ssim_min"]
+            if scores['ssim_min'] < threshold:
+                self.batch_flagged.append(job)
+                self.log_text.append(f"⚠️ Видео {job.key+1}: SSIM ниже порога {threshold:.3f} — проверьте {job.output}")
+        self._board(job, state="done", output=job.output, quality=scores)
+        self._dispatch_batch()
+
+    def _finish_batch(self):
+        self.batch_queue = None
+        self.jobs_board.set_batch(active=False, fraction=1.0, eta=None)
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+            self.prefetcher = None
+        self.batch_status_label.setText("Пакетное перекодирование завершено!")
+        self.log_text.append("Пакетное перекодирование завершено!")
+        if self.batch_failed:
+            self.log_text.append(f"⚠️ Не удалось обработать видео: {self.batch_failed} из {self.batch_total}")
+        if self.batch_flagged:
+            names = ", ".join(os.path.basename(job.output) for job in self.batch_flagged)
+            self.log_text.append(f"⚠️ Качество ниже порога: {names}")
+        self.progress_bar.setValue(100)
+        # Уведомление — только после последнего файла и если ошибок не было
+        if not self.batch_failed and self.settings["show_video_notifications"]:
+            dialog = NotificationDialog(self.output_file, self)
+            dialog.exec()
+
+    def start_smart_trim(self):
+        """Обрезает текущий файл: целые GOP копируются, перекодируются только границы."""
+        if not self.input_file or not os.path.exists(self.input_file):
+            QMessageBox.warning(self, "Ошибка", "Выберите видеофайл!")
+            return
+        # Пустое поле — начало/конец файла; неверное значение не подменяем молча
+        start = parse_timecode(self.trim_start.text())
+        end = parse_timecode(self.trim_end.text())
+        for field, value in ((self.trim_start, start), (self.trim_end, end)):
+            if value is None and field.text().strip():
+                QMessageBox.warning(self, "Ошибка", f"Неверный формат времени: {field.text().strip()}")
+                return
+        if start is None:
+            start = 0.0
+        try:
+            duration = float(self.video_info.get('format', {}).get('duration', 0))
+        except (TypeError, ValueError):
+            duration = 0.0
+        if not math.isfinite(duration):
+            duration = 0.0
+        if end is None:
+            end = duration
+        elif duration > 0:
+            end = min(end, duration)  # конец за пределами файла — до конца файла
+        if end <= start:
+            QMessageBox.warning(self, "Ошибка", "Конец обрезки должен быть позже начала!")
+            return
+
+        output_file = self.output_path.text().strip()
+        if not output_file:
+            base, ext = os.path.splitext(self.input_file)
+            i = 1
+            while True:
+                output_file = f"{base}_trim_{i}{ext}"
+                if not os.path.exists(output_file):
+                    break
+                i += 1
+            self.output_path.setText(output_file)
+        self.output_file = output_file
+
+        self.log_text.clear()
+        self.log_text.append(f"Начата обрезка: {os.path.basename(self.input_file)} -> {output_file}")
+        self.progress_bar.setValue(0)
+        self.btn_trim.setEnabled(False)
+        self.trim_job = SmartTrimJob(
+            self.ffmpeg_path, self.ffprobe_path, self.input_file, output_file, start, end,
+            on_log=self.log_text.append,
+            on_progress=self.update_progress,
+            on_finished=self.trim_finished
+        )
+        self.trim_job.start()
+
+    def trim_finished(self, success):
+        self.btn_trim.setEnabled(True)
+        self.render_finished(success)
 
     def extract_audio(self):
         if not self.input_file:
@@ -1507,7 +3645,7 @@ class VideoConverter(QMainWindow):
             
         # Определяем путь для аудио
         base_name = os.path.splitext(self.input_file)[0]
-        audio_format = self.audio_format.currentText()
+        audio_format = self.combo_value(self.audio_format)
         output_file = f"{base_name}.{audio_format}"
         
         # Команда FFmpeg
@@ -1555,7 +3693,7 @@ class VideoConverter(QMainWindow):
             
             # Определяем путь к аудио файлу
             base_name = os.path.splitext(self.input_file)[0]
-            audio_format = self.audio_format.currentText()
+            audio_format = self.combo_value(self.audio_format)
             output_file = f"{base_name}.{audio_format}"
             
             # Показываем уведомление, если включено в настройках
@@ -1566,105 +3704,4238 @@ class VideoConverter(QMainWindow):
             self.log_text.append("Ошибка при извлечении аудио!")
             QMessageBox.critical(self, "Ошибка", "Произошла ошибка при извлечении аудио")
 
-class FFmpegWorker(QThread):
-    progressUpdated = pyqtSignal(int)
-    outputReceived = pyqtSignal(str)
-    finished = pyqtSignal(bool)
+# ========== Асинхронный супервизор процессов FFmpeg ==========
+def _parse_ffmpeg_time(value):
+    """Переводит строку вида '01:02:03.45' в секунды. Возвращает None, если разобрать не удалось."""
+    try:
+        h, m, s = value.strip().split(":")
+        return int(h) * 3600 + int(m) * 60 + float(s)
+    except Exception:
+        return None
 
-    def __init__(self, command):
+
+class FFmpegProgressParser:
+    """Инкрементальный разбор вывода ffmpeg.
+
+    Принимает сырые байты из пайпа, режет их на строки по '\r' и '\n' (строки прогресса ffmpeg
+    завершаются '\r') и извлекает Duration / time= / speed=. Длина незавершённой строки ограничена.
+    """
+    MAX_LINE = 8192
+
+    def __init__(self, total_duration=None):
+        self._buf = bytearray()
+        self.total_duration = total_duration
+        self.current_time = None
+        self.speed = None
+
+    def feed(self, data):
+        """Добавляет порцию байт и возвращает список завершённых строк."""
+        self._buf += data
+        parts = self._buf.replace(b'\r', b'\n').split(b'\n')
+        # Последний элемент — незавершённая строка, остаётся в буфере
+        self._buf = bytearray(parts.pop())
+        lines = [p.decode('utf-8', errors='replace') for p in parts if p]
+        # Защита от бесконечной строки без перевода строки
+        if len(self._buf) > self.MAX_LINE:
+            lines.append(bytes(self._buf).decode('utf-8', errors='replace'))
+            self._buf.clear()
+        for line in lines:
+            self.parse_line(line)
+        return lines
+
+    def flush(self):
+        """Возвращает остаток буфера как последнюю строку (при завершении процесса)."""
+        if not self._buf:
+            return []
+        line = bytes(self._buf).decode('utf-8', errors='replace')
+        self._buf.clear()
+        self.parse_line(line)
+        return [line]
+
+    def parse_line(self, line):
+        if "Duration:" in line and self.total_duration is None:
+            self.total_duration = _parse_ffmpeg_time(line.split("Duration:")[1].split(",")[0])
+        elif "time=" in line:
+            current = _parse_ffmpeg_time(line.split("time=")[1].split()[0])
+            if current is not None:
+                self.current_time = current
+            if "speed=" in line:
+                try:
+                    self.speed = float(line.split("speed=")[1].split()[0].rstrip('x'))
+                except Exception:
+                    pass
+
+    @property
+    def percent(self):
+        if not self.total_duration or self.current_time is None:
+            return None
+        return max(0, min(100, int(self.current_time * 100 / self.total_duration)))
+
+
+_ERROR_SINK = None  # (SupervisorBridge, callback) — журнал окна, см. set_error_sink
+
+
+def set_error_sink(callback):
+    """Дублирует сообщения report_error в callback(text) в потоке GUI (журнал окна); None — отключить.
+
+    Вызывать из потока GUI.
+    """
+    global _ERROR_SINK
+    _ERROR_SINK = (SupervisorBridge(), callback) if callback is not None else None
+
+
+def _deliver_error(callback, message):
+    try:
+        callback(message)
+    except Exception:
+        pass  # окно уже закрыто; сообщение есть в stderr или ERROR_LOG_FILE
+
+
+def report_error(message):
+    """Сообщение об ошибке фонового кода (из любого потока), чтобы она не терялась молча.
+
+    Пишется в stderr, а если его нет (оконный exe) — в ERROR_LOG_FILE; вдобавок — в журнал окна,
+    если оно задало приёмник через set_error_sink.
+    """
+    message = message.rstrip("\n")
+    if sys.stderr is not None:
+        print(message, file=sys.stderr)
+    else:
+        try:
+            with open(ERROR_LOG_FILE, 'a', encoding='utf-8') as f:
+                f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {message}\n")
+        except OSError:
+            pass
+    sink = _ERROR_SINK
+    if sink is not None:
+        bridge, callback = sink
+        bridge.post(_deliver_error, callback, message)
+
+
+def report_callback_error(callback):
+    """Трассировка исключения из колбэка: колбэки вызываются из очереди, и иначе ошибка теряется."""
+    name = getattr(callback, '__qualname__', None) or repr(callback)
+    report_error(f"⚠️ Ошибка в обработчике {name}:\n{traceback.format_exc()}")
+
+
+class SupervisorBridge(QObject):
+    """Единая потокобезопасная очередь событий из потока супервизора в поток Qt.
+
+    Колбэки складываются в deque, а сигнал wake испускается только при переходе очереди
+    из пустого состояния в непустое — поток GUI разбирает всю накопленную пачку за раз.
+    """
+    wake = pyqtSignal()
+
+    def __init__(self):
+        super().__init__()
+        self._queue = collections.deque()
+        self._lock = threading.Lock()
+        self._pending = False
+        self.wake.connect(self._drain)
+
+    def post(self, callback, *args):
+        with self._lock:
+            self._queue.append((callback, args))
+            if self._pending:
+                return
+            self._pending = True
+        self.wake.emit()
+
+    def _drain(self):
+        with self._lock:
+            items = list(self._queue)
+            self._queue.clear()
+            self._pending = False
+        for callback, args in items:
+            try:
+                callback(*args)
+            except Exception:
+                # Ошибка в одном обработчике не должна ломать остальные, но и пропадать молча не должна
+                report_callback_error(callback)
+
+
+class ProcessHandle:
+    """Описатель дочернего процесса, которым управляет ProcessSupervisor."""
+    TAIL_LINES = 200
+
+    def __init__(self, supervisor, command):
+        self.supervisor = supervisor
+        self.command = list(command)
+        self.parser = FFmpegProgressParser()
+        self.tail = collections.deque(maxlen=self.TAIL_LINES)
+        self.returncode = None
+        self.cancelled = False
+        self.memory_limit = None
+        self._proc = None
+
+    @property
+    def running(self):
+        return self._proc is not None and self.returncode is None
+
+    @property
+    def pid(self):
+        return self._proc.pid if self._proc is not None else None
+
+    def cancel(self):
+        """Прерывает процесс (безопасно вызывать из любого потока)."""
+        self.cancelled = True
+        self.supervisor.call_soon(self._kill)
+
+    def _kill(self):
+        if self._proc is not None and self.returncode is None:
+            try:
+                self._proc.kill()
+            except ProcessLookupError:
+                pass
+
+
+class ProcessSupervisor:
+    """Один event loop asyncio в фоновом потоке, который обслуживает все процессы ffmpeg/ffprobe.
+
+    Пайпы читаются в бинарном неблокирующем режиме, вывод разбирается инкрементально, буферы
+    ограничены. Результаты передаются в поток Qt через SupervisorBridge, поэтому сотня
+    одновременных процессов стоит одного потока, а не сотни QThread.
+    """
+    READ_CHUNK = 64 * 1024
+    MAX_CAPTURE = 64 * 1024 * 1024
+
+    def __init__(self, bridge=None):
+        self.bridge = bridge
+        self._loop = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._handles = set()
+        self.memory_limiter = None  # создаётся при первом процессе с пределом памяти
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run_loop, name="ffmpeg-supervisor", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run_loop(self):
+        import asyncio
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        self._ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    def post(self, callback, *args):
+        """Доставляет колбэк в поток Qt (или вызывает сразу, если моста нет — headless режим)."""
+        if callback is None:
+            return
+        if self.bridge is not None:
+            self.bridge.post(callback, *args)
+        else:
+            try:
+                callback(*args)
+            except Exception:
+                report_callback_error(callback)
+
+    def call_soon(self, callback, *args):
+        self.start()
+        self._loop.call_soon_threadsafe(callback, *args)
+
+    def run_coroutine(self, coro):
+        """Запускает корутину в цикле супервизора; возвращает concurrent.futures.Future."""
+        import asyncio
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    @staticmethod
+    def _spawn_kwargs():
+        kwargs = {}
+        if sys.platform == 'win32':
+            kwargs['creationflags'] = subprocess.CREATE_NO_WINDOW
+        return kwargs
+
+    async def spawn(self, command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, low_priority=False,
+                    preexec_fn=None):
+        """Запускает процесс; low_priority — пониженный приоритет планировщика ОС (фоновые задачи).
+
+        preexec_fn (только POSIX) выполняется в дочернем процессе до exec — см. MemoryLimiter.prepare.
+        """
+        import asyncio
+        kwargs = self._spawn_kwargs()
+        if low_priority and sys.platform == 'win32':
+            kwargs['creationflags'] |= subprocess.BELOW_NORMAL_PRIORITY_CLASS
+        if preexec_fn is not None:
+            kwargs['preexec_fn'] = preexec_fn
+        proc = await asyncio.create_subprocess_exec(
+            *command,
+            stdin=subprocess.DEVNULL,
+            stdout=stdout,
+            stderr=stderr,
+            **kwargs
+        )
+        if low_priority and hasattr(os, 'setpriority'):
+            try:
+                os.setpriority(os.PRIO_PROCESS, proc.pid, 10)
+            except OSError:
+                pass
+        return proc
+
+    def submit(self, command, on_lines=None, on_progress=None, on_finished=None, memory_limit=None):
+        """Запускает долгий процесс (рендер, извлечение) с разбором прогресса.
+
+        Колбэки вызываются в потоке Qt: on_lines(list[str]), on_progress(handle),
+        on_finished(handle). stderr объединяется со stdout, как и раньше в FFmpegWorker.
+        memory_limit — предел памяти процесса в байтах (см. MemoryLimiter).
+        """
+        handle = ProcessHandle(self, command)
+        handle.memory_limit = memory_limit
+        self.run_coroutine(self._supervise(handle, on_lines, on_progress, on_finished))
+        return handle
+
+    async def _supervise(self, handle, on_lines, on_progress, on_finished):
+        preexec, group = None, None
+        if handle.memory_limit:
+            if self.memory_limiter is None:
+                self.memory_limiter = MemoryLimiter()
+            preexec, group = self.memory_limiter.prepare(handle.memory_limit)
+            if preexec is None:
+                self.post(on_lines, ["⚠️ Ограничение памяти процесса не поддерживается в этой системе"])
+        try:
+            proc = await self.spawn(handle.command, stderr=subprocess.STDOUT, preexec_fn=preexec)
+        except Exception as e:
+            if group:
+                self.memory_limiter.release(group)
+            handle.returncode = -1
+            handle.tail.append(f"Ошибка: {e}")
+            self.post(on_lines, [f"Ошибка: {e}"])
+            self.post(on_finished, handle)
+            return
+        handle._proc = proc
+        self._handles.add(handle)
+        if handle.cancelled:
+            handle._kill()
+        parser = handle.parser
+        last_percent = None
+        last_time = None
+        try:
+            while True:
+                chunk = await proc.stdout.read(self.READ_CHUNK)
+                if not chunk:
+                    break
+                lines = parser.feed(chunk)
+                if lines:
+                    handle.tail.extend(lines)
+                    self.post(on_lines, lines)
+                # Отправляем прогресс только при изменении, чтобы не заваливать поток GUI
+                # Без известной длительности percent всегда None — тогда прогресс двигает только время
+                if parser.current_time != last_time or parser.percent != last_percent:
+                    last_time = parser.current_time
+                    last_percent = parser.percent
+                    self.post(on_progress, handle)
+            rest = parser.flush()
+            if rest:
+                handle.tail.extend(rest)
+                self.post(on_lines, rest)
+            handle.returncode = await proc.wait()
+        finally:
+            self._handles.discard(handle)
+            if group:
+                self.memory_limiter.release(group)
+            if handle.returncode is None:
+                handle.returncode = -1
+            self.post(on_finished, handle)
+
+    def run(self, command, timeout=None, max_output=None):
+        """Выполняет короткий процесс (ffprobe, ffmpeg -encoders) и собирает вывод.
+
+        Возвращает concurrent.futures.Future с subprocess.CompletedProcess (stdout/stderr — bytes).
+        """
+        return self.run_coroutine(self.capture(command, timeout, max_output))
+
+    async def capture(self, command, timeout=None, max_output=None, low_priority=False):
+        import asyncio
+        limit = max_output or self.MAX_CAPTURE
+        proc = await self.spawn(command, low_priority=low_priority)
+
+        async def _read_all(stream):
+            data = bytearray()
+            while True:
+                chunk = await stream.read(self.READ_CHUNK)
+                if not chunk:
+                    return bytes(data)
+                data += chunk
+                if len(data) > limit:
+                    proc.kill()
+                    raise RuntimeError(f"Слишком большой вывод процесса (> {limit} байт)")
+
+        try:
+            out, err = await asyncio.wait_for(
+                asyncio.gather(_read_all(proc.stdout), _read_all(proc.stderr)), timeout)
+            returncode = await proc.wait()
+        except BaseException:
+            if proc.returncode is None:
+                try:
+                    proc.kill()
+                except ProcessLookupError:
+                    pass
+                await proc.wait()
+            raise
+        return subprocess.CompletedProcess(command, returncode, out, err)
+
+    def shutdown(self):
+        """Прерывает все процессы и останавливает цикл."""
+        if self._loop is None:
+            return
+
+        def _stop():
+            for handle in list(self._handles):
+                handle._kill()
+            self._loop.stop()
+        try:
+            self._loop.call_soon_threadsafe(_stop)
+        except RuntimeError:
+            return
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+
+_SUPERVISOR = None
+
+
+def get_supervisor():
+    """Возвращает общий супервизор процессов. Первый вызов должен произойти в потоке GUI."""
+    global _SUPERVISOR
+    if _SUPERVISOR is None:
+        bridge = SupervisorBridge() if QCoreApplication.instance() is not None else None
+        _SUPERVISOR = ProcessSupervisor(bridge)
+        _SUPERVISOR.start()
+    return _SUPERVISOR
+
+
+def run_process(command, timeout=None, check=False):
+    """Синхронная обёртка над ProcessSupervisor.run для коротких вызовов ffprobe/ffmpeg."""
+    import asyncio
+    future = get_supervisor().run(command, timeout=timeout)
+    try:
+        result = future.result()
+    except asyncio.TimeoutError:
+        raise subprocess.TimeoutExpired(command, timeout)
+    if check and result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, command, result.stdout, result.stderr)
+    return result
+
+
+# ========== Индекс ключевых кадров и пакетов ==========
+class MediaIndex:
+    """Компактный индекс пакетов первого видеопотока файла.
+
+    Строится одним потоковым проходом `ffprobe -show_packets` (только нужные поля), хранит
+    pts, смещения и размеры пакетов в array-массивах и отдельно отсортированные pts ключевых
+    кадров для бинарного поиска. Сохраняется в CACHE_DIR/index и сбрасывается при изменении
+    размера или mtime файла.
+    """
+    MAGIC = b'CCIX'
+    VERSION = 2                # 2: целые массивы 'q' — одинаковый размер элемента на всех платформах
+    MEMORY_ENTRIES = 16        # сколько индексов держать в памяти (последние открытые)
+    _memory = collections.OrderedDict()
+    _pending = {}              # путь -> задача загрузки/построения (только в цикле супервизора)
+
+    def __init__(self, path, size, mtime_ns):
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.pts = array.array('d')        # pts пакетов в порядке декодирования
+        self.pos = array.array('q')        # смещение пакета в файле (-1, если неизвестно)
+        self.sizes = array.array('q')      # размер пакета в байтах
+        self.key_packets = array.array('q')  # номера пакетов с ключевыми кадрами
+        self.key_pts = array.array('d')      # отсортированные pts ключевых кадров
+
+    def __len__(self):
+        return len(self.pts)
+
+    @staticmethod
+    def cache_path(path):
+        digest = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()
+        return os.path.join(CACHE_DIR, "index", digest + ".idx")
+
+    @staticmethod
+    def _stat(path):
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns
+
+    def is_valid(self):
+        try:
+            return self._stat(self.path) == (self.size, self.mtime_ns)
+        except OSError:
+            return False
+
+    # --- поиск
+
+    def keyframe_before(self, t):
+        """Последний ключевой кадр с pts <= t (или None)."""
+        i = bisect.bisect_right(self.key_pts, t)
+        return self.key_pts[i - 1] if i > 0 else None
+
+    def keyframe_after(self, t):
+        """Первый ключевой кадр с pts >= t (или None)."""
+        i = bisect.bisect_left(self.key_pts, t)
+        return self.key_pts[i] if i < len(self.key_pts) else None
+
+    def nearest_keyframe(self, t):
+        before, after = self.keyframe_before(t), self.keyframe_after(t)
+        if before is None:
+            return after
+        if after is None:
+            return before
+        return before if t - before <= after - t else after
+
+    def keyframes_between(self, start, end):
+        lo = bisect.bisect_left(self.key_pts, start)
+        hi = bisect.bisect_right(self.key_pts, end)
+        return list(self.key_pts[lo:hi])
+
+    @property
+    def duration(self):
+        return (max(self.pts) - min(self.pts)) if self.pts else 0.0
+
+    # --- построение
+
+    def _add_line(self, line):
+        fields = line.split(',')
+        if len(fields) < 5:
+            return
+        pts_s, dts_s, size_s, pos_s, flags = fields[:5]
+        try:
+            pts = float(pts_s if pts_s not in ('', 'N/A') else dts_s)
+            size = int(size_s)
+        except ValueError:
+            return
+        try:
+            pos = int(pos_s)
+        except ValueError:
+            pos = -1
+        if 'K' in flags:
+            self.key_packets.append(len(self.pts))
+            self.key_pts.append(pts)
+        self.pts.append(pts)
+        self.sizes.append(size)
+        self.pos.append(pos)
+
+    @classmethod
+    async def build(cls, supervisor, ffprobe_cmd, path):
+        size, mtime_ns = cls._stat(path)
+        index = cls(path, size, mtime_ns)
+        cmd = [
+            ffprobe_cmd, '-v', 'error', '-select_streams', 'v:0',
+            '-show_entries', 'packet=pts_time,dts_time,size,pos,flags',
+            '-of', 'csv=p=0', path
+        ]
+        proc = await supervisor.spawn(cmd, stderr=subprocess.DEVNULL)
+        tail = b''
+        while True:
+            chunk = await proc.stdout.read(supervisor.READ_CHUNK)
+            if not chunk:
+                break
+            lines = (tail + chunk).split(b'\n')
+            tail = lines.pop()
+            for line in lines:
+                index._add_line(line.decode('ascii', errors='replace').strip())
+        if tail:
+            index._add_line(tail.decode('ascii', errors='replace').strip())
+        returncode = await proc.wait()
+        if returncode != 0:
+            raise RuntimeError(f"ffprobe вернул {returncode} при индексации {path}")
+        index.key_pts = array.array('d', sorted(index.key_pts))
+        return index
+
+    # --- хранение
+
+    def save(self):
+        target = self.cache_path(self.path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        header = json.dumps({
+            "path": os.path.abspath(self.path), "size": self.size, "mtime_ns": self.mtime_ns,
+            "packets": len(self.pts), "keyframes": len(self.key_pts)
+        }).encode('utf-8')
+        tmp = target + ".tmp"
+        with open(tmp, 'wb') as f:
+            f.write(self.MAGIC + struct.pack('<HI', self.VERSION, len(header)) + header)
+            for arr in (self.pts, self.pos, self.sizes, self.key_packets, self.key_pts):
+                arr.tofile(f)
+        os.replace(tmp, target)
+
+    @classmethod
+    def load(cls, path):
+        """Загружает индекс из кэша; возвращает None, если его нет или файл изменился."""
+        try:
+            size, mtime_ns = cls._stat(path)
+            with open(cls.cache_path(path), 'rb') as f:
+                if f.read(4) != cls.MAGIC:
+                    return None
+                version, header_len = struct.unpack('<HI', f.read(6))
+                if version != cls.VERSION:
+                    return None
+                header = json.loads(f.read(header_len).decode('utf-8'))
+                if header.get("size") != size or header.get("mtime_ns") != mtime_ns:
+                    return None
+                index = cls(path, size, mtime_ns)
+                packets, keyframes = header["packets"], header["keyframes"]
+                index.pts.fromfile(f, packets)
+                index.pos.fromfile(f, packets)
+                index.sizes.fromfile(f, packets)
+                index.key_packets.fromfile(f, keyframes)
+                index.key_pts.fromfile(f, keyframes)
+                return index
+        except (OSError, ValueError, KeyError, EOFError, struct.error):
+            return None
+
+    @classmethod
+    async def open_async(cls, supervisor, ffprobe_cmd, path):
+        """Индекс из памяти, с диска или построенный заново (с сохранением в кэш).
+
+        Одновременные запросы одного файла (анализ при открытии и обрезка сразу за ним) ждут
+        одно построение, а не запускают каждый свой проход ffprobe по всему файлу.
+        """
+        import asyncio
+        key = os.path.abspath(path)
+        index = cls._memory.get(key)
+        if index is not None and index.is_valid():
+            cls._memory.move_to_end(key)
+            return index
+        task = cls._pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(cls._load_or_build(supervisor, ffprobe_cmd, path, key))
+            cls._pending[key] = task
+            task.add_done_callback(lambda _, key=key: cls._pending.pop(key, None))
+        # Отмена одного ожидающего не должна прерывать построение для остальных
+        return await asyncio.shield(task)
+
+    @classmethod
+    async def _load_or_build(cls, supervisor, ffprobe_cmd, path, key):
+        index = cls.load(path)
+        if index is None:
+            index = await cls.build(supervisor, ffprobe_cmd, path)
+            try:
+                index.save()
+            except OSError:
+                pass
+        cls._memory[key] = index
+        cls._memory.move_to_end(key)
+        while len(cls._memory) > cls.MEMORY_ENTRIES:
+            cls._memory.popitem(last=False)
+        return index
+
+    @classmethod
+    def open(cls, ffprobe_cmd, path):
+        """Синхронная обёртка для вызова вне цикла супервизора."""
+        supervisor = get_supervisor()
+        return supervisor.run_coroutine(cls.open_async(supervisor, ffprobe_cmd, path)).result()
+
+
+# ========== Прогресс пакетной обработки ==========
+def _parse_rate(value):
+    """'30000/1001' -> 29.97; None для пустых и нулевых значений."""
+    try:
+        num, _, den = str(value).partition('/')
+        rate = float(num) / float(den or 1)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    return rate if rate > 0 else None
+
+
+def _stream_rotation(stream):
+    """Поворот кадра при показе, градусы 0/90/180/270 (по матрице отображения, иначе по тегу rotate)."""
+    values = [side.get('rotation') for side in stream.get('side_data_list') or [] if isinstance(side, dict)]
+    values.append((stream.get('tags') or {}).get('rotate'))
+    for value in values:
+        try:
+            return int(round(float(value))) % 360
+        except (TypeError, ValueError):
+            continue
+    return 0
+
+
+async def probe_media(supervisor, ffprobe_cmd, path):
+    """Сведения о первом видеопотоке: {'duration', 'width', 'height', 'codec', 'fps', 'sar', 'pix_fmt', 'rotation'}.
+
+    Длительность: format.duration, duration потока, число кадров / частота кадров. Неизвестное — None.
+    Размер и SAR — как у кадра после автоповорота ffmpeg (он выполняется до -vf): при повороте на ±90°
+    (матрица отображения или старый тег rotate) ширина и высота меняются местами.
+    """
+    media = {'duration': None, 'width': None, 'height': None, 'codec': None, 'fps': None, 'sar': None, 'pix_fmt': None,
+             'rotation': 0}
+    cmd = [ffprobe_cmd, '-v', 'error', '-select_streams', 'v:0',
+           '-show_entries',
+           'format=duration:stream=codec_name,duration,nb_frames,avg_frame_rate,r_frame_rate,width,height,'
+           'sample_aspect_ratio,pix_fmt:stream_tags=rotate:stream_side_data=rotation',
+           '-of', 'json', path]
+    result = await supervisor.capture(cmd, timeout=30)
+    if result.returncode != 0:
+        return media
+    try:
+        info = json.loads(result.stdout.decode('utf-8', errors='replace') or '{}')
+    except ValueError:
+        return media
+    streams = info.get('streams') or [{}]
+    stream = streams[0]
+    for name in ('width', 'height'):
+        if isinstance(stream.get(name), int) and stream[name] > 0:
+            media[name] = stream[name]
+    media['codec'] = stream.get('codec_name')
+    media['fps'] = _parse_rate(stream.get('avg_frame_rate')) or _parse_rate(stream.get('r_frame_rate'))
+    media['sar'] = _parse_rate(str(stream.get('sample_aspect_ratio')).replace(':', '/'))  # ffprobe пишет SAR как 64:45
+    media['pix_fmt'] = stream.get('pix_fmt')
+    media['rotation'] = _stream_rotation(stream)
+    if media['rotation'] in (90, 270):
+        if media['width'] and media['height']:
+            media['width'], media['height'] = media['height'], media['width']
+        if media['sar']:
+            media['sar'] = 1 / media['sar']
+    for value in (info.get('format', {}).get('duration'), stream.get('duration')):
+        try:
+            seconds = float(value)
+        except (TypeError, ValueError):
+            continue
+        if seconds > 0:
+            media['duration'] = seconds
+            return media
+    try:
+        frames = int(stream.get('nb_frames'))
+    except (TypeError, ValueError):
+        return media
+    if frames > 0 and media['fps']:
+        media['duration'] = frames / media['fps']
+    return media
+
+
+def format_size(num_bytes):
+    """Размер в байтах в виде '812 КБ', '4.1 ГБ'."""
+    value = float(num_bytes)
+    for unit in ("Б", "КБ", "МБ", "ГБ"):
+        if value < 1024 or unit == "ГБ":
+            return f"{value:.0f} {unit}" if unit in ("Б", "КБ") else f"{value:.1f} {unit}"
+        value /= 1024
+
+
+def format_eta(seconds):
+    """Оставшееся время в виде 'Ч:ММ:СС' или 'М:СС'."""
+    seconds = max(0, int(round(seconds)))
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes}:{secs:02d}"
+
+
+class BatchProgress:
+    """Прогресс пакета как доля обработанных секунд медиа от общей длительности всех файлов.
+
+    Задания идентифицируются ключами. Пока длительность файла не известна, его вес равен средней
+    длительности уже известных. Скорость каждого задания (секунд медиа за секунду реального
+    времени) сглаживается экспоненциально с постоянной SPEED_TAU; скорости одновременно
+    работающих заданий складываются, и ETA = остаток / суммарная скорость. Новое задание
+    наследует скорость предыдущего, чтобы оценка не прыгала на стыке файлов.
+
+    Суммы известных длительностей и завершённых заданий ведутся по ходу дела, а частичный прогресс
+    считается только по начатым заданиям — строка статуса не пересчитывает весь пакет на каждой
+    отметке прогресса (в пакете из тысяч файлов это и было главной нагрузкой на поток GUI).
+    """
+    SPEED_TAU = 5.0
+
+    def __init__(self, keys, clock=time.monotonic):
+        self._clock = clock
+        self.durations = dict.fromkeys(keys)
+        self.done = dict.fromkeys(self.durations, 0.0)
+        self.finished = set()
+        self._rates = {}
+        self._marks = {}
+        self._rate_hint = None
+        self._known = [0.0, 0]  # сумма и число известных длительностей
+        self._finished_known = [0.0, 0]  # то же среди завершённых заданий
+        self._partial = set()  # незавершённые задания с ненулевой позицией
+
+    def add(self, key):
+        """Новое задание в уже идущем пакете."""
+        self.durations.setdefault(key, None)
+        self.done.setdefault(key, 0.0)
+
+    def set_duration(self, key, seconds):
+        if key in self.durations and seconds and seconds > 0:
+            previous, seconds = self.durations[key], float(seconds)
+            self.durations[key] = seconds
+            sums = [self._known, self._finished_known] if key in self.finished else [self._known]
+            for sum_count in sums:
+                sum_count[0] += seconds - (previous or 0.0)
+                sum_count[1] += previous is None
+
+    def _mean(self):
+        known, count = self._known
+        return known / count if count else 1.0
+
+    def _weight(self, key):
+        return self.durations[key] or self._mean()
+
+    @property
+    def total(self):
+        known, count = self._known
+        return known + (len(self.durations) - count) * self._mean()
+
+    @property
+    def processed(self):
+        known, count = self._finished_known
+        return (known + (len(self.finished) - count) * self._mean()
+                + sum(min(self.done[key], self._weight(key)) for key in self._partial))
+
+    @property
+    def fraction(self):
+        total = self.total
+        return min(1.0, self.processed / total) if total else 0.0
+
+    def start(self, key):
+        self._marks[key] = (self._clock(), self.done[key])
+        if self._rate_hint is not None:
+            self._rates.setdefault(key, self._rate_hint)
+
+    def update(self, key, media_time):
+        """Текущая позиция задания в секундах медиа (time= из вывода ffmpeg)."""
+        now = self._clock()
+        last_t, last_media = self._marks.get(key, (now, self.done[key]))
+        self.done[key] = max(self.done[key], media_time)
+        if self.done[key] > 0 and key not in self.finished:
+            self._partial.add(key)
+        dt = now - last_t
+        if dt <= 0:
+            return
+        instant = max(0.0, self.done[key] - last_media) / dt
+        previous = self._rates.get(key)
+        if previous is None:
+            self._rates[key] = instant
+        else:
+            alpha = 1.0 - math.exp(-dt / self.SPEED_TAU)
+            self._rates[key] = previous + alpha * (instant - previous)
+        self._marks[key] = (now, self.done[key])
+
+    def finish(self, key):
+        if key not in self.finished:
+            self.finished.add(key)
+            if self.durations[key]:
+                self._finished_known[0] += self.durations[key]
+                self._finished_known[1] += 1
+        self._partial.discard(key)
+        self._marks.pop(key, None)
+        rate = self._rates.pop(key, None)
+        if rate:
+            self._rate_hint = rate
+
+    def reset(self, key):
+        """Задание будет выполнено заново (например, после неудачной проверки результата)."""
+        if key in self.finished:
+            self.finished.discard(key)
+            if self.durations[key]:
+                self._finished_known[0] -= self.durations[key]
+                self._finished_known[1] -= 1
+        self._partial.discard(key)
+        self.done[key] = 0.0
+        self._marks.pop(key, None)
+
+    @property
+    def throughput(self):
+        """Суммарная скорость работающих заданий, секунд медиа в секунду."""
+        rate = sum(self._rates.values())
+        return rate if rate > 0 else self._rate_hint
+
+    def eta(self):
+        """Оценка оставшегося времени в секундах или None, пока скорость не измерена."""
+        rate = self.throughput
+        if not rate:
+            return None
+        return max(0.0, self.total - self.processed) / rate
+
+
+# ========== Пресеты кодировщиков ==========
+# Единая шкала скорости — имена пресетов x264, от самого быстрого к самому медленному
+ENCODER_SPEEDS = ("ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow")
+ENCODER_TUNES = {
+    "libx264": ("film", "animation", "grain", "stillimage", "fastdecode", "zerolatency"),
+    "libx265": ("animation", "grain", "fastdecode", "zerolatency", "psnr", "ssim"),
+    "h264_nvenc": ("hq", "ll", "ull", "lossless"),
+    "hevc_nvenc": ("hq", "ll", "ull", "lossless"),
+}
+DEFAULT_ENCODER = {"speed": "medium", "rate_control": "bitrate", "quality": 23, "tune": "", "per_title": False}
+
+
+def normalize_encoder(preset):
+    """Проверяет параметры кодировщика и дополняет их значениями по умолчанию. Ошибка — ValueError."""
+    result = dict(DEFAULT_ENCODER)
+    result.update(preset or {})
+    if result["speed"] not in ENCODER_SPEEDS:
+        raise ValueError(f"Неизвестная скорость кодирования: {result['speed']}")
+    if result["rate_control"] not in ("bitrate", "crf"):
+        raise ValueError(f"Неизвестный режим качества: {result['rate_control']}")
+    quality = result["quality"]
+    if isinstance(quality, bool) or not isinstance(quality, int) or not 0 <= quality <= 63:
+        raise ValueError(f"CRF/CQ должен быть целым от 0 до 63: {quality!r}")
+    if not isinstance(result["tune"], str):
+        raise ValueError(f"Неверное значение tune: {result['tune']!r}")
+    if not isinstance(result["per_title"], bool):
+        raise ValueError(f"per_title должен быть true или false: {result['per_title']!r}")
+    return {key: result[key] for key in DEFAULT_ENCODER}
+
+
+def encoder_args(codec, preset):
+    """Аргументы ffmpeg для скорости, режима качества и tune конкретного энкодера.
+
+    Шкала ENCODER_SPEEDS переводится в -preset p1..p7 для NVENC, -deadline/-cpu-used для libvpx,
+    -cpu-used для libaom и -preset 12..2 для SVT-AV1. Возвращает (аргументы, предупреждения).
+    """
+    preset = normalize_encoder(preset)
+    level = ENCODER_SPEEDS.index(preset["speed"])  # 0 — быстрее всего, 8 — медленнее всего
+    crf = preset["rate_control"] == "crf"
+    quality = preset["quality"]
+    args, warnings = [], []
+    if codec in ("libx264", "libx265"):
+        args += ['-preset', preset["speed"]]
+        if crf:
+            args += ['-crf', str(min(quality, 51))]
+    elif codec in ("h264_nvenc", "hevc_nvenc"):
+        args += ['-preset', f"p{1 + round(level * 6 / 8)}"]
+        if crf:
+            args += ['-rc', 'vbr', '-cq', str(min(quality, 51)), '-b:v', '0']
+    elif codec in ("vp9", "libvpx-vp9"):
+        args += ['-deadline', 'realtime' if level <= 2 else 'good', '-cpu-used', str(8 - level)]
+        if crf:
+            args += ['-crf', str(quality), '-b:v', '0']
+    elif codec in ("av1", "libaom-av1"):
+        args += ['-cpu-used', str(8 - level)]
+        if crf:
+            args += ['-crf', str(quality), '-b:v', '0']
+    elif codec == "libsvtav1":
+        args += ['-preset', str(12 - round(level * 10 / 8))]
+        if crf:
+            args += ['-crf', str(quality)]
+    else:
+        warnings.append(f"Пресеты скорости не поддерживаются для кодека {codec} — используются настройки ffmpeg по умолчанию.")
+        return args, warnings
+    tune = preset["tune"]
+    if tune:
+        if tune in ENCODER_TUNES.get(codec, ()):
+            args += ['-tune', tune]
+        else:
+            warnings.append(f"tune={tune} не поддерживается кодеком {codec} — пропущено.")
+    return args, warnings
+
+
+def _parse_deadline(value):
+    """Срок из манифеста: секунды epoch или дата ISO 8601 (без зоны — местное время)."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        import datetime
+        try:
+            return datetime.datetime.fromisoformat(value).timestamp()
+        except ValueError:
+            pass
+    raise ValueError(f"Неверный срок готовности: {value!r}")
+
+
+# Переопределения настроек рендеринга для отдельного задания: имя поля -> ключ collect_render_settings.
+# Значения — как в выпадающих списках ("1080p", "1280x720", "libx265", "5M", "aac", "192k");
+# "source" — без изменений; каналы аудио — числом (1, 2, 6, 8)
+RENDER_OVERRIDES = {
+    "resolution": "res_text", "video_codec": "video_codec", "bitrate": "bitrate",
+    "audio_codec": "audio_codec", "audio_bitrate": "audio_bitrate", "audio_channels": "audio_channels",
+}
+AUDIO_CHANNEL_NAMES = {1: "1 (моно)", 2: "2 (стерео)", 6: "5.1", 8: "7.1"}
+
+
+def _render_overrides(raw):
+    """Проверяет поле settings задания и переводит его в значения настроек пакета."""
+    if not isinstance(raw, dict):
+        raise ValueError("settings должен быть объектом")
+    overrides = {}
+    for name, value in raw.items():
+        key = RENDER_OVERRIDES.get(name)
+        if key is None:
+            raise ValueError(f"неизвестная настройка «{name}»")
+        if value in (None, "source", "copy"):
+            overrides[key] = "Без изменений"
+        elif key == "audio_channels":
+            if value not in AUDIO_CHANNEL_NAMES:
+                raise ValueError(f"audio_channels: допустимо {', '.join(map(str, AUDIO_CHANNEL_NAMES))}")
+            overrides[key] = AUDIO_CHANNEL_NAMES[value]
+        elif isinstance(value, str) and value.strip():
+            overrides[key] = value.strip()
+        else:
+            raise ValueError(f"{name}: ожидается строка")
+    return overrides
+
+
+def _path_key(path):
+    """Ключ для сравнения путей: абсолютный, без учёта регистра там, где его не учитывает ФС (Windows)."""
+    return os.path.normcase(os.path.abspath(path))
+
+
+def load_batch_manifest(path, presets=None):
+    """Читает JSON-манифест пакета.
+
+    Формат: {"defaults": {...}, "jobs": [{"input": "a.mp4", "output": "...", "priority": 1,
+    "deadline": "2026-10-20T18:00", "preset": "имя пресета" или {"speed": ..., "rate_control": ...},
+    "settings": {"resolution": "720p", ...}}]} либо просто список заданий. Относительные пути
+    считаются от папки манифеста. Возвращает список словарей input/output/priority/deadline/encoder/settings
+    (encoder=None и settings=None — настройки интерфейса).
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return parse_batch_jobs(data, os.path.dirname(os.path.abspath(path)), presets)
+
+
+def parse_batch_jobs(data, base_dir=None, presets=None):
+    """Разбирает задания в формате манифеста (см. load_batch_manifest).
+
+    base_dir=None — относительные пути запрещены (запросы API: у них нет «своей» папки).
+    Явный output не должен существовать, совпадать с input или с output другого задания:
+    ffmpeg не перезаписывает файлы, и такое задание иначе упало бы только после очереди.
+    """
+    presets = presets or {}
+    if isinstance(data, list):
+        data = {"jobs": data}
+    if not isinstance(data, dict) or not isinstance(data.get("jobs"), list) or not data["jobs"]:
+        raise ValueError("в манифесте нет списка заданий jobs")
+    defaults = data.get("defaults") or {}
+    if not isinstance(defaults, dict):
+        raise ValueError("defaults должен быть объектом")
+    entries = []
+    outputs = {}  # _path_key(output) -> номер задания
+    for number, raw in enumerate(data["jobs"], 1):
+        if isinstance(raw, str):
+            raw = {"input": raw}
+        if not isinstance(raw, dict) or not isinstance(raw.get("input"), str):
+            raise ValueError(f"задание {number}: не указан input")
+        job = dict(defaults, **raw)
+        output = job.get("output")
+        if base_dir is None and not (os.path.isabs(job["input"]) and (not output or os.path.isabs(output))):
+            raise ValueError(f"задание {number}: пути input и output должны быть абсолютными")
+        source = os.path.join(base_dir or "", job["input"])
+        if not os.path.isfile(source):
+            raise ValueError(f"задание {number}: файл не найден: {source}")
+        if output:
+            output = os.path.join(base_dir or "", output)
+            key = _path_key(output)
+            if key == _path_key(source):
+                raise ValueError(f"задание {number}: output совпадает с input")
+            if key in outputs:
+                raise ValueError(f"задание {number}: тот же output, что у задания {outputs[key]}: {output}")
+            if os.path.exists(output):
+                raise ValueError(f"задание {number}: файл результата уже существует: {output}")
+            outputs[key] = number
+        preset = job.get("preset")
+        if isinstance(preset, str):
+            if preset not in presets:
+                raise ValueError(f"задание {number}: неизвестный пресет «{preset}»")
+            preset = presets[preset]
+        priority = job.get("priority", 0)
+        if isinstance(priority, bool) or not isinstance(priority, int):
+            raise ValueError(f"задание {number}: priority должен быть целым числом")
+        try:
+            encoder = normalize_encoder(preset) if preset is not None else None
+            deadline = _parse_deadline(job.get("deadline"))
+            settings = _render_overrides(job["settings"]) if job.get("settings") is not None else None
+        except ValueError as e:
+            raise ValueError(f"задание {number}: {e}")
+        entries.append({
+            "input": source,
+            "output": output or None,
+            "priority": priority,
+            "deadline": deadline,
+            "encoder": encoder,
+            "settings": settings,
+        })
+    return entries
+
+
+# ========== Очередь заданий и политики планирования ==========
+class RenderJob:
+    """Задание пакета: исходный файл, оценка стоимости и параметры планирования.
+
+    width/height — размер кадра на выходе; deadline — момент времени (time.time()), к которому
+    файл нужен готовым; priority — чем больше, тем раньше.
+    """
+    # Относительная стоимость секунды 1080p по сравнению с libx264 (preset medium)
+    CODEC_COST = {
+        "copy": 0.05, "h264_nvenc": 0.3, "hevc_nvenc": 0.35, "libx264": 1.0, "libx265": 2.5,
+        "vp9": 3.0, "libvpx-vp9": 3.0, "av1": 5.0, "libaom-av1": 5.0, "libsvtav1": 2.0,
+    }
+    # Относительная стоимость скоростей ENCODER_SPEEDS по сравнению с medium
+    SPEED_COST = (0.25, 0.35, 0.5, 0.65, 0.8, 1.0, 1.5, 2.5, 5.0)
+    REFERENCE_PIXELS = 1920 * 1080
+    # Если длительность неизвестна, оцениваем её по размеру файла (~4 Мбит/с)
+    BYTES_PER_SECOND = 500_000
+
+    def __init__(self, key, path, duration=None, width=None, height=None, codec=None, priority=0, deadline=None,
+                 encoder=None, output=None):
+        self.key = key
+        self.path = path
+        self.duration = duration
+        self.width = width
+        self.height = height
+        self.codec = codec
+        self.priority = priority
+        self.deadline = deadline
+        self.encoder = encoder
+        self.output = output
+        self.bitrate = None  # кбит/с, подобранный per-title анализом
+        self.source_size = None
+        self.media = None  # сведения probe_media об источнике
+        self.quality = None  # результат measure_quality после рендеринга
+        self.attempts = 0
+        self.staging = None  # путь во временной папке, пока результат не опубликован
+        self.output_estimate = 0  # ожидаемый размер результата и пиковая память, байт (допуск заданий)
+        self.memory = 0
+        self.started = None
+        self.job_id = None  # идентификатор в JobBoard (API управления)
+        self.settings = None  # настройки пакета с переопределениями задания (None — общие)
+        self.cancelled = False
+        self.output_created = False  # файл результата создаёт само задание (при отмене его можно удалить)
+
+    @property
+    def cost(self):
+        """Оценка стоимости: длительность × число пикселей (относительно 1080p) × коэффициенты кодека и скорости."""
+        duration = self.duration
+        if not duration:
+            try:
+                duration = os.path.getsize(self.path) / self.BYTES_PER_SECOND
+            except OSError:
+                duration = 1.0
+        pixels = self.width * self.height if self.width and self.height else self.REFERENCE_PIXELS
+        speed = (self.encoder or DEFAULT_ENCODER)["speed"]
+        factor = self.CODEC_COST.get(self.codec or "libx264", 1.0)
+        if self.codec != "copy" and speed in ENCODER_SPEEDS:
+            factor *= self.SPEED_COST[ENCODER_SPEEDS.index(speed)]
+        return duration * pixels / self.REFERENCE_PIXELS * factor
+
+
+class JobQueue:
+    """Очередь заданий с выбираемой политикой порядка.
+
+    Явный приоритет важнее политики. Внутри одного приоритета:
+      fifo — порядок добавления;
+      sjf  — сначала дешёвые (минимальное среднее время готовности);
+      ljf  — сначала дорогие (при нескольких слотах короткие задания заполняют «хвост», меньше makespan);
+      edf  — сначала ближайший срок, задания без срока — в конце.
+    """
+    POLICIES = ("fifo", "sjf", "ljf", "edf")
+
+    def __init__(self, policy="fifo"):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Неизвестная политика планирования: {policy}")
+        self.policy = policy
+        self._heap = []
+        self._seq = 0
+
+    def _order(self, job):
+        if self.policy == "sjf":
+            return job.cost
+        if self.policy == "ljf":
+            return -job.cost
+        if self.policy == "edf":
+            return (job.deadline is None, job.deadline or 0.0, job.cost)
+        return 0
+
+    def push(self, job):
+        heapq.heappush(self._heap, (-job.priority, self._order(job), self._seq, job))
+        self._seq += 1
+
+    def pop(self):
+        return heapq.heappop(self._heap)[-1]
+
+    def peek(self):
+        return self._heap[0][-1]
+
+    def upcoming(self, count):
+        """Следующие count заданий в порядке выдачи, не извлекая их."""
+        return [entry[-1] for entry in heapq.nsmallest(count, self._heap)]
+
+    def remove(self, job):
+        """Убирает задание из очереди; False — его там нет."""
+        kept = [entry for entry in self._heap if entry[-1] is not job]
+        if len(kept) == len(self._heap):
+            return False
+        heapq.heapify(kept)
+        self._heap = kept
+        return True
+
+    def __len__(self):
+        return len(self._heap)
+
+
+# ========== Допуск заданий: место на диске и память ==========
+# Кадров в очереди кодировщика на скорости medium (lookahead + опорные) и множитель памяти на кадр
+# (анализ движения, уменьшенные копии для lookahead и т. п.) относительно сырого кадра YUV 4:2:0
+ENCODER_MEMORY = {
+    "libx264": (40, 2.0), "libx265": (20, 4.0), "libvpx-vp9": (25, 2.0), "vp9": (25, 2.0),
+    "libaom-av1": (35, 3.0), "av1": (35, 3.0), "libsvtav1": (60, 3.0),
+    "h264_nvenc": (8, 1.0), "hevc_nvenc": (8, 1.0),
+}
+# rc-lookahead x264/x265 по скоростям ENCODER_SPEEDS относительно medium
+LOOKAHEAD_SCALE = (0.0, 0.0, 0.25, 0.5, 0.75, 1.0, 1.25, 1.5, 1.5)
+# Декодер, фильтры и очереди между ними держат ещё около стольких кадров
+PIPELINE_FRAMES = 16
+BASE_PROCESS_MEMORY = 150 * 1024 * 1024
+
+
+def estimate_job_memory(width, height, codec=None, speed="medium"):
+    """Грубая оценка пиковой памяти процесса ffmpeg, байт."""
+    if codec == "copy":
+        return BASE_PROCESS_MEMORY // 2
+    frame = (width or 1920) * (height or 1080) * 3 // 2
+    lookahead, factor = ENCODER_MEMORY.get(codec or "libx264", (30, 2.0))
+    if speed in ENCODER_SPEEDS and codec in ("libx264", "libx265", None):
+        lookahead *= LOOKAHEAD_SCALE[ENCODER_SPEEDS.index(speed)]
+    return int(BASE_PROCESS_MEMORY + (lookahead * factor + PIPELINE_FRAMES) * frame)
+
+
+def available_memory():
+    """Память, доступная новым процессам без вытеснения в своп, байт; None — узнать нельзя."""
+    if sys.platform == 'win32':
+        import ctypes
+
+        class MEMORYSTATUSEX(ctypes.Structure):
+            _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong),
+                        ("ullTotalPhys", ctypes.c_ulonglong), ("ullAvailPhys", ctypes.c_ulonglong),
+                        ("ullTotalPageFile", ctypes.c_ulonglong), ("ullAvailPageFile", ctypes.c_ulonglong),
+                        ("ullTotalVirtual", ctypes.c_ulonglong), ("ullAvailVirtual", ctypes.c_ulonglong),
+                        ("ullAvailExtendedVirtual", ctypes.c_ulonglong)]
+        status = MEMORYSTATUSEX()
+        status.dwLength = ctypes.sizeof(status)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return status.ullAvailPhys
+        return None
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def volume_of(path):
+    """(существующая папка, идентификатор тома) для пути, который может ещё не существовать."""
+    directory = os.path.abspath(path)
+    while not os.path.isdir(directory):
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            break
+        directory = parent
+    return directory, os.stat(directory).st_dev
+
+
+class MemoryLimiter:
+    """Ограничение памяти дочерних процессов: cgroup v2, если есть делегированная группа, иначе RLIMIT_AS.
+
+    По правилу cgroup v2 «нет процессов во внутренних узлах» контроллер memory можно включить для
+    подгрупп своей группы, только если в ней самой нет процессов. Поэтому в делегированной группе
+    (доступной на запись, например systemd-run --user -p Delegate=yes) процесс сначала переносит себя
+    в лист LEAF, затем включает memory в cgroup.subtree_control; ffmpeg получают соседние листы.
+    Если в группе есть чужие процессы, включить контроллер нельзя (EBUSY) — процесс возвращается
+    на место, лист удаляется, и остаётся RLIMIT_AS. RLIMIT_AS ограничивает виртуальное адресное
+    пространство, которое у многопоточного ffmpeg заметно больше занятой памяти, поэтому для него
+    лимит берётся с запасом (AS_HEADROOM).
+
+    Предел ставится в дочернем процессе до exec (preexec_fn из prepare), так что под него попадает
+    и память, выделенная при запуске ffmpeg.
+    """
+    AS_HEADROOM = 3
+    LEAF = "cineconvert-main"
+
+    def __init__(self):
+        self.cgroup_root = self._find_cgroup_root()
+        self._ids = itertools.count(1)
+
+    @staticmethod
+    def _join(group):
+        with open(os.path.join(group, 'cgroup.procs'), 'w') as f:
+            f.write(str(os.getpid()))
+
+    @classmethod
+    def _find_cgroup_root(cls):
+        if not sys.platform.startswith('linux'):
+            return None
+        try:
+            with open('/proc/self/cgroup') as f:
+                relative = next((line[3:].strip() for line in f if line.startswith('0::')), None)
+            if relative is None:
+                return None
+            root = os.path.join('/sys/fs/cgroup', relative.lstrip('/'))
+            if os.path.basename(root) == cls.LEAF:
+                root = os.path.dirname(root)  # уже перенесены в лист (второй MemoryLimiter)
+            if not os.access(root, os.W_OK):
+                return None
+            with open(os.path.join(root, 'cgroup.controllers')) as f:
+                if 'memory' not in f.read().split():
+                    return None  # родитель не делегировал контроллер
+            with open(os.path.join(root, 'cgroup.subtree_control')) as f:
+                if 'memory' in f.read().split():
+                    return root
+            leaf = os.path.join(root, cls.LEAF)
+            os.makedirs(leaf, exist_ok=True)
+        except OSError:
+            return None
+        moved = False
+        try:
+            cls._join(leaf)
+            moved = True
+            with open(os.path.join(root, 'cgroup.subtree_control'), 'w') as f:
+                f.write('+memory')
+        except OSError:
+            # Например, EBUSY: в группе есть чужие процессы — возвращаем всё как было
+            try:
+                if moved:
+                    cls._join(root)
+                os.rmdir(leaf)
+            except OSError:
+                pass
+            return None
+        return root
+
+    def _make_group(self, limit_bytes):
+        group = os.path.join(self.cgroup_root, f"cineconvert-{os.getpid()}-{next(self._ids)}")
+        try:
+            os.mkdir(group)
+            with open(os.path.join(group, 'memory.max'), 'w') as f:
+                f.write(str(int(limit_bytes)))
+            return group
+        except OSError:
+            self.release(group)
+            return None
+
+    def prepare(self, limit_bytes):
+        """Предел для ещё не запущенного процесса: (preexec_fn, папка cgroup или None).
+
+        preexec_fn переносит дочерний процесс в свою cgroup, а если это не удалось — ставит
+        RLIMIT_AS. (None, None) — ограничить нельзя (Windows). Папку после завершения
+        процесса передают в release.
+        """
+        try:
+            import resource
+        except ImportError:
+            return None, None
+        limit = int(limit_bytes * self.AS_HEADROOM)
+        hard = resource.getrlimit(resource.RLIMIT_AS)[1]
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        group = self._make_group(limit_bytes) if self.cgroup_root else None
+        procs = os.path.join(group, 'cgroup.procs') if group else None
+
+        def _preexec():
+            # Между fork и exec — только системные вызовы, без импортов и блокировок
+            if procs is not None:
+                try:
+                    fd = os.open(procs, os.O_WRONLY)
+                    try:
+                        os.write(fd, b"0")  # 0 — сам пишущий процесс
+                        return
+                    finally:
+                        os.close(fd)
+                except OSError:
+                    pass
+            try:
+                resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+            except (OSError, ValueError):
+                pass
+        return _preexec, group
+
+    def release(self, group):
+        """Удаляет cgroup завершившегося процесса."""
+        if group:
+            try:
+                os.rmdir(group)
+            except OSError:
+                pass
+
+
+# ========== Планирование цепочки видеофильтров ==========
+# Уменьшение во столько раз и больше выполняется усреднением (area): быстрее bicubic и без алиасинга
+AREA_DOWNSCALE_RATIO = 2.0
+# Форматы пикселей, которые энкодер принимает без преобразования; остальное переводится в первый из списка
+ENCODER_PIX_FMTS = {
+    "h264_nvenc": ("yuv420p", "nv12", "p010le", "yuv444p", "yuv444p16le"),
+    "hevc_nvenc": ("yuv420p", "nv12", "p010le", "yuv444p", "yuv444p16le"),
+}
+
+
+def legacy_scale_filter(width, height):
+    """Прежняя цепочка: масштаб и поля всегда, даже если кадр уже нужного размера."""
+    return f"scale={width}:{height}:force_original_aspect_ratio=decrease,pad={width}:{height}:(ow-iw)/2:(oh-ih)/2"
+
+
+def plan_video_filters(media, width, height, codec=None):
+    """Минимальная цепочка фильтров, вписывающая кадр источника в рамку width×height с полями.
+
+    media — результат probe_media (ширина, высота, SAR, pix_fmt). Пропорции считаются по отображаемому
+    размеру (с учётом SAR), на выходе пиксели квадратные. Тождественные операции не добавляются:
+    масштаб к тому же размеру, поля нулевой ширины, setsar при квадратных пикселях без масштаба. Преобразование
+    формата для энкодера встраивается в проход scale; без масштаба его вставит сам ffmpeg.
+    Возвращает список фильтров (пустой — фильтры не нужны).
+    """
+    src_w, src_h = media.get('width'), media.get('height')
+    if not src_w or not src_h:
+        return [legacy_scale_filter(width, height)]
+    sar = media.get('sar') or 1.0
+    display_w = src_w * sar
+    ratio = min(width / display_w, height / src_h)
+    # Чётные размеры: 4:2:0 не допускает нечётных
+    fit_w = min(width, max(2, int(round(display_w * ratio / 2)) * 2))
+    fit_h = min(height, max(2, int(round(src_h * ratio / 2)) * 2))
+    filters = []
+    scaled = (fit_w, fit_h) != (src_w, src_h)
+    if scaled:
+        flags = "area" if ratio <= 1 / AREA_DOWNSCALE_RATIO else "bicubic"
+        scale = f"scale={fit_w}:{fit_h}:flags={flags}"
+        allowed = ENCODER_PIX_FMTS.get(codec)
+        if allowed and media.get('pix_fmt') and media['pix_fmt'] not in allowed:
+            scale += f",format={allowed[0]}"
+        filters.append(scale)
+    if scaled or abs(sar - 1.0) > 1e-3:
+        # scale сохраняет отображаемые пропорции через SAR, а размеры округлены до чётных — фиксируем 1:1
+        filters.append("setsar=1")
+    if (fit_w, fit_h) != (width, height):
+        filters.append(f"pad={width}:{height}:{(width - fit_w) // 2}:{(height - fit_h) // 2}")
+    return filters
+
+
+def benchmark_filters(ffmpeg_cmd, frames=300, cases=None):
+    """Замер прежней и запланированной цепочки на синтетическом источнике (testsrc2 → null).
+
+    Возвращает список {'case', 'legacy_ms', 'planned_ms', 'filters'} — время на кадр в миллисекундах,
+    включая генерацию источника (одинаковую для обеих цепочек).
+    """
+    cases = cases or [((1920, 1080), (1920, 1080)), ((3840, 2160), (1920, 1080)),
+                      ((1920, 800), (1920, 1080)), ((1280, 720), (1920, 1080))]
+
+    def _run(src, chain):
+        cmd = [ffmpeg_cmd, '-hide_banner', '-nostats', '-loglevel', 'error',
+               '-f', 'lavfi', '-i', f"testsrc2=size={src[0]}x{src[1]}:rate=25,format=yuv420p",
+               '-frames:v', str(frames)]
+        if chain:
+            cmd.extend(['-vf', chain])
+        cmd.extend(['-f', 'null', '-'])
+        started = time.perf_counter()
+        subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        return (time.perf_counter() - started) * 1000 / frames
+
+    results = []
+    for src, (width, height) in cases:
+        planned = plan_video_filters({'width': src[0], 'height': src[1], 'sar': 1.0, 'pix_fmt': 'yuv420p'},
+                                     width, height)
+        results.append({
+            "case": f"{src[0]}x{src[1]} → {width}x{height}",
+            "legacy_ms": _run(src, legacy_scale_filter(width, height)),
+            "planned_ms": _run(src, ",".join(planned)),
+            "filters": ",".join(planned) or "—",
+        })
+    return results
+
+
+# ========== Оценка пакета пробным кодированием ==========
+class JsonCache:
+    """Небольшой кэш результатов измерений в JSON-файле: ключ -> словарь, самые старые вытесняются."""
+    def __init__(self, path, max_entries=1000):
+        self.path = path
+        self.max_entries = max_entries
+        self._data = None
+
+    @staticmethod
+    def key(*parts):
+        blob = "|".join(json.dumps(p, sort_keys=True, ensure_ascii=False) if not isinstance(p, str) else p
+                        for p in parts)
+        return hashlib.sha1(blob.encode('utf-8')).hexdigest()
+
+    def _load(self):
+        if self._data is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {}
+        return self._data
+
+    def get(self, key):
+        entry = self._load().get(key)
+        return entry if isinstance(entry, dict) else None
+
+    def put(self, key, value):
+        data = self._load()
+        data[key] = dict(value, created=time.time())
+        if len(data) > self.max_entries:
+            for old in sorted(data, key=lambda k: data[k].get('created', 0))[:len(data) - self.max_entries]:
+                del data[old]
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+
+def sample_windows(duration, count, length):
+    """Окна (начало, длина), равномерно расположенные внутри файла; короткий файл берётся целиком."""
+    if not duration or duration <= count * length:
+        return [(None, duration or length)]
+    step = duration / (count + 1)
+    return [(step * (i + 1) - length / 2, length) for i in range(count)]
+
+
+def media_fingerprint(path):
+    """Отпечаток исходника для кэшей: путь, размер и mtime."""
+    st = os.stat(path)
+    ident = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+    return hashlib.sha1(ident.encode('utf-8')).hexdigest()
+
+
+def source_profile(media):
+    """Профиль исходника (кодек, размер кадра, частота): такие файлы кодируются с близкой скоростью."""
+    fps = media.get('fps')
+    return (media.get('codec'), media.get('width'), media.get('height'), round(fps, 2) if fps else None)
+
+
+class SampleEstimator:
+    """Оценка времени и размера пакета по пробному кодированию коротких фрагментов.
+
+    Для каждого профиля исходника кодируются SAMPLES фрагментов по SAMPLE_SECONDS с точными
+    настройками задания — параллельно (столько процессов, сколько слотов у пакета, чтобы
+    скорость измерялась при той же конкуренции за процессор) и с пониженным приоритетом.
+    Результат — скорость (секунд медиа за секунду) и байт результата на секунду медиа —
+    кэшируется в CACHE_DIR/estimates.json по (отпечаток исходника, настройки).
+    """
+    SAMPLES = 3
+    SAMPLE_SECONDS = 5.0
+    SAMPLE_TIMEOUT = 600
+
+    def __init__(self, supervisor, cache=None):
+        self.supervisor = supervisor
+        self.cache = cache or JsonCache(os.path.join(CACHE_DIR, "estimates.json"))
+
+    @staticmethod
+    def cache_key(fingerprint, settings):
+        return JsonCache.key(fingerprint, settings)
+
+    def lookup(self, key):
+        entry = self.cache.get(key)
+        if entry and entry.get('speed') and entry.get('bytes_per_second') is not None:
+            return entry
+        return None
+
+    def store(self, key, result):
+        self.cache.put(key, result)
+
+    @classmethod
+    def sample_points(cls, duration):
+        return sample_windows(duration, cls.SAMPLES, cls.SAMPLE_SECONDS)
+
+    async def measure(self, samples, parallel=1):
+        """Кодирует фрагменты и возвращает {'speed', 'bytes_per_second'} или None при ошибке.
+
+        samples — список (команда, путь результата, длина фрагмента в секундах).
+        """
+        import asyncio
+        limit = asyncio.Semaphore(max(1, parallel))
+
+        async def _encode(command, output, length):
+            async with limit:
+                started = time.monotonic()
+                result = await self.supervisor.capture(command, timeout=self.SAMPLE_TIMEOUT, low_priority=True)
+                wall = time.monotonic() - started
+            try:
+                size = os.path.getsize(output)
+            except OSError:
+                return None
+            if result.returncode != 0 or wall <= 0:
+                return None
+            return length, wall, size
+
+        results = await asyncio.gather(*(_encode(*sample) for sample in samples))
+        if not results or any(r is None for r in results):
+            return None
+        media = sum(r[0] for r in results)
+        return {
+            'speed': sum(r[0] / r[1] for r in results) / len(results),
+            'bytes_per_second': sum(r[2] for r in results) / media,
+        }
+
+    @staticmethod
+    def extrapolate(jobs, parallel=1):
+        """Итог пакета по измерениям. jobs — (длительность, результат measure или None) в порядке очереди.
+
+        Время считается списочным планированием по parallel слотам: каждое задание занимает
+        самый рано освободившийся слот на duration / speed секунд.
+        """
+        slots = [0.0] * max(1, parallel)
+        media = output = 0.0
+        unknown = 0
+        for duration, rate in jobs:
+            if not duration or not rate:
+                unknown += 1
+                continue
+            index = slots.index(min(slots))
+            slots[index] += duration / rate['speed']
+            media += duration
+            output += duration * rate['bytes_per_second']
+        wall = max(slots)
+        return {
+            'wall_seconds': wall,
+            'speed': media / wall if wall else None,
+            'output_bytes': output,
+            'unknown': unknown,
+        }
+
+
+# ========== Per-title: подбор битрейта по сложности материала ==========
+def parse_bitrate_kbps(text):
+    """'5M' -> 5000, '500k' -> 500, '800000' -> 800; None для «Без изменений» и мусора."""
+    parts = (text or "").split()
+    if not parts:
+        return None
+    value = parts[0].lower()
+    scale = {'k': 1, 'm': 1000, 'g': 1000000}
+    try:
+        if value[-1] in scale:
+            return max(1, int(float(value[:-1]) * scale[value[-1]]))
+        return max(1, int(float(value) / 1000))
+    except ValueError:
+        return None
+
+
+class ComplexityAnalyzer:
+    """Оценка сложности файла пробным CRF-кодированием коротких фрагментов в низком разрешении.
+
+    Фрагменты кодируются libx264 (veryfast) с целевым CRF и высотой кадра PROBE_HEIGHT;
+    битрейт результата показывает, сколько бит нужно именно этому материалу для целевого
+    качества. Он пересчитывается на выходное разрешение (пропорционально числу пикселей
+    в степени PIXEL_EXPONENT) и эффективность выбранного кодека. Стоимость анализа ограничена:
+    SAMPLES фрагментов по SAMPLE_SECONDS на файл. Результаты кэшируются в CACHE_DIR/complexity.json.
+    """
+    SAMPLES = 3
+    SAMPLE_SECONDS = 4.0
+    PROBE_HEIGHT = 360
+    PIXEL_EXPONENT = 0.75
+    HEADROOM = 1.1
+    MIN_KBPS = 150
+    # Битрейт относительно libx264 при сопоставимом качестве
+    CODEC_EFFICIENCY = {
+        "libx264": 1.0, "h264_nvenc": 1.2, "libx265": 0.6, "hevc_nvenc": 0.7,
+        "vp9": 0.65, "libvpx-vp9": 0.65, "av1": 0.5, "libaom-av1": 0.5, "libsvtav1": 0.55,
+    }
+
+    def __init__(self, supervisor, ffmpeg_cmd, cache=None):
+        self.supervisor = supervisor
+        self.ffmpeg_cmd = ffmpeg_cmd
+        self.cache = cache or JsonCache(os.path.join(CACHE_DIR, "complexity.json"))
+
+    @classmethod
+    def probe_size(cls, width, height):
+        """Размер кадра пробного кодирования (без увеличения маленьких исходников)."""
+        if not width or not height:
+            return None
+        if height <= cls.PROBE_HEIGHT:
+            return width, height
+        return int(round(width * cls.PROBE_HEIGHT / height / 2)) * 2, cls.PROBE_HEIGHT
+
+    async def probe(self, path, duration, crf, width=None, height=None):
+        """Битрейт (кбит/с) пробного кодирования с целевым CRF; (kbps, секунд медиа закодировано)."""
+        key = JsonCache.key(media_fingerprint(path), crf, self.PROBE_HEIGHT, self.SAMPLES, self.SAMPLE_SECONDS)
+        cached = self.cache.get(key)
+        if cached and cached.get('kbps'):
+            return cached['kbps'], 0.0
+        workdir = tempfile.mkdtemp(prefix="complexity_", dir=CACHE_DIR if os.path.isdir(CACHE_DIR) else None)
+        total_bytes = 0
+        media = 0.0
+        try:
+            for n, (seek, length) in enumerate(sample_windows(duration, self.SAMPLES, self.SAMPLE_SECONDS)):
+                output = os.path.join(workdir, f"probe_{n}.mkv")
+                cmd = [self.ffmpeg_cmd, '-v', 'error']
+                if seek:
+                    cmd.extend(['-ss', f"{seek:.3f}"])
+                cmd.extend(['-i', path, '-t', f"{length:.3f}", '-map', '0:v:0', '-an', '-sn',
+                            '-vf', f"scale=-2:'min({self.PROBE_HEIGHT},ih)'",
+                            '-c:v', 'libx264', '-preset', 'veryfast', '-crf', str(min(crf, 51)),
+                            '-f', 'matroska', output])
+                result = await self.supervisor.capture(cmd, timeout=300, low_priority=True)
+                if result.returncode != 0 or not os.path.exists(output):
+                    return None, media
+                total_bytes += os.path.getsize(output)
+                media += length
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        if media <= 0:
+            return None, media
+        kbps = total_bytes * 8 / 1000 / media
+        self.cache.put(key, {'kbps': kbps})
+        return kbps, media
+
+    @classmethod
+    def target_kbps(cls, probe_kbps, source_size, output_size, codec=None, cap_kbps=None):
+        """Битрейт для выходного разрешения и кодека, ограниченный снизу MIN_KBPS и сверху cap_kbps."""
+        probe_size = cls.probe_size(*source_size) if source_size else None
+        scale = 1.0
+        if probe_size and output_size and all(output_size):
+            scale = (output_size[0] * output_size[1] / (probe_size[0] * probe_size[1])) ** cls.PIXEL_EXPONENT
+        kbps = probe_kbps * scale * cls.CODEC_EFFICIENCY.get(codec or "libx264", 1.0) * cls.HEADROOM
+        if cap_kbps:
+            kbps = min(kbps, cap_kbps)
+        return max(cls.MIN_KBPS, int(round(kbps)))
+
+
+# ========== Рабочая папка (scratch) и атомарная публикация ==========
+def _pid_alive(pid):
+    """Жив ли процесс с данным pid (для поиска брошенных временных файлов)."""
+    if pid == os.getpid():
+        return True
+    if sys.platform == 'win32':
+        import ctypes
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ScratchSpace:
+    """Быстрая локальная папка для незавершённых результатов.
+
+    ffmpeg пишет в <scratch>/cc-<pid>-<n>.<имя>, а готовый файл публикуется в место назначения:
+    на той же файловой системе — жёсткой ссылкой (атомарно и без перезаписи чужого файла),
+    иначе — потоковым копированием во временный файл рядом с целью, fsync и переименованием.
+    Потребители никогда не видят недописанный файл. Квота ограничивает сумму резервов
+    (оценок размера) активных заданий; файлы процессов, которых уже нет, удаляются при запуске.
+    """
+    PREFIX = "cc-"
+    COPY_CHUNK = 8 * 1024 * 1024
+    _serial = itertools.count(1)  # общий для всех экземпляров: несколько пространств могут делить одну папку
+
+    def __init__(self, directory, quota_bytes=0):
+        self.directory = directory
+        self.quota_bytes = int(quota_bytes or 0)
+        self._reserved = {}  # путь во временной папке -> резерв в байтах
+        self._lock = threading.RLock()  # release() вызывается и из потоков публикации
+
+    @property
+    def reserved(self):
+        with self._lock:
+            return sum(self._reserved.values())
+
+    def usage(self):
+        """Фактический размер активных временных файлов."""
+        with self._lock:
+            paths = list(self._reserved)
+        total = 0
+        for path in paths:
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+        return total
+
+    def fits(self, estimate_bytes):
+        return not self.quota_bytes or self.reserved + estimate_bytes <= self.quota_bytes
+
+    def allocate(self, final_path, estimate_bytes=0, force=False):
+        """Путь для записи во временной папке или None, если резерв не помещается в квоту."""
+        with self._lock:
+            if not force and not self.fits(estimate_bytes):
+                return None
+            os.makedirs(self.directory, exist_ok=True)
+            serial = next(self._serial)
+            path = os.path.join(self.directory, f"{self.PREFIX}{os.getpid()}-{serial}.{os.path.basename(final_path)}")
+            self._reserved[path] = estimate_bytes
+            return path
+
+    def release(self, path, remove=True):
+        with self._lock:
+            self._reserved.pop(path, None)
+        if remove:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def publish(self, path, final_path):
+        """Переносит готовый файл в final_path, не перезаписывая существующий (FileExistsError)."""
+        os.makedirs(os.path.dirname(os.path.abspath(final_path)), exist_ok=True)
+        try:
+            os.link(path, final_path)
+        except FileExistsError:
+            raise
+        except OSError:
+            self._copy_publish(path, final_path)
+        self.release(path)
+        return final_path
+
+    def _copy_publish(self, path, final_path):
+        # Другая файловая система или ФС без жёстких ссылок: копия рядом с целью, затем переименование
+        tmp = f"{final_path}.{self.PREFIX}{os.getpid()}.part"
+        try:
+            with open(path, 'rb') as src_file, open(tmp, 'wb') as dst_file:
+                shutil.copyfileobj(src_file, dst_file, self.COPY_CHUNK)
+                dst_file.flush()
+                os.fsync(dst_file.fileno())
+            try:
+                os.link(tmp, final_path)
+            except FileExistsError:
+                raise
+            except OSError:
+                if os.path.exists(final_path):
+                    raise FileExistsError(final_path)
+                os.replace(tmp, final_path)
+        finally:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def cleanup_orphans(self):
+        """Удаляет временные файлы завершившихся процессов. Возвращает (число файлов, байт)."""
+        removed = freed = 0
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return 0, 0
+        for name in names:
+            if not name.startswith(self.PREFIX):
+                continue
+            try:
+                pid = int(name[len(self.PREFIX):].split('-', 1)[0])
+            except ValueError:
+                continue
+            if _pid_alive(pid):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except OSError:
+                continue
+            removed += 1
+            freed += size
+        return removed, freed
+
+
+class InputPrefetcher:
+    """Заранее копирует исходники следующих заданий с медленного (сетевого) диска в локальную папку.
+
+    Копирование идёт в одном фоновом потоке крупными последовательными чтениями, пока кодируются
+    предыдущие задания; место на диске ограничено квотой ScratchSpace. on_ready(key, ok)
+    вызывается из потока копирования по завершении каждого файла.
+    """
+    CHUNK = 16 * 1024 * 1024
+
+    def __init__(self, space, on_ready=None):
+        self.space = space
+        self.on_ready = on_ready
+        self._entries = {}  # ключ задания -> {"source", "local", "state"}
+        self._pending = collections.deque()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+    def state(self, key):
+        """None, 'queued', 'copying', 'ready' или 'failed'."""
+        entry = self._entries.get(key)
+        return entry["state"] if entry else None
+
+    def pending(self, key):
+        return self.state(key) in ('queued', 'copying')
+
+    def want(self, key, path):
+        """Ставит исходник в очередь копирования. False — не помещается в квоту сейчас."""
+        with self._lock:
+            if key in self._entries or self._closed:
+                return True
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                return True  # недоступный файл пусть читает ffmpeg и сообщает об ошибке сам
+            if self.space.quota_bytes and size > self.space.quota_bytes:
+                return True  # больше всей квоты — читаем напрямую, место не ждём
+            local = self.space.allocate(path, size)
+            if local is None:
+                return False
+            self._entries[key] = {"source": path, "local": local, "state": "queued"}
+            self._pending.append(key)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            return True
+
+    def local_path(self, key):
+        entry = self._entries.get(key)
+        return entry["local"] if entry and entry["state"] == 'ready' else None
+
+    def release(self, key):
+        """Удаляет локальную копию (или отменяет её копирование) и освобождает место."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return
+            if entry["state"] == 'copying':
+                entry["state"] = 'cancelled'  # поток сам удалит файл, дочитав текущий блок
+                return
+        self.space.release(entry["local"])
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._pending.clear()
+        for key in list(self._entries):
+            self.release(key)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._thread = None
+                    return
+                key = self._pending.popleft()
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                entry["state"] = 'copying'
+            ok = self._copy(entry)
+            with self._lock:
+                cancelled = entry["state"] == 'cancelled'
+                if not cancelled:
+                    entry["state"] = 'ready' if ok else 'failed'
+            if cancelled or not ok:
+                self.space.release(entry["local"])
+            if not cancelled and self.on_ready is not None:
+                self.on_ready(key, ok)
+
+    def _copy(self, entry):
+        try:
+            with open(entry["source"], 'rb') as src_file, open(entry["local"], 'wb') as dst_file:
+                while entry["state"] == 'copying':
+                    chunk = src_file.read(self.CHUNK)
+                    if not chunk:
+                        return True
+                    dst_file.write(chunk)
+        except OSError:
+            return False
+        return False
+
+
+# ========== Проверка целостности результата ==========
+def _probe_json(result):
+    try:
+        data = json.loads(result.stdout.decode('utf-8', errors='replace') or '{}')
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _as_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+async def check_integrity(supervisor, ffprobe_cmd, ffmpeg_cmd, source, output, tail_seconds=3.0, notes=None):
+    """Быстрая структурная проверка результата. Возвращает список проблем (пустой — всё в порядке).
+
+    Сравнивает с исходником длительность и набор потоков, проверяет, что число пакетов видео
+    соответствует заявленной длительности (обрезанный mdat / оборванная запись), и что ffprobe
+    вообще открывает файл (нет moov и т.п.). По желанию декодирует последние tail_seconds секунд
+    в -f null. Исходник только демультиплексируется по заголовку, результат — один раз целиком
+    без декодирования, поэтому проверка занимает малую долю времени кодирования.
+    В notes (если передан список) добавляются пропущенные шаги — они не считаются проблемами.
+    """
+    notes = notes if notes is not None else []
+    try:
+        if os.path.getsize(output) == 0:
+            return ["файл результата пустой"]
+    except OSError:
+        return ["файл результата не найден"]
+    entries = 'format=duration:stream=codec_type,avg_frame_rate,duration'
+    source_error = "ffprobe не прочитал исходник"
+    try:
+        source_result = await supervisor.capture(
+            [ffprobe_cmd, '-v', 'error', '-show_entries', entries, '-of', 'json', source], timeout=60)
+    except Exception as e:
+        source_result, source_error = None, f"ffprobe исходника: {str(e) or type(e).__name__}"
+    output_result = await supervisor.capture(
+        [ffprobe_cmd, '-v', 'error', '-count_packets', '-show_entries', entries + ',nb_read_packets',
+         '-of', 'json', output], timeout=600, low_priority=True)
+    if output_result.returncode != 0:
+        lines = output_result.stderr.decode('utf-8', errors='replace').strip().splitlines()
+        return [f"ffprobe не может прочитать результат: {lines[-1] if lines else output_result.returncode}"]
+    source_info = _probe_json(source_result) if source_result is not None and source_result.returncode == 0 else {}
+    output_info = _probe_json(output_result)
+    if not source_info:
+        notes.append(f"сравнение длительности и потоков с исходником пропущено ({source_error})")
+    problems = []
+
+    source_types = {s.get('codec_type') for s in source_info.get('streams', [])} & {'video', 'audio'}
+    output_types = {s.get('codec_type') for s in output_info.get('streams', [])}
+    for missing in sorted(source_types - output_types):
+        problems.append(f"нет потока {missing}")
+
+    source_duration = _as_float(source_info.get('format', {}).get('duration'))
+    output_duration = _as_float(output_info.get('format', {}).get('duration'))
+    if source_duration and output_duration is not None:
+        if abs(output_duration - source_duration) > max(1.0, source_duration * 0.02):
+            problems.append(f"длительность {output_duration:.2f} с вместо {source_duration:.2f} с")
+    elif source_duration:
+        problems.append("у результата не указана длительность")
+
+    for stream in output_info.get('streams', []):
+        if stream.get('codec_type') != 'video':
+            continue
+        packets = _as_float(stream.get('nb_read_packets'))
+        fps = _parse_rate(stream.get('avg_frame_rate'))
+        duration = _as_float(stream.get('duration')) or output_duration
+        if packets is not None and fps and duration:
+            expected = duration * fps
+            if packets < expected * 0.97 - 2:
+                problems.append(f"в видеопотоке {packets:.0f} пакетов, ожидалось ≈{expected:.0f} (данные оборваны)")
+        break
+
+    if tail_seconds and not problems:
+        tail = await supervisor.capture(
+            [ffmpeg_cmd, '-v', 'error', '-sseof', f"-{tail_seconds:g}", '-i', output, '-f', 'null', '-'],
+            timeout=120, low_priority=True)
+        errors = tail.stderr.decode('utf-8', errors='replace').strip().splitlines()
+        if tail.returncode != 0 or errors:
+            problems.append(f"ошибки декодирования последних {tail_seconds:g} с: "
+                            f"{errors[0] if errors else tail.returncode}")
+    return problems
+
+
+# ========== Выборочная проверка качества результата ==========
+def _parse_metric(text, marker):
+    """Последнее значение вида '<marker>0.987' в выводе фильтров ssim/psnr."""
+    position = text.rfind(marker)
+    if position < 0:
+        return None
+    token = text[position + len(marker):].split()[0] if text[position + len(marker):].split() else ""
+    try:
+        return float(token)
+    except ValueError:
+        return None
+
+
+async def measure_quality(supervisor, ffmpeg_cmd, ffprobe_cmd, source, output, windows=3, length=2.0):
+    """SSIM и PSNR результата относительно исходника на нескольких коротких окнах.
+
+    Исходник приводится к размеру кадра результата тем же scale+pad, что и при рендеринге,
+    обе ветки выравниваются по времени (setpts=PTS-STARTPTS). Полный проход не нужен:
+    стоимость — windows × length секунд декодирования. Возвращает
+    {'ssim', 'ssim_min', 'psnr', 'windows'} или None, если измерить не удалось.
+    """
+    media = await probe_media(supervisor, ffprobe_cmd, output)
+    width, height = media['width'], media['height']
+    if not width or not height:
+        return None
+    size = f"{width}:{height}"
+    graph = (f"[0:v]settb=AVTB,setpts=PTS-STARTPTS,split[d0][d1];"
+             f"[1:v]scale={size}:force_original_aspect_ratio=decrease,pad={size}:(ow-iw)/2:(oh-ih)/2,"
+             f"settb=AVTB,setpts=PTS-STARTPTS,split[r0][r1];"
+             f"[d0][r0]ssim;[d1][r1]psnr")
+    scores = []
+    for seek, window in sample_windows(media['duration'], windows, length):
+        cmd = [ffmpeg_cmd, '-hide_banner', '-nostats']
+        seek_args = ['-ss', f"{seek:.3f}"] if seek else []
+        cmd += seek_args + ['-t', f"{window:.3f}", '-i', output]
+        cmd += seek_args + ['-t', f"{window:.3f}", '-i', source]
+        cmd += ['-lavfi', graph, '-f', 'null', '-']
+        result = await supervisor.capture(cmd, timeout=300, low_priority=True)
+        text = result.stderr.decode('utf-8', errors='replace')
+        ssim = _parse_metric(text, "All:")
+        psnr = _parse_metric(text, "average:")
+        if result.returncode != 0 or ssim is None:
+            return None
+        scores.append((ssim, psnr))
+    if not scores:
+        return None
+    psnrs = [p for _, p in scores if p is not None]
+    return {
+        'ssim': sum(s for s, _ in scores) / len(scores),
+        'ssim_min': min(s for s, _ in scores),
+        'psnr': sum(psnrs) / len(psnrs) if psnrs else None,
+        'windows': len(scores),
+    }
+
+
+# ========== Распределённый рендеринг: координатор и узлы ==========
+class RenderCoordinator:
+    """Раздаёт задания рендеринга узлам-исполнителям в аренду (lease), продлеваемую heartbeat'ами.
+
+    Задание, аренда которого истекла (узел пропал), возвращается в очередь и достаётся другому узлу;
+    если живых узлов не осталось, оно отдаётся обратно отправителю (событие 'returned').
+    Если в spec указан output (он же последний аргумент args), каждая аренда пишет в свой временный
+    файл рядом с ним (_lease_output), а в output он переименовывается только при принятом /complete:
+    недописанный файл пропавшего узла не мешает следующему (ffmpeg не перезаписывает файлы).
+    on_event(job_id, kind, data) вызывается вне блокировки из потоков HTTP-сервера и обслуживания:
+    'started', 'progress', 'finished', 'requeued', 'returned', а также 'joined' (job_id=None) для нового узла.
+    """
+    LEASE_SECONDS = 30.0
+    WORKER_TIMEOUT = 15.0
+    POLL_SECONDS = 2.0
+
+    def __init__(self, on_event=None, clock=time.monotonic):
+        self.on_event = on_event
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._pending = collections.deque()
+        self._jobs = {}  # id -> {"spec", "worker", "expires", "leases", "output"}
+        self._workers = {}  # имя узла -> {"slots", "seen", "jobs"}
+        self._stale = {}  # (id, узел) -> файл истёкшей аренды, который не удалось удалить сразу
+        self._ids = itertools.count(1)
+
+    @staticmethod
+    def _lease_output(output, job_id, number):
+        base, ext = os.path.splitext(output)
+        return f"{base}.lease{job_id}-{number}{ext}"  # расширение сохраняем: по нему ffmpeg выбирает формат
+
+    def _remove_outputs(self, paths):
+        """Удаляет файлы прерванных аренд (вне блокировки); занятые (Windows) запоминает до /complete."""
+        for key, path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                with self._lock:
+                    self._stale[key] = path
+
+    def _emit(self, events):
+        if self.on_event is not None:
+            for event in events:
+                self.on_event(*event)
+
+    def _touch(self, worker, slots=None, events=None):
+        entry = self._workers.get(worker)
+        if entry is None:
+            entry = self._workers[worker] = {"slots": 1, "seen": 0.0, "jobs": set()}
+            if events is not None:
+                events.append((None, 'joined', {"worker": worker}))
+        if slots is not None:
+            entry["slots"] = max(1, int(slots))
+        entry["seen"] = self._clock()
+        return entry
+
+    def submit(self, spec):
+        """Ставит задание в очередь; spec — {'args', 'duration', 'memory_limit', 'output'}. Возвращает id."""
+        with self._lock:
+            job_id = str(next(self._ids))
+            self._jobs[job_id] = {"spec": spec, "worker": None, "expires": None, "leases": 0, "output": None}
+            self._pending.append(job_id)
+        return job_id
+
+    def cancel(self, job_id):
+        """Снимает задание: из очереди — сразу, у узла — при следующем heartbeat."""
+        with self._lock:
+            record = self._jobs.pop(job_id, None)
+            try:
+                self._pending.remove(job_id)
+            except ValueError:
+                pass
+        if record is not None and record["output"]:
+            self._remove_outputs([((job_id, record["worker"]), record["output"])])
+
+    def lease(self, worker, slots=1):
+        """Следующее задание для узла ({'id', 'args', ...}) или None."""
+        events = []
+        with self._lock:
+            entry = self._touch(worker, slots, events)
+            job = None
+            while self._pending and len(entry["jobs"]) < entry["slots"]:
+                job_id = self._pending.popleft()
+                if job_id not in self._jobs:
+                    continue
+                record = self._jobs[job_id]
+                record["worker"] = worker
+                record["expires"] = self._clock() + self.LEASE_SECONDS
+                record["leases"] += 1
+                entry["jobs"].add(job_id)
+                job = dict(record["spec"], id=job_id, lease=self.LEASE_SECONDS)
+                if record["spec"].get("output"):
+                    record["output"] = self._lease_output(record["spec"]["output"], job_id, record["leases"])
+                    job["args"] = list(record["spec"]["args"][:-1]) + [record["output"]]
+                events.append((job_id, 'started', {"worker": worker}))
+                break
+        self._emit(events)
+        return job
+
+    def heartbeat(self, worker, reports):
+        """Продлевает аренду заданий узла. reports: {id: {'position', 'lines'}}. Возвращает потерянные id."""
+        events, lost = [], []
+        with self._lock:
+            entry = self._touch(worker, events=events)
+            for job_id, report in reports.items():
+                record = self._jobs.get(job_id)
+                if record is None or record["worker"] != worker:
+                    lost.append(job_id)
+                    entry["jobs"].discard(job_id)
+                    continue
+                record["expires"] = self._clock() + self.LEASE_SECONDS
+                events.append((job_id, 'progress', dict(report, worker=worker)))
+        self._emit(events)
+        return lost
+
+    def complete(self, worker, job_id, success, tail=()):
+        """Результат задания. False — аренда уже потеряна и результат не принят."""
+        with self._lock:
+            entry = self._touch(worker)
+            entry["jobs"].discard(job_id)
+            record = self._jobs.get(job_id)
+            if record is None or record["worker"] != worker:
+                stale = self._stale.pop((job_id, worker), None)
+                record = None
+            else:
+                del self._jobs[job_id]
+        if record is None:
+            if stale:
+                self._remove_outputs([((job_id, worker), stale)])
+            return False
+        tail = list(tail)
+        if record["output"]:
+            if success:
+                try:
+                    os.replace(record["output"], record["spec"]["output"])
+                except OSError as e:
+                    success = False
+                    tail.append(f"не удалось переименовать результат: {e}")
+            if not success:
+                self._remove_outputs([((job_id, worker), record["output"])])
+        self._emit([(job_id, 'finished', {"worker": worker, "success": bool(success), "tail": tail})])
+        return True
+
+    def expire(self):
+        """Возвращает в очередь задания с истёкшей арендой; без живых узлов — отдаёт их отправителю."""
+        events, abandoned = [], []
+        with self._lock:
+            now = self._clock()
+            for job_id, record in list(self._jobs.items()):
+                if record["worker"] is not None and record["expires"] < now:
+                    self._workers.get(record["worker"], {"jobs": set()})["jobs"].discard(job_id)
+                    events.append((job_id, 'requeued', {"worker": record["worker"]}))
+                    if record["output"]:
+                        abandoned.append(((job_id, record["worker"]), record["output"]))
+                    record["worker"] = record["expires"] = record["output"] = None
+                    self._pending.appendleft(job_id)
+            for name, entry in list(self._workers.items()):
+                if now - entry["seen"] > self.WORKER_TIMEOUT and not entry["jobs"]:
+                    del self._workers[name]
+            if self._pending and not self._workers:
+                while self._pending:
+                    job_id = self._pending.popleft()
+                    if self._jobs.pop(job_id, None) is not None:
+                        events.append((job_id, 'returned', {}))
+        self._remove_outputs(abandoned)
+        self._emit(events)
+
+    def live_slots(self):
+        with self._lock:
+            now = self._clock()
+            return sum(entry["slots"] for entry in self._workers.values() if now - entry["seen"] <= self.WORKER_TIMEOUT)
+
+    def status(self):
+        with self._lock:
+            now = self._clock()
+            return {
+                "pending": len(self._pending),
+                "workers": {name: {"slots": entry["slots"], "running": sorted(entry["jobs"]),
+                                   "seen": round(now - entry["seen"], 1)} for name, entry in self._workers.items()},
+            }
+
+    def shutdown(self):
+        """Отдаёт отправителю все незавершённые задания (координатор останавливается)."""
+        with self._lock:
+            events = [(job_id, 'returned', {}) for job_id in self._jobs]
+            self._jobs.clear()
+            self._pending.clear()
+            self._workers.clear()
+        self._emit(events)
+
+
+def token_matches(expected, received):
+    """Сравнение токена за постоянное время (не выдаёт по времени ответа, сколько символов совпало)."""
+    return hmac.compare_digest(expected.encode('utf-8'), (received or "").encode('utf-8'))
+
+
+class CoordinatorServer:
+    """HTTP-интерфейс RenderCoordinator: POST /lease, /heartbeat, /complete и GET /status (JSON).
+
+    Координатор слушает все интерфейсы и отдаёт узлам команды и пути, поэтому токен обязателен:
+    запросы без заголовка X-CineConvert-Token с тем же значением отклоняются.
+    """
+    TOKEN_HEADER = "X-CineConvert-Token"
+
+    def __init__(self, coordinator, host="0.0.0.0", port=8765, token=""):
+        if not token:
+            raise ValueError("координатору нужен токен")
+        self.coordinator = coordinator
+        self.host = host
+        self.token = token
+        self._requested_port = port
+        self._server = None
+        self._stop = threading.Event()
+
+    @property
+    def port(self):
+        return self._server.server_address[1] if self._server else self._requested_port
+
+    def start(self):
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+        coordinator, token, header = self.coordinator, self.token, self.TOKEN_HEADER
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, code, payload):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _authorized(self):
+                if not token_matches(token, self.headers.get(header)):
+                    self._reply(403, {"error": "неверный токен"})
+                    return False
+                return True
+
+            def do_GET(self):
+                if not self._authorized():
+                    return
+                if self.path == "/status":
+                    self._reply(200, coordinator.status())
+                else:
+                    self._reply(404, {"error": "неизвестный путь"})
+
+            def do_POST(self):
+                if not self._authorized():
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length") or 0)
+                    data = json.loads(self.rfile.read(length) or b'{}')
+                    worker = str(data["worker"])
+                except (ValueError, KeyError, TypeError):
+                    self._reply(400, {"error": "некорректный запрос"})
+                    return
+                if self.path == "/lease":
+                    self._reply(200, {"job": coordinator.lease(worker, data.get("slots", 1)),
+                                      "poll": coordinator.POLL_SECONDS})
+                elif self.path == "/heartbeat":
+                    self._reply(200, {"lost": coordinator.heartbeat(worker, data.get("jobs") or {})})
+                elif self.path == "/complete":
+                    accepted = coordinator.complete(worker, str(data.get("id")), data.get("success"), data.get("tail") or ())
+                    self._reply(200, {"accepted": accepted})
+                else:
+                    self._reply(404, {"error": "неизвестный путь"})
+
+        self._server = ThreadingHTTPServer((self.host, self._requested_port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="render-coordinator", daemon=True).start()
+        threading.Thread(target=self._reap, name="render-coordinator-leases", daemon=True).start()
+
+    def _reap(self):
+        while not self._stop.wait(1.0):
+            self.coordinator.expire()
+
+    def stop(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        self.coordinator.shutdown()
+
+
+class RenderNode:
+    """Исполнитель на узле: берёт задания у координатора, запускает свой ffmpeg, шлёт heartbeat и итог.
+
+    Пути в командах должны быть одинаковыми на всех узлах (общее хранилище смонтировано по тем же путям).
+    """
+    HEARTBEAT_SECONDS = 5.0
+    TICK = 0.5
+    TAIL_LINES = 20
+
+    def __init__(self, url, name, slots=1, ffmpeg_cmd="ffmpeg", token="", supervisor=None, log=print):
+        self.url = url.rstrip('/')
+        self.name = name
+        self.slots = max(1, slots)
+        self.ffmpeg_cmd = ffmpeg_cmd
+        self.token = token
+        self.supervisor = supervisor or get_supervisor()
+        self.log = log
+        self._running = {}  # id -> {"handle", "lines"}
+        self._done = collections.deque()  # (id, handle) от колбэков супервизора
+
+    def _call(self, path, payload):
+        import urllib.request
+        request = urllib.request.Request(self.url + path, data=json.dumps(dict(payload, worker=self.name)).encode('utf-8'),
+                                         headers={"Content-Type": "application/json"})
+        if self.token:
+            request.add_header(CoordinatorServer.TOKEN_HEADER, self.token)
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return json.loads(response.read() or b'{}')
+
+    def _start(self, job):
+        job_id = job["id"]
+        lines = collections.deque(maxlen=self.TAIL_LINES)
+        self._running[job_id] = {"handle": None, "lines": lines}
+        self.log(f"[{self.name}] задание {job_id}: {' '.join(job['args'][-1:])}")
+        self._running[job_id]["handle"] = self.supervisor.submit(
+            [self.ffmpeg_cmd] + list(job["args"]),
+            on_lines=lines.extend,
+            on_finished=lambda handle, job_id=job_id: self._done.append((job_id, handle)),
+            memory_limit=job.get("memory_limit"))
+
+    def _heartbeat(self):
+        reports = {}
+        for job_id, entry in self._running.items():
+            parser = entry["handle"].parser if entry["handle"] else None
+            reports[job_id] = {"position": parser.current_time if parser else None, "lines": list(entry["lines"])}
+            entry["lines"].clear()
+        for job_id in self._call("/heartbeat", {"jobs": reports}).get("lost", []):
+            entry = self._running.pop(job_id, None)
+            if entry and entry["handle"]:
+                self.log(f"[{self.name}] аренда задания {job_id} потеряна — останавливаем")
+                entry["handle"].cancel()
+
+    def run(self, stop=None):
+        """Цикл узла до stop.is_set(). Сетевые ошибки не прерывают уже идущие задания."""
+        stop = stop or threading.Event()
+        next_heartbeat = next_poll = 0.0
+        while not stop.is_set():
+            now = time.monotonic()
+            try:
+                while self._done:
+                    job_id, handle = self._done.popleft()
+                    entry = self._running.pop(job_id, None)
+                    if entry is None:
+                        continue  # аренду уже отдали другому узлу
+                    success = handle.returncode == 0 and not handle.cancelled
+                    # Строки, ещё не отправленные с heartbeat (в т.ч. сообщение об ошибке в конце)
+                    self._call("/complete", {"id": job_id, "success": success, "tail": list(entry["lines"])})
+                    self.log(f"[{self.name}] задание {job_id}: {'готово' if success else 'ошибка'}")
+                if self._running and now >= next_heartbeat:
+                    self._heartbeat()
+                    next_heartbeat = now + self.HEARTBEAT_SECONDS
+                if len(self._running) < self.slots and now >= next_poll:
+                    reply = self._call("/lease", {"slots": self.slots})
+                    if reply.get("job"):
+                        self._start(reply["job"])
+                        next_heartbeat = min(next_heartbeat, now + self.HEARTBEAT_SECONDS)
+                    else:
+                        next_poll = now + float(reply.get("poll") or RenderCoordinator.POLL_SECONDS)
+            except (OSError, ValueError) as e:
+                self.log(f"[{self.name}] координатор недоступен: {e}")
+                next_poll = now + RenderCoordinator.POLL_SECONDS
+                stop.wait(RenderCoordinator.POLL_SECONDS)
+                continue
+            stop.wait(self.TICK)
+        for entry in self._running.values():
+            if entry["handle"]:
+                entry["handle"].cancel()
+
+
+class RemoteRenderJob(QObject):
+    """Задание, выполняемое узлом через RenderCoordinator, с интерфейсом сигналов FFmpegWorker.
+
+    returned — координатор не смог его выполнить (не осталось узлов): задание нужно вернуть в очередь.
+    """
+    timeUpdated = pyqtSignal(float, float)
+    outputReceived = pyqtSignal(str)
+    finished = pyqtSignal(bool)
+    returned = pyqtSignal()
+
+    def __init__(self, coordinator, args, duration=None, memory_limit=None, output=None):
+        super().__init__()
+        self.coordinator = coordinator
+        self.spec = {"args": list(args), "duration": duration, "memory_limit": memory_limit, "output": output}
+        self.duration = duration or 0.0
+        self.job_id = None
+        self.node = None
+
+    def start(self):
+        self.job_id = self.coordinator.submit(self.spec)
+
+    def cancel(self):
+        # Координатор снимает задание молча (узел узнает при heartbeat) — итог сообщаем сами
+        if self.job_id is not None:
+            self.coordinator.cancel(self.job_id)
+            self.job_id = None
+            self.finished.emit(False)
+
+    def isRunning(self):
+        return self.job_id is not None
+
+    def handle_event(self, kind, data):
+        """Событие координатора (в потоке GUI)."""
+        if kind == 'started':
+            self.node = data["worker"]
+            self.outputReceived.emit(f"Узел {self.node} принял задание")
+        elif kind == 'progress':
+            for line in data.get("lines") or ():
+                self.outputReceived.emit(f"{self.node}: {line.strip()}")
+            if data.get("position") is not None:
+                self.timeUpdated.emit(float(data["position"]), self.duration)
+        elif kind == 'requeued':
+            self.outputReceived.emit(f"⚠️ Узел {data['worker']} не отвечает — задание возвращено в очередь координатора")
+            self.node = None
+        elif kind == 'finished':
+            for line in data.get("tail") or ():
+                self.outputReceived.emit(f"{data['worker']}: {line.strip()}")
+            self.finished.emit(data["success"])
+        elif kind == 'returned':
+            self.returned.emit()
+
+
+# ========== Локальный API управления заданиями ==========
+class JobBoard:
+    """Снимок состояния заданий пакета для API: пишет поток GUI, читают потоки HTTP-сервера.
+
+    Запросы статуса обслуживаются из снимка под блокировкой и к Qt не обращаются. Каждое изменение
+    попадает и в журнал событий с последовательными номерами (последние EVENT_LOG), откуда /events
+    раздаёт поток; клиенту, отставшему сильнее журнала, приходит событие 'overflow' — пора перечитать /jobs.
+    """
+    STATES = ("probing", "queued", "running", "verifying", "done", "failed", "cancelled")
+    FINAL = ("done", "failed", "cancelled")
+    EVENT_LOG = 2000
+    KEEP_JOBS = 1000  # сверх этого забываются самые старые завершённые задания
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._ids = itertools.count(1)
+        self._jobs = {}  # id -> запись; порядок — порядок добавления
+        self._events = collections.deque(maxlen=self.EVENT_LOG)
+        self._seq = 0
+        self._batch = {}
+
+    def _emit(self, kind, record):
+        self._seq += 1
+        self._events.append({"seq": self._seq, "type": kind, "job": dict(record)})
+        self._cond.notify_all()
+
+    def add(self, origin, path, output=None, priority=0, state="probing"):
+        """Регистрирует задание и возвращает его идентификатор."""
+        now = self._clock()
+        with self._cond:
+            job_id = str(next(self._ids))
+            record = {"id": job_id, "origin": origin, "input": path, "output": output, "priority": priority,
+                      "state": state, "progress": 0.0, "position": None, "duration": None, "node": None,
+                      "error": None, "quality": None, "created": now, "updated": now}
+            self._jobs[job_id] = record
+            self._emit("added", record)
+            if len(self._jobs) > self.KEEP_JOBS:
+                for old_id in [i for i, r in self._jobs.items() if r["state"] in self.FINAL][:len(self._jobs) - self.KEEP_JOBS]:
+                    del self._jobs[old_id]
+        return job_id
+
+    def update(self, job_id, **fields):
+        """Изменяет поля задания; событие 'state' при смене состояния, иначе 'progress'."""
+        with self._cond:
+            record = self._jobs.get(job_id)
+            if record is None:
+                return
+            changed = {k: v for k, v in fields.items() if record.get(k) != v}
+            if not changed:
+                return
+            record.update(changed, updated=self._clock())
+            self._emit("state" if "state" in changed else "progress", record)
+
+    def get(self, job_id):
+        with self._cond:
+            record = self._jobs.get(job_id)
+            return dict(record) if record is not None else None
+
+    def jobs(self, state=None):
+        with self._cond:
+            return [dict(r) for r in self._jobs.values() if state is None or r["state"] == state]
+
+    def set_batch(self, **fields):
+        """Сводка пакета (доля, ETA) — без события, её читают через /status."""
+        with self._cond:
+            self._batch.update(fields)
+
+    def active_outputs(self):
+        """Пути результатов (_path_key) незавершённых заданий."""
+        with self._cond:
+            return {_path_key(r["output"]) for r in self._jobs.values() if r["output"] and r["state"] not in self.FINAL}
+
+    def status(self):
+        with self._cond:
+            counts = collections.Counter(r["state"] for r in self._jobs.values())
+            return {"jobs": {state: counts[state] for state in self.STATES}, "batch": dict(self._batch),
+                    "seq": self._seq}
+
+    def events(self, since, timeout):
+        """События с номером больше since (ждёт до timeout секунд или wake): (список, последний номер)."""
+        with self._cond:
+            since = min(since, self._seq)  # номер из прошлого запуска программы
+            if since == self._seq:
+                self._cond.wait(timeout)
+            first = self._events[0]["seq"] if self._events else self._seq + 1
+            result = []
+            if since + 1 < first:
+                result.append({"seq": first - 1, "type": "overflow"})
+            result.extend(itertools.islice(self._events, max(0, since + 1 - first), None))
+            return result, self._seq
+
+    def wake(self):
+        """Будит ожидающих events() без новых событий (остановка сервера)."""
+        with self._cond:
+            self._cond.notify_all()
+
+
+class ControlServer:
+    """Локальный HTTP API управления заданиями (JSON) на 127.0.0.1:port или на Unix-сокете.
+
+      GET    /jobs[?state=...]  — задания;               GET /jobs/<id> — одно задание
+      POST   /jobs              — поставить задания (тело — как манифест пакета) → 202 {"ids": [...]};
+                                   output, который уже пишет незавершённое задание, — 409
+      DELETE /jobs/<id>         — отменить (или POST /jobs/<id>/cancel)
+      GET    /status            — число заданий по состояниям и сводка пакета
+      GET    /presets           — имена пресетов кодировщика
+      GET    /events?since=N    — поток событий: строки JSON, а с Accept: text/event-stream — SSE
+
+    Чтение обслуживается из JobBoard. submit(entries) и cancel(id) вызываются в потоке сервера
+    и должны только передать запрос в поток GUI.
+
+    Каждый запрос несёт токен в заголовке TOKEN_HEADER. На TCP-порту сервер вдобавок отклоняет
+    запросы с заголовком Origin и с чужим Host, а POST /jobs принимает только application/json:
+    иначе любая страница в браузере пользователя могла бы ставить задания (в том числе через
+    DNS rebinding).
+    """
+    TOKEN_HEADER = CoordinatorServer.TOKEN_HEADER
+    LOCAL_HOSTS = ("127.0.0.1", "localhost")
+    PING_SECONDS = 15.0
+    MAX_BODY = 4 * 1024 * 1024
+    BACKLOG = 128  # очередь соединений: частый опрос статуса многими клиентами (по умолчанию 5)
+    CANCELLABLE = ("probing", "queued", "running")
+
+    def __init__(self, board, submit, cancel, presets=dict, port=8766, socket_path="", token=""):
+        if not token:
+            raise ValueError("API управления нужен токен")
+        self.board = board
+        self.submit = submit
+        self.cancel = cancel
+        self.presets = presets
+        self.socket_path = socket_path
+        self.token = token
+        self._requested_port = port
+        self._server = None
+        self._stop = threading.Event()
+        self._submit_lock = threading.Lock()  # проверка занятых output и добавление — одним шагом
+
+    @property
+    def port(self):
+        return self._server.server_address[1] if self._server and not self.socket_path else self._requested_port
+
+    @property
+    def address(self):
+        return self.socket_path or f"http://127.0.0.1:{self.port}"
+
+    def start(self):
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+        import urllib.parse
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, code, payload):
+                body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _route(self):
+                if not server.socket_path:
+                    # Запрос со страницы в браузере (Origin) или по чужому имени (DNS rebinding)
+                    host = urllib.parse.urlsplit("//" + (self.headers.get("Host") or "")).hostname
+                    if host not in server.LOCAL_HOSTS or self.headers.get("Origin") is not None:
+                        self._reply(403, {"error": "запрос не с этого компьютера"})
+                        return None, None
+                if not token_matches(server.token, self.headers.get(server.TOKEN_HEADER)):
+                    self._reply(403, {"error": "неверный токен"})
+                    return None, None
+                url = urllib.parse.urlsplit(self.path)
+                return [part for part in url.path.split('/') if part], urllib.parse.parse_qs(url.query)
+
+            def do_GET(self):
+                parts, query = self._route()
+                if parts is None:
+                    return
+                board = server.board
+                if parts == ["jobs"]:
+                    self._reply(200, {"jobs": board.jobs((query.get("state") or [None])[0])})
+                elif len(parts) == 2 and parts[0] == "jobs":
+                    record = board.get(parts[1])
+                    if record is None:
+                        self._reply(404, {"error": "нет такого задания"})
+                    else:
+                        self._reply(200, record)
+                elif parts == ["status"]:
+                    self._reply(200, board.status())
+                elif parts == ["presets"]:
+                    self._reply(200, {"presets": sorted(server.presets())})
+                elif parts == ["events"]:
+                    try:
+                        since = int((query.get("since") or [self.headers.get("Last-Event-ID") or 0])[0])
+                    except ValueError:
+                        self._reply(400, {"error": "since должен быть числом"})
+                        return
+                    self._stream(since, "text/event-stream" in (self.headers.get("Accept") or ""))
+                else:
+                    self._reply(404, {"error": "неизвестный путь"})
+
+            def do_POST(self):
+                parts, _ = self._route()
+                if parts is None:
+                    return
+                if len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+                    self._cancel(parts[1])
+                    return
+                if parts != ["jobs"]:
+                    self._reply(404, {"error": "неизвестный путь"})
+                    return
+                if (self.headers.get("Content-Type") or "").split(";")[0].strip().lower() != "application/json":
+                    self._reply(415, {"error": "тело запроса должно быть application/json"})
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length") or 0)
+                    if length > server.MAX_BODY:
+                        raise ValueError("слишком большой запрос")
+                    data = json.loads(self.rfile.read(length) or b'null')
+                    if isinstance(data, dict) and "jobs" not in data:
+                        data = [data]  # одно задание без обёртки
+                    entries = parse_batch_jobs(data, None, server.presets())
+                except ValueError as e:  # в том числе ошибки JSON
+                    self._reply(400, {"error": str(e)})
+                    return
+                with server._submit_lock:
+                    busy = server.board.active_outputs()
+                    taken = [entry["output"] for entry in entries if entry["output"] and _path_key(entry["output"]) in busy]
+                    if taken:
+                        self._reply(409, {"error": "результат уже пишет другое задание: " + ", ".join(taken)})
+                        return
+                    for entry in entries:
+                        entry["id"] = server.board.add("api", entry["input"], entry["output"], entry["priority"])
+                server.submit(entries)
+                self._reply(202, {"ids": [entry["id"] for entry in entries]})
+
+            def do_DELETE(self):
+                parts, _ = self._route()
+                if parts is None:
+                    return
+                if len(parts) == 2 and parts[0] == "jobs":
+                    self._cancel(parts[1])
+                else:
+                    self._reply(404, {"error": "неизвестный путь"})
+
+            def _cancel(self, job_id):
+                record = server.board.get(job_id)
+                if record is None:
+                    self._reply(404, {"error": "нет такого задания"})
+                elif record["state"] not in server.CANCELLABLE:
+                    self._reply(409, {"error": f"задание в состоянии {record['state']}"})
+                else:
+                    server.cancel(job_id)
+                    self._reply(202, {"id": job_id})
+
+            def _stream(self, since, sse):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream" if sse else "application/x-ndjson")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                try:
+                    while not server._stop.is_set():
+                        events, since = server.board.events(since, server.PING_SECONDS)
+                        if server._stop.is_set():
+                            return
+                        if sse:
+                            chunk = "".join(f"id: {e['seq']}\nevent: {e['type']}\ndata: {json.dumps(e, ensure_ascii=False)}\n\n"
+                                            for e in events) or ": ping\n\n"
+                        else:
+                            chunk = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in events) or '{"type": "ping"}\n'
+                        self.wfile.write(chunk.encode('utf-8'))
+                        self.wfile.flush()
+                except OSError:
+                    pass  # клиент отключился
+
+        if self.socket_path:
+            import socketserver
+            if not hasattr(socketserver, "ThreadingUnixStreamServer"):
+                raise OSError("Unix-сокеты недоступны в этой системе")
+
+            class UnixServer(socketserver.ThreadingUnixStreamServer):
+                request_queue_size = server.BACKLOG
+
+                def get_request(self):
+                    request, _ = super().get_request()
+                    return request, ("local", 0)  # BaseHTTPRequestHandler ждёт пару (адрес, порт)
+
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)  # сокет прошлого запуска
+            self._server = UnixServer(self.socket_path, Handler)
+            os.chmod(self.socket_path, 0o600)  # доступ — только владельцу
+        else:
+            class TCPServer(ThreadingHTTPServer):
+                request_queue_size = server.BACKLOG
+
+            # Только локальный интерфейс: API ставит задачи на чтение и запись любых файлов пользователя
+            self._server = TCPServer(("127.0.0.1", self._requested_port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="control-api", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        self.board.wake()  # открытые потоки событий завершаются
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            if self.socket_path:
+                try:
+                    os.remove(self.socket_path)
+                except OSError:
+                    pass
+
+
+# ========== Каталог медиатеки ==========
+MEDIA_EXTENSIONS = {'.mp4', '.mkv', '.mov', '.avi', '.flv', '.webm', '.m4v', '.ts', '.mts', '.m2ts',
+                    '.mpg', '.mpeg', '.wmv', '.vob'}
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class StreamRecord:
+    """Поток файла в каталоге. __slots__: на сотнях тысяч записей словари атрибутов заметно дороже."""
+    __slots__ = ('index', 'kind', 'codec', 'width', 'height', 'fps', 'channels', 'sample_rate', 'language', 'bitrate')
+
+    def __init__(self, index, kind, codec, width=None, height=None, fps=None, channels=None, sample_rate=None,
+                 language=None, bitrate=None):
+        self.index = index
+        self.kind = kind
+        self.codec = codec
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.language = language
+        self.bitrate = bitrate
+
+    @classmethod
+    def from_probe(cls, raw, fallback_index):
+        return cls(
+            raw.get('index', fallback_index), raw.get('codec_type'), raw.get('codec_name'),
+            _as_int(raw.get('width')), _as_int(raw.get('height')), _parse_rate(raw.get('avg_frame_rate')),
+            _as_int(raw.get('channels')), _as_int(raw.get('sample_rate')),
+            (raw.get('tags') or {}).get('language'), _as_int(raw.get('bit_rate')),
+        )
+
+
+class MediaRecord:
+    """Файл в каталоге: контейнер, основной видеопоток (для индексов) и список StreamRecord."""
+    __slots__ = ('path', 'size', 'mtime_ns', 'format', 'duration', 'bitrate', 'video_codec', 'width', 'height',
+                 'streams')
+
+    def __init__(self, path, size, mtime_ns, format=None, duration=None, bitrate=None, video_codec=None,
+                 width=None, height=None, streams=()):
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.format = format
+        self.duration = duration
+        self.bitrate = bitrate
+        self.video_codec = video_codec
+        self.width = width
+        self.height = height
+        self.streams = list(streams)
+
+    @classmethod
+    def from_probe(cls, path, size, mtime_ns, info):
+        """Запись из JSON ffprobe -show_format -show_streams. Пустой info — файл не открылся."""
+        streams = []
+        for raw in info.get('streams') or []:
+            if raw.get('codec_type') not in ('video', 'audio', 'subtitle'):
+                continue
+            if raw.get('codec_type') == 'video' and (raw.get('disposition') or {}).get('attached_pic'):
+                continue  # обложка, а не видео
+            streams.append(StreamRecord.from_probe(raw, len(streams)))
+        fmt = info.get('format') or {}
+        video = next((s for s in streams if s.kind == 'video'), None)
+        return cls(path, size, mtime_ns, fmt.get('format_name'), _as_float(fmt.get('duration')),
+                   _as_int(fmt.get('bit_rate')), video.codec if video else None,
+                   video.width if video else None, video.height if video else None, streams)
+
+
+class CatalogQuery:
+    """Условия отбора файлов каталога. Строится вызовами where() или из текста parse().
+
+    Текстовая форма — условия через пробел: «vcodec=h264 height>=1080 acodec=ac3 path~"Фильмы"».
+    Операции: = != > >= < <= и ~ (подстрока). Условия объединяются через И.
+    """
+    # поле -> (столбец files, тип)
+    FILE_FIELDS = {
+        "vcodec": ("video_codec", str), "width": ("width", int), "height": ("height", int),
+        "duration": ("duration", float), "bitrate": ("bitrate", int), "size": ("size", int),
+        "format": ("format", str), "path": ("path", str),
+    }
+    # поле -> (тип потока, столбец streams): условие выполняется, если такой поток есть
+    STREAM_FIELDS = {
+        "acodec": ("audio", "codec"), "alang": ("audio", "language"),
+        "scodec": ("subtitle", "codec"), "slang": ("subtitle", "language"),
+    }
+    OPERATORS = ('>=', '<=', '!=', '=', '>', '<', '~')
+
+    def __init__(self):
+        self.conditions = []  # (поле, операция, значение)
+
+    def where(self, field, op, value):
+        if field not in self.FILE_FIELDS and field not in self.STREAM_FIELDS:
+            raise ValueError(f"неизвестное поле «{field}»; доступны: "
+                             + ", ".join(sorted({**self.FILE_FIELDS, **self.STREAM_FIELDS})))
+        if op not in self.OPERATORS:
+            raise ValueError(f"неизвестная операция «{op}»")
+        kind = self.FILE_FIELDS[field][1] if field in self.FILE_FIELDS else str
+        if kind is str:
+            if op not in ('=', '!=', '~'):
+                raise ValueError(f"поле «{field}» сравнивается только через =, != или ~")
+            value = str(value)
+        else:
+            if op == '~':
+                raise ValueError(f"поле «{field}» числовое — операция ~ к нему неприменима")
+            try:
+                value = kind(str(value).rstrip('pP') if field in ('width', 'height') else value)
+            except ValueError:
+                raise ValueError(f"«{value}» — не число (поле «{field}»)")
+        self.conditions.append((field, op, value))
+        return self
+
+    @classmethod
+    def parse(cls, text):
+        import shlex
+        query = cls()
+        for token in shlex.split(text or ""):
+            for op in cls.OPERATORS:
+                field, found, value = token.partition(op)
+                if found and field and value:
+                    query.where(field.strip().lower(), op, value)
+                    break
+            else:
+                raise ValueError(f"не понято условие «{token}»: ожидается поле, операция и значение")
+        return query
+
+    def sql(self):
+        """(WHERE-часть, параметры) для запроса к таблице files с псевдонимом f."""
+        clauses, params = [], []
+        for field, op, value in self.conditions:
+            if field in self.FILE_FIELDS:
+                column, kind = self.FILE_FIELDS[field]
+                column = f"f.{column}"
+            else:
+                stream_kind, column = self.STREAM_FIELDS[field]
+                kind = str
+            if kind is str and field != "path":
+                value = value.lower()
+            if op == '~':
+                # % и _ в искомой подстроке — обычные символы, а не шаблоны LIKE
+                escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                expr, value = f"{column} LIKE ? ESCAPE '\\'", f"%{escaped}%"
+            elif op == '!=':
+                expr = f"({column} IS NULL OR {column} != ?)"
+            else:
+                expr = f"{column} {op} ?"
+            if field in self.STREAM_FIELDS:
+                if op == '!=':
+                    # «нет потока с таким значением», а не «есть поток с другим»
+                    expr = f"f.id NOT IN (SELECT file_id FROM streams WHERE kind = ? AND {column} = ?)"
+                else:
+                    expr = f"f.id IN (SELECT file_id FROM streams WHERE kind = ? AND {expr})"
+                params.append(stream_kind)
+            clauses.append(expr)
+            params.append(value)
+        return (" AND ".join(clauses) or "1"), params
+
+
+class MediaCatalog:
+    """Каталог медиатеки в SQLite: сведения ffprobe о файлах и потоках с индексами для запросов.
+
+    Повторное сканирование перепроверяет только новые файлы и файлы с изменившимися размером
+    или временем изменения; исчезнувшие файлы удаляются. У каждого потока своё соединение.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS files (
+            id INTEGER PRIMARY KEY,
+            path TEXT NOT NULL UNIQUE,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            format TEXT,
+            duration REAL,
+            bitrate INTEGER,
+            video_codec TEXT,
+            width INTEGER,
+            height INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS streams (
+            file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+            idx INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            codec TEXT,
+            width INTEGER,
+            height INTEGER,
+            fps REAL,
+            channels INTEGER,
+            sample_rate INTEGER,
+            language TEXT,
+            bitrate INTEGER,
+            PRIMARY KEY (file_id, idx)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS files_video ON files(video_codec, height);
+        CREATE INDEX IF NOT EXISTS files_height ON files(height);
+        CREATE INDEX IF NOT EXISTS files_duration ON files(duration);
+        CREATE INDEX IF NOT EXISTS streams_codec ON streams(kind, codec, file_id);
+        CREATE INDEX IF NOT EXISTS streams_language ON streams(kind, language, file_id);
+    """
+    # Файлов на одну транзакцию и на одну пачку параллельных ffprobe
+    CHUNK = 256
+    PROBE_TIMEOUT = 30
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _db(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            import sqlite3
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.executescript(self.SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    @staticmethod
+    def walk(roots):
+        """(путь, размер, mtime_ns) медиафайлов в папках roots, рекурсивно, без перехода по ссылкам на папки."""
+        stack = [os.path.abspath(root) for root in roots]
+        while stack:
+            directory = stack.pop()
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif os.path.splitext(entry.name)[1].lower() in MEDIA_EXTENSIONS:
+                        st = entry.stat()
+                        yield entry.path, st.st_size, st.st_mtime_ns
+                except OSError:
+                    continue
+
+    def _known(self, root):
+        """{путь: (размер, mtime_ns)} записей каталога внутри root — диапазон по индексу path."""
+        prefix = os.path.join(os.path.abspath(root), '')
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        rows = self._db().execute("SELECT path, size, mtime_ns FROM files WHERE path >= ? AND path < ?",
+                                  (prefix, upper))
+        return {path: (size, mtime) for path, size, mtime in rows}
+
+    def changed(self, roots):
+        """(файлы для ffprobe, исчезнувшие пути, всего файлов на диске)."""
+        known = {}
+        for root in roots:
+            known.update(self._known(root))
+        stale, seen = [], 0
+        for path, size, mtime_ns in self.walk(roots):
+            seen += 1
+            if known.pop(path, None) != (size, mtime_ns):
+                stale.append((path, size, mtime_ns))
+        return stale, list(known), seen
+
+    def store(self, records):
+        conn = self._db()
+        with conn:
+            for record in records:
+                # REPLACE удаляет старую строку, и ON DELETE CASCADE убирает её потоки
+                cursor = conn.execute(
+                    "INSERT OR REPLACE INTO files (path, size, mtime_ns, format, duration, bitrate, video_codec, "
+                    "width, height) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (record.path, record.size, record.mtime_ns, record.format, record.duration, record.bitrate,
+                     record.video_codec, record.width, record.height))
+                conn.executemany(
+                    "INSERT INTO streams VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(cursor.lastrowid, s.index, s.kind, s.codec, s.width, s.height, s.fps, s.channels,
+                      s.sample_rate, s.language, s.bitrate) for s in record.streams])
+
+    def remove(self, paths):
+        conn = self._db()
+        with conn:
+            conn.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in paths])
+
+    def scan(self, supervisor, ffprobe_cmd, roots, parallel=4, on_progress=None, cancelled=None):
+        """Обновляет каталог по папкам roots. Блокирующий вызов — для фонового потока или CLI.
+
+        on_progress(обработано, всего) вызывается после каждой пачки; cancelled() — проверка отмены
+        (запущенные ffprobe дорабатывают, незавершённая пачка не сохраняется). Возвращает статистику
+        {'files', 'probed', 'removed', 'failed'}.
+        """
+        stale, removed, seen = self.changed(roots)
+        self.remove(removed)
+
+        async def _probe_chunk(chunk):
+            import asyncio
+            limit = asyncio.Semaphore(parallel)
+
+            async def _probe(path):
+                cmd = [ffprobe_cmd, '-v', 'error', '-show_format', '-show_streams', '-of', 'json', path]
+                async with limit:
+                    if cancelled is not None and cancelled():
+                        return {}
+                    try:
+                        result = await supervisor.capture(cmd, timeout=self.PROBE_TIMEOUT, low_priority=True)
+                    except Exception:
+                        return {}
+                return _probe_json(result) if result.returncode == 0 else {}
+            return await asyncio.gather(*(_probe(path) for path, _, _ in chunk))
+
+        failed = done = 0
+        for start in range(0, len(stale), self.CHUNK):
+            if cancelled is not None and cancelled():
+                break
+            chunk = stale[start:start + self.CHUNK]
+            infos = supervisor.run_coroutine(_probe_chunk(chunk)).result()
+            if cancelled is not None and cancelled():
+                break  # прерванную пачку не сохраняем: её файлы проверятся при следующем сканировании
+            records = []
+            for (path, size, mtime_ns), info in zip(chunk, infos):
+                # Неоткрывшиеся файлы тоже запоминаем, чтобы не пробовать их при каждом сканировании
+                failed += not info
+                records.append(MediaRecord.from_probe(path, size, mtime_ns, info))
+            self.store(records)
+            done += len(chunk)
+            if on_progress is not None:
+                on_progress(done, len(stale))
+        return {"files": seen, "probed": done, "removed": len(removed), "failed": failed}
+
+    def query(self, query, limit=None, with_streams=False):
+        """Записи, подходящие под CatalogQuery, по пути. with_streams — загрузить и потоки."""
+        where, params = query.sql()
+        sql = (f"SELECT f.id, f.path, f.size, f.mtime_ns, f.format, f.duration, f.bitrate, f.video_codec, "
+               f"f.width, f.height FROM files f WHERE {where} ORDER BY f.path")
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        conn = self._db()
+        records, ids = [], {}
+        for row in conn.execute(sql, params):
+            record = MediaRecord(*row[1:])
+            records.append(record)
+            ids[row[0]] = record
+        if with_streams and ids:
+            keys = list(ids)
+            for start in range(0, len(keys), 500):  # не упираемся в лимит параметров SQLite
+                part = keys[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT file_id, idx, kind, codec, width, height, fps, channels, sample_rate, language, bitrate "
+                    f"FROM streams WHERE file_id IN ({','.join('?' * len(part))}) ORDER BY file_id, idx", part)
+                for row in rows:
+                    ids[row[0]].streams.append(StreamRecord(*row[1:]))
+        return records
+
+    def count(self, query=None):
+        where, params = (query or CatalogQuery()).sql()
+        return self._db().execute(f"SELECT COUNT(*) FROM files f WHERE {where}", params).fetchone()[0]
+
+
+def write_batch_manifest(path, records):
+    """Сохраняет записи каталога как манифест пакета (см. load_batch_manifest)."""
+    data = {"jobs": [{"input": os.path.abspath(record.path)} for record in records]}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+# ========== Миниатюры и кэш спрайтов ==========
+class SpriteCache:
+    """Дисковый LRU-кэш спрайт-листов миниатюр с ограничением по суммарному размеру.
+
+    Ключ — идентичность файла (путь, размер, mtime) плюс параметры полосы. Время последнего
+    использования хранится в mtime файла спрайта: при попадании он «трогается» через os.utime,
+    а при превышении бюджета удаляются самые давно использованные.
+    """
+    SUFFIX = ".jpg"
+    TEMP_PREFIX = "~tmp-"   # недостроенные файлы: вытеснение их не трогает
+
+    def __init__(self, directory=None, budget_bytes=128 * 1024 * 1024):
+        self.directory = directory or os.path.join(CACHE_DIR, "thumbs")
+        self.budget_bytes = budget_bytes
+
+    @staticmethod
+    def key(path, count, height):
+        st = os.stat(path)
+        ident = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}|{count}|{height}"
+        return hashlib.sha1(ident.encode('utf-8')).hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def get(self, key):
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def temp_path(self):
+        """Временный файл в каталоге кэша: put() переносит его на место без копирования между дисками."""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=self.SUFFIX, prefix=self.TEMP_PREFIX, dir=self.directory)
+        os.close(fd)
+        return tmp_path
+
+    def put(self, key, source_path):
+        os.makedirs(self.directory, exist_ok=True)
+        target = self.path_for(key)
+        os.replace(source_path, target)
+        self.evict()
+        return target
+
+    def evict(self):
+        try:
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.endswith(self.SUFFIX) or name.startswith(self.TEMP_PREFIX):
+                    continue
+                st = os.stat(os.path.join(self.directory, name))
+                entries.append((st.st_mtime, st.st_size, name))
+        except OSError:
+            return
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.budget_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+                total -= size
+            except OSError:
+                pass
+
+
+def thumbnail_times(duration, count, index=None):
+    """Равномерные моменты миниатюр (по центрам отрезков, чтобы не попадать в чёрный первый кадр).
+
+    Если есть индекс ключевых кадров, моменты притягиваются к ближайшим ключевым кадрам —
+    тогда ffmpeg почти ничего не декодирует после перемотки.
+    """
+    times = [(i + 0.5) * duration / count for i in range(count)]
+    if index is not None and len(index.key_pts) >= count:
+        times = [index.nearest_keyframe(t) for t in times]
+    return times
+
+
+async def generate_sprite(supervisor, ffmpeg_cmd, path, times, thumb_width, thumb_height, output):
+    """Собирает полосу миниатюр одним процессом ffmpeg: по входу с -ss на каждую точку + hstack."""
+    cmd = [ffmpeg_cmd, '-hide_banner', '-v', 'error', '-y']
+    for t in times:
+        cmd += ['-ss', f"{t:.3f}", '-i', path]
+    chains = [f"[{i}:v]scale={thumb_width}:{thumb_height},setsar=1[t{i}]" for i in range(len(times))]
+    inputs = "".join(f"[t{i}]" for i in range(len(times)))
+    filter_graph = ";".join(chains) + f";{inputs}hstack=inputs={len(times)}[strip]"
+    cmd += ['-filter_complex', filter_graph, '-map', '[strip]', '-frames:v', '1', '-q:v', '3', output]
+    result = await supervisor.capture(cmd)
+    if result.returncode != 0 or not os.path.exists(output):
+        raise RuntimeError(result.stderr.decode('utf-8', errors='replace').strip() or "ffmpeg не создал спрайт")
+    return output
+
+
+# ========== Умная обрезка без полного перекодирования ==========
+def parse_timecode(text):
+    """Разбирает '90', '1:30', '00:01:30.5' в секунды. Возвращает None для пустой/неверной строки
+    (в том числе 'nan' и 'inf', которые float() принимает)."""
+    text = (text or "").strip()
+    if not text:
+        return None
+    try:
+        parts = [float(p) for p in text.split(":")]
+    except ValueError:
+        return None
+    if len(parts) > 3 or any(p < 0 or not math.isfinite(p) for p in parts):
+        return None
+    seconds = 0.0
+    for p in parts:
+        seconds = seconds * 60 + p
+    return seconds
+
+
+class SmartTrimJob:
+    """Обрезка по точкам входа/выхода с копированием целых GOP.
+
+    Полные GOP между первым и последним ключевым кадром внутри интервала копируются без
+    перекодирования, а перекодируются только неполные GOP у границ — с теми же кодеком,
+    профилем, pix_fmt и битрейтом, что у исходника. Части склеиваются concat-демуксером,
+    после чего аудио копируется из исходника за тот же интервал.
+    """
+    # Кодек исходника -> энкодер для перекодирования граничных кусков
+    ENCODERS = {
+        'h264': 'libx264', 'hevc': 'libx265', 'vp9': 'libvpx-vp9', 'vp8': 'libvpx',
+        'av1': 'libaom-av1', 'mpeg4': 'mpeg4', 'mpeg2video': 'mpeg2video'
+    }
+    # Профиль ffprobe -> значение -profile:v энкодера. Профиля нет в таблице (Extended, *Intra, Rext) —
+    # параметр не передаём: энкодер сам выберет профиль по pix_fmt
+    PROFILES = {
+        'libx264': {
+            'constrained baseline': 'baseline', 'baseline': 'baseline', 'main': 'main', 'high': 'high',
+            'high 10': 'high10', 'high 4:2:2': 'high422', 'high 4:4:4 predictive': 'high444',
+        },
+        'libx265': {'main': 'main', 'main 10': 'main10', 'main still picture': 'mainstillpicture'},
+    }
+    # Границы короче этого значения не перекодируем — ключевой кадр считается совпавшим с точкой реза
+    EPSILON = 0.02
+
+    def __init__(self, ffmpeg_cmd, ffprobe_cmd, source, output, start, end,
+                 on_log=None, on_progress=None, on_finished=None):
+        self.ffmpeg_cmd = ffmpeg_cmd
+        self.ffprobe_cmd = ffprobe_cmd
+        self.source = source
+        self.output = output
+        self.start_time = start
+        self.end_time = end
+        self.on_log = on_log
+        self.on_progress = on_progress
+        self.on_finished = on_finished
+        self.supervisor = get_supervisor()
+
+    def start(self):
+        return self.supervisor.run_coroutine(self._run())
+
+    def _log(self, text):
+        self.supervisor.post(self.on_log, text)
+
+    async def _probe_stream(self):
+        cmd = [
+            self.ffprobe_cmd, '-v', 'error', '-select_streams', 'v:0',
+            '-show_entries', 'stream=codec_name,profile,pix_fmt,bit_rate',
+            '-of', 'json', self.source
+        ]
+        result = await self.supervisor.capture(cmd)
+        streams = json.loads(result.stdout.decode('utf-8', errors='replace') or '{}').get('streams', [])
+        if not streams:
+            raise RuntimeError("в файле нет видеопотока")
+        return streams[0]
+
+    def _encode_args(self, stream):
+        codec = stream.get('codec_name', '')
+        encoder = self.ENCODERS.get(codec, 'libx264')
+        args = ['-c:v', encoder]
+        if stream.get('pix_fmt'):
+            args += ['-pix_fmt', stream['pix_fmt']]
+        profile = self.PROFILES.get(encoder, {}).get(str(stream.get('profile', '')).lower())
+        if profile:
+            args += ['-profile:v', profile]
+        try:
+            bit_rate = int(stream.get('bit_rate', 0))
+        except (TypeError, ValueError):
+            bit_rate = 0
+        if bit_rate > 0:
+            args += ['-b:v', str(bit_rate)]
+        elif encoder in ('libx264', 'libx265'):
+            args += ['-crf', '18']
+        return args
+
+    @staticmethod
+    def _part_format(stream):
+        # MPEG-TS переносит SPS/PPS в потоке, поэтому куски H.264/HEVC с разными extradata склеиваются корректно
+        return ('mpegts', '.ts') if stream.get('codec_name') in ('h264', 'hevc', 'mpeg2video') else ('matroska', '.mkv')
+
+    async def _ffmpeg(self, args):
+        cmd = [self.ffmpeg_cmd, '-hide_banner', '-v', 'error', '-y'] + args
+        result = await self.supervisor.capture(cmd)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.decode('utf-8', errors='replace').strip() or f"ffmpeg вернул {result.returncode}")
+
+    async def keyframes(self):
+        index = await MediaIndex.open_async(self.supervisor, self.ffprobe_cmd, self.source)
+        return index.keyframes_between(self.start_time, self.end_time)
+
+    def plan(self, keyframes):
+        """Возвращает список кусков (start, end, copy) для интервала обрезки."""
+        start, end = self.start_time, self.end_time
+        if len(keyframes) < 2:
+            return [(start, end, False)]
+        k_first, k_last = keyframes[0], keyframes[-1]
+        parts = []
+        if k_first - start > self.EPSILON:
+            parts.append((start, k_first, False))
+        parts.append((k_first, k_last, True))
+        if end - k_last > self.EPSILON:
+            parts.append((k_last, end, False))
+        return parts
+
+    async def _run(self):
+        success = False
+        workdir = tempfile.mkdtemp(prefix="cineconvert-trim-")
+        try:
+            stream = await self._probe_stream()
+            parts = self.plan(await self.keyframes())
+            fmt, part_ext = self._part_format(stream)
+            copied = sum(e - s for s, e, copy in parts if copy)
+            self._log(f"✂️ Обрезка {self.start_time:.2f}–{self.end_time:.2f} с: "
+                      f"копируется {copied:.2f} с, перекодируется {self.end_time - self.start_time - copied:.2f} с")
+            steps = len(parts) + 2
+            part_files = []
+            for i, (s, e, copy) in enumerate(parts):
+                part = os.path.join(workdir, f"part{i}{part_ext}")
+                codec_args = ['-c:v', 'copy'] if copy else self._encode_args(stream)
+                await self._ffmpeg([
+                    '-ss', f"{s:.6f}", '-i', self.source, '-t', f"{e - s:.6f}",
+                    '-map', '0:v:0', '-an', '-sn'
+                ] + codec_args + ['-avoid_negative_ts', 'make_zero', '-f', fmt, part])
+                part_files.append(part)
+                self._log(f"{'Скопирован' if copy else 'Перекодирован'} кусок {s:.2f}–{e:.2f} с")
+                self.supervisor.post(self.on_progress, int((i + 1) * 100 / steps))
+
+            list_file = os.path.join(workdir, "parts.txt")
+            with open(list_file, 'w', encoding='utf-8') as f:
+                for part in part_files:
+                    f.write("file '{}'\n".format(part.replace("'", "'\\''")))
+            video_only = os.path.join(workdir, "video" + part_ext)
+            await self._ffmpeg(['-f', 'concat', '-safe', '0', '-i', list_file, '-c', 'copy', '-f', fmt, video_only])
+            self.supervisor.post(self.on_progress, int((steps - 1) * 100 / steps))
+
+            await self._ffmpeg([
+                '-i', video_only,
+                '-ss', f"{self.start_time:.6f}", '-t', f"{self.end_time - self.start_time:.6f}", '-i', self.source,
+                '-map', '0:v:0', '-map', '1:a?', '-c', 'copy', self.output
+            ])
+            self.supervisor.post(self.on_progress, 100)
+            success = True
+        except Exception as e:
+            self._log(f"Ошибка обрезки: {e}")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+            self.supervisor.post(self.on_finished, success)
+        return success
+
+
+# ========== Чтение сырых кадров в NumPy ==========
+class FrameReader:
+    """Читает кадры из `ffmpeg -f rawvideo` прямо в заранее выделенное кольцо буферов.
+
+    Каждый слот кольца — bytearray с постоянным NumPy-представлением поверх него, поэтому
+    на кадр не выделяется память: readinto() заполняет очередной слот, и итератор отдаёт
+    его view. Кадр остаётся валидным, пока кольцо не сделает полный круг (ring_size кадров);
+    если кадр нужен дольше — скопируйте его. Обратное давление обеспечивает сам пайп:
+    пока потребитель не читает, ffmpeg блокируется на записи.
+
+    Чтение синхронное и идёт в потоке вызывающего, а не через ProcessSupervisor: asyncio-потоки
+    не умеют readinto в чужой буфер, а здесь важен именно нулевой копирующий путь.
+    """
+    # pix_fmt -> (dtype, функция формы массива по (w, h)); размер кадра в байтах следует из них
+    PIXEL_FORMATS = {
+        'rgb24': ('u1', lambda w, h: (h, w, 3)),
+        'bgr24': ('u1', lambda w, h: (h, w, 3)),
+        'rgba': ('u1', lambda w, h: (h, w, 4)),
+        'bgra': ('u1', lambda w, h: (h, w, 4)),
+        'gray': ('u1', lambda w, h: (h, w)),
+        'gray16le': ('<u2', lambda w, h: (h, w)),
+        'yuv420p': ('u1', lambda w, h: (h * 3 // 2, w)),
+    }
+    STDERR_TAIL = 50
+
+    def __init__(self, ffmpeg_cmd, path, width, height, pix_fmt='rgb24', fps=None,
+                 start=None, duration=None, ring_size=4):
+        if pix_fmt not in self.PIXEL_FORMATS:
+            raise ValueError(f"Неподдерживаемый pix_fmt: {pix_fmt}")
+        if pix_fmt == 'yuv420p' and (width % 2 or height % 2):
+            raise ValueError("Для yuv420p ширина и высота должны быть чётными")
+        self.ffmpeg_cmd = ffmpeg_cmd
+        self.path = path
+        self.width = int(width)
+        self.height = int(height)
+        self.pix_fmt = pix_fmt
+        self.fps = fps
+        self.start = start
+        self.duration = duration
+        self.ring_size = max(2, int(ring_size))
+        dtype, shape = self.PIXEL_FORMATS[pix_fmt]
+        self.shape = shape(self.width, self.height)
+        self.dtype = dtype
+        itemsize = 2 if dtype == '<u2' else 1
+        self.frame_bytes = itemsize
+        for dim in self.shape:
+            self.frame_bytes *= dim
+        self.frames_read = 0
+        self.stderr_tail = collections.deque(maxlen=self.STDERR_TAIL)
+        self._proc = None
+        self._closed = False
+
+    def command(self):
+        cmd = [self.ffmpeg_cmd, '-hide_banner', '-v', 'error', '-nostdin']
+        if self.start:
+            cmd += ['-ss', f"{self.start:.6f}"]
+        if self.duration:
+            cmd += ['-t', f"{self.duration:.6f}"]
+        cmd += ['-i', self.path, '-map', '0:v:0', '-an', '-sn']
+        filters = []
+        if self.fps:
+            filters.append(f"fps={self.fps}")
+        filters.append(f"scale={self.width}:{self.height}:flags=area")
+        cmd += ['-vf', ",".join(filters), '-pix_fmt', self.pix_fmt, '-f', 'rawvideo', 'pipe:1']
+        return cmd
+
+    def _drain_stderr(self, pipe):
+        for line in iter(pipe.readline, b''):
+            self.stderr_tail.append(line.decode('utf-8', errors='replace').rstrip())
+        pipe.close()
+
+    def _read_frame(self, view):
+        """Заполняет view целиком; возвращает False на EOF (неполный хвостовой кадр отбрасывается)."""
+        filled = 0
+        stdout = self._proc.stdout
+        while filled < self.frame_bytes:
+            n = stdout.readinto(view[filled:])
+            if not n:
+                return False
+            filled += n
+        return True
+
+    def __iter__(self):
+        try:
+            import numpy as np
+        except ImportError:
+            raise RuntimeError("Для чтения кадров требуется пакет numpy (pip install numpy)")
+        ring = [bytearray(self.frame_bytes) for _ in range(self.ring_size)]
+        views = [memoryview(buf) for buf in ring]
+        arrays = [np.frombuffer(buf, dtype=self.dtype).reshape(self.shape) for buf in ring]
+        self._proc = subprocess.Popen(
+            self.command(),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            bufsize=0,
+            creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
+        )
+        threading.Thread(target=self._drain_stderr, args=(self._proc.stderr,), daemon=True).start()
+        slot = 0
+        try:
+            while not self._closed:
+                try:
+                    if not self._read_frame(views[slot]):
+                        break
+                except (OSError, ValueError):
+                    # Пайп закрыт из close() в другом потоке
+                    break
+                self.frames_read += 1
+                yield arrays[slot]
+                slot = (slot + 1) % self.ring_size
+        finally:
+            self.close()
+
+    def close(self):
+        """Останавливает ffmpeg. Можно вызывать из другого потока для отмены чтения."""
+        self._closed = True
+        proc = self._proc
+        if proc is None:
+            return
+        if proc.poll() is None:
+            try:
+                proc.kill()
+            except OSError:
+                pass
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            pass
+        if proc.stdout is not None:
+            proc.stdout.close()
+
+    @property
+    def returncode(self):
+        return self._proc.returncode if self._proc is not None else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def benchmark_frame_reader(ffmpeg_cmd, path, frames=300, pix_fmt='rgb24', sizes=None):
+    """Замеряет пропускную способность FrameReader на нескольких разрешениях."""
+    sizes = sizes or [(320, 180), (640, 360), (1280, 720), (1920, 1080)]
+    results = []
+    for width, height in sizes:
+        reader = FrameReader(ffmpeg_cmd, path, width, height, pix_fmt=pix_fmt)
+        checksum = 0
+        started = time.perf_counter()
+        with reader:
+            for frame in reader:
+                # Трогаем данные, чтобы замер учитывал доступ к памяти кадра
+                checksum += int(frame[0, 0].sum())
+                if reader.frames_read >= frames:
+                    break
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        count = reader.frames_read
+        results.append({
+            "size": f"{width}x{height}",
+            "frames": count,
+            "fps": count / elapsed,
+            "mb_per_s": count * reader.frame_bytes / elapsed / (1024 * 1024),
+        })
+    return results
+
+
+class FFmpegWorker(QObject):
+    """Задача ffmpeg с прежним интерфейсом сигналов, выполняемая общим ProcessSupervisor."""
+    progressUpdated = pyqtSignal(int)
+    timeUpdated = pyqtSignal(float, float)  # текущая позиция и длительность (0 — неизвестна), секунды
+    outputReceived = pyqtSignal(str)
+    finished = pyqtSignal(bool)
+
+    def __init__(self, command, memory_limit=None):
         super().__init__()
         self.command = command
+        self.memory_limit = memory_limit
+        self.handle = None
 
-    def run(self):
+    def start(self):
+        # Проверим наличие запускаемого файла/команды заранее, чтобы не получить [Errno 2]
+        exe = self.command[0] if isinstance(self.command, (list, tuple)) and len(self.command) > 0 else None
+        if exe:
+            if os.path.isabs(exe) and not os.path.exists(exe):
+                self.outputReceived.emit(f"Ошибка: исполняемый файл не найден: {exe}")
+                self.finished.emit(False)
+                return
+            if not os.path.isabs(exe) and shutil.which(exe) is None:
+                self.outputReceived.emit(f"Ошибка: команда не найдена в PATH: {exe}")
+                self.finished.emit(False)
+                return
+        self.handle = get_supervisor().submit(
+            self.command,
+            on_lines=self._on_lines,
+            on_progress=self._on_progress,
+            on_finished=self._on_finished,
+            memory_limit=self.memory_limit
+        )
+
+    def cancel(self):
+        if self.handle is not None:
+            self.handle.cancel()
+
+    def isRunning(self):
+        return self.handle is not None and self.handle.running
+
+    def _on_lines(self, lines):
+        for line in lines:
+            self.outputReceived.emit(line.strip())
+
+    def _on_progress(self, handle):
+        parser = handle.parser
+        percent = parser.percent
+        if percent is not None:
+            self.progressUpdated.emit(percent)
+        if parser.current_time is not None:
+            self.timeUpdated.emit(parser.current_time, parser.total_duration or 0.0)
+
+    def _on_finished(self, handle):
+        self.finished.emit(handle.returncode == 0 and not handle.cancelled)
+
+# ========== Обзор аудио: огибающая и уровни ==========
+WAVEFORM_BUCKETS = 2048  # корзин огибающей (чётное: при переполнении соседние сливаются попарно)
+WAVEFORM_RATE = 8000  # частота моно-PCM для обзора, Гц
+WAVEFORM_CHUNK = 1 << 16  # отсчётов за одно чтение из пайпа
+WAVEFORM_SEGMENT_MIN = 600.0  # секунд на процесс ffmpeg при параллельном декодировании
+WAVEFORM_MAX_SEGMENTS = 4
+WAVEFORM_CLIP_LEVEL = 0.999  # |x| от этого уровня считаем клиппингом (≈ −0.01 dBFS)
+WAVEFORM_SILENCE_DB = -60.0
+
+
+def level_db(value):
+    """Амплитуда (1.0 — полная шкала) в dBFS; тишина — -inf."""
+    return 20 * math.log10(value) if value > 0 else float('-inf')
+
+
+class WaveformReducer:
+    """Потоковая свёртка PCM в огибающую фиксированного размера: min/max/сумма квадратов по корзинам.
+
+    Память постоянна и не зависит от длительности: массивы на buckets корзин плюс одна
+    частично заполненная корзина. Блок из целых корзин сворачивается одним reshape и min/max
+    по оси, без цикла по отсчётам. Ширина корзины задаётся по ожидаемой длине; если поток
+    оказался длиннее, соседние корзины сливаются попарно, а ширина удваивается — огибающая
+    всегда покрывает весь поток.
+    """
+    def __init__(self, buckets=WAVEFORM_BUCKETS, samples_per_bucket=WAVEFORM_RATE):
         try:
-            # Проверим наличие запускаемого файла/команды заранее, чтобы не получить [Errno 2]
-            import shutil as _shutil
-            exe = self.command[0] if isinstance(self.command, (list, tuple)) and len(self.command) > 0 else None
-            if exe:
-                if os.path.isabs(exe) and not os.path.exists(exe):
-                    self.outputReceived.emit(f"Ошибка: исполняемый файл не найден: {exe}")
-                    self.finished.emit(False)
-                    return
-                if not os.path.isabs(exe) and _shutil.which(exe) is None:
-                    self.outputReceived.emit(f"Ошибка: команда не найдена в PATH: {exe}")
-                    self.finished.emit(False)
-                    return
+            import numpy as np
+        except ImportError:
+            raise RuntimeError("Для обзора аудио требуется пакет numpy (pip install numpy)")
+        self._np = np
+        self.buckets = max(2, int(buckets) // 2 * 2)
+        self.samples_per_bucket = max(1, int(samples_per_bucket))
+        self.mins = np.zeros(self.buckets, dtype=np.float32)
+        self.maxs = np.zeros(self.buckets, dtype=np.float32)
+        self.squares = np.zeros(self.buckets, dtype=np.float64)
+        self.counts = np.zeros(self.buckets, dtype=np.int64)
+        self.filled = 0
+        self.samples = 0
+        self.clipped = 0
+        self._part = None  # [отсчётов, min, max, сумма квадратов] незаполненной корзины
 
-            process = subprocess.Popen(
-                self.command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                universal_newlines=True,
-                bufsize=1,
-                creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
-            )
+    def feed(self, data):
+        """Добавляет очередной блок float32-отсчётов (буфер можно переиспользовать после вызова)."""
+        np = self._np
+        n = len(data)
+        if not n:
+            return
+        self.samples += n
+        self.clipped += int(np.count_nonzero(np.abs(data) >= WAVEFORM_CLIP_LEVEL))
+        pos = 0
+        while pos < n:
+            spb = self.samples_per_bucket
+            if self._part is not None or n - pos < spb:
+                take = min(spb - (self._part[0] if self._part else 0), n - pos)
+                self._merge_partial(data[pos:pos + take])
+                pos += take
+                if self._part[0] >= self.samples_per_bucket:
+                    self._commit_partial()
+                continue
+            if self.filled == self.buckets:
+                self._fold()
+                continue
+            rows = min(self.buckets - self.filled, (n - pos) // spb)
+            block = data[pos:pos + rows * spb].reshape(rows, spb)
+            end = self.filled + rows
+            block.min(axis=1, out=self.mins[self.filled:end])
+            block.max(axis=1, out=self.maxs[self.filled:end])
+            self.squares[self.filled:end] = np.einsum('ij,ij->i', block, block, dtype=np.float64)
+            self.counts[self.filled:end] = spb
+            self.filled = end
+            pos += rows * spb
 
-            total_duration = None
-            while True:
-                line = process.stdout.readline()
-                if not line:
+    def _merge_partial(self, piece):
+        np = self._np
+        low, high = float(piece.min()), float(piece.max())
+        square = float(np.einsum('i,i->', piece, piece, dtype=np.float64))
+        if self._part is None:
+            self._part = [len(piece), low, high, square]
+        else:
+            part = self._part
+            part[0] += len(piece)
+            part[1], part[2] = min(part[1], low), max(part[2], high)
+            part[3] += square
+
+    def _commit_partial(self):
+        if self.filled == self.buckets:
+            self._fold()  # корзина стала вдвое шире — частичная ещё не заполнена
+            return
+        i = self.filled
+        self.counts[i], self.mins[i], self.maxs[i], self.squares[i] = self._part
+        self.filled += 1
+        self._part = None
+
+    def _fold(self):
+        np = self._np
+        half = self.filled // 2
+        np.minimum(self.mins[0:2 * half:2], self.mins[1:2 * half:2], out=self.mins[:half])
+        np.maximum(self.maxs[0:2 * half:2], self.maxs[1:2 * half:2], out=self.maxs[:half])
+        np.add(self.squares[0:2 * half:2], self.squares[1:2 * half:2], out=self.squares[:half])
+        np.add(self.counts[0:2 * half:2], self.counts[1:2 * half:2], out=self.counts[:half])
+        self.filled = half
+        self.samples_per_bucket *= 2
+
+    def finish(self):
+        """Закрывает последнюю неполную корзину. Вызывается один раз, когда поток кончился."""
+        while self._part is not None:
+            self._commit_partial()
+
+
+def summarize_waveform(reducers, sample_rate):
+    """Склеивает огибающие отрезков (по порядку) в обзор для кэша и отрисовки.
+
+    {'min', 'max', 'rms': списки по корзинам, 'peak', 'rms_level': амплитуды 0..1, 'clipped',
+    'silence': доля корзин тише WAVEFORM_SILENCE_DB, 'duration', 'sample_rate'}.
+    """
+    np = reducers[0]._np
+    mins = np.concatenate([r.mins[:r.filled] for r in reducers])
+    maxs = np.concatenate([r.maxs[:r.filled] for r in reducers])
+    squares = np.concatenate([r.squares[:r.filled] for r in reducers])
+    counts = np.concatenate([r.counts[:r.filled] for r in reducers])
+    samples = sum(r.samples for r in reducers)
+    rms = np.sqrt(squares / np.maximum(counts, 1))
+    return {
+        'min': [round(float(v), 4) for v in mins],
+        'max': [round(float(v), 4) for v in maxs],
+        'rms': [round(float(v), 4) for v in rms],
+        'peak': float(max(maxs.max(), -mins.min())) if len(mins) else 0.0,
+        'rms_level': math.sqrt(float(squares.sum()) / samples) if samples else 0.0,
+        'clipped': sum(r.clipped for r in reducers),
+        'silence': float(np.count_nonzero(rms < 10 ** (WAVEFORM_SILENCE_DB / 20)) / len(rms)) if len(rms) else 1.0,
+        'duration': samples / sample_rate,
+        'sample_rate': sample_rate,
+    }
+
+
+def stream_pcm(ffmpeg_cmd, path, reducer, start=None, length=None, sample_rate=WAVEFORM_RATE, cancel=None):
+    """Декодирует первый аудиопоток в моно float32 и по мере чтения отдаёт его в reducer.
+
+    Как и FrameReader, читает пайп синхронно в потоке вызывающего в один заранее выделенный
+    буфер. cancel — threading.Event: при его установке ffmpeg останавливается, а функция
+    возвращает False. Ошибка ffmpeg — RuntimeError с последней строкой его stderr.
+    """
+    import numpy as np
+    cmd = [ffmpeg_cmd, '-hide_banner', '-v', 'error', '-nostdin']
+    if start:
+        cmd += ['-ss', f"{start:.3f}"]
+    if length:
+        cmd += ['-t', f"{length:.3f}"]
+    cmd += ['-i', path, '-map', '0:a:0', '-vn', '-sn', '-dn', '-ac', '1', '-ar', str(sample_rate),
+            '-f', 'f32le', 'pipe:1']
+    buffer = bytearray(WAVEFORM_CHUNK * 4)
+    view = memoryview(buffer)
+    samples = np.frombuffer(buffer, dtype='<f4')
+    stderr_tail = collections.deque(maxlen=20)
+    proc = subprocess.Popen(
+        cmd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        bufsize=0,
+        creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
+    )
+
+    def _drain():
+        for line in iter(proc.stderr.readline, b''):
+            stderr_tail.append(line.decode('utf-8', errors='replace').rstrip())
+        proc.stderr.close()
+
+    drain = threading.Thread(target=_drain, daemon=True)
+    drain.start()
+    finished = False
+    try:
+        while not (cancel is not None and cancel.is_set()):
+            filled = 0
+            while filled < len(buffer):
+                n = proc.stdout.readinto(view[filled:])
+                if not n:
                     break
-                    
-                self.outputReceived.emit(line.strip())
-                
-                # Парсинг прогресса
-                if "Duration:" in line:
-                    parts = line.split("Duration:")[1].split(",")[0].strip()
-                    try:
-                        h, m, s = parts.split(":")
-                        total_duration = int(h)*3600 + int(m)*60 + float(s)
-                    except:
-                        pass
-                    
-                elif "time=" in line:
-                    time_str = line.split("time=")[1].split()[0]
-                    try:
-                        h, m, s = time_str.split(":")
-                        current_time = int(h)*3600 + int(m)*60 + float(s)
-                        
-                        if total_duration and total_duration > 0:
-                            progress = int((current_time / total_duration) * 100)
-                            self.progressUpdated.emit(min(progress, 100))
-                    except:
-                        pass
+                filled += n
+            reducer.feed(samples[:filled // 4])  # неполный хвостовой отсчёт отбрасывается
+            if filled < len(buffer):
+                finished = True
+                break
+    finally:
+        if not finished and proc.poll() is None:
+            proc.kill()
+        proc.stdout.close()
+        proc.wait()
+        drain.join(timeout=5)
+    if cancel is not None and cancel.is_set():
+        return False
+    if proc.returncode != 0:
+        raise RuntimeError(stderr_tail[-1] if stderr_tail else f"ffmpeg завершился с кодом {proc.returncode}")
+    reducer.finish()
+    return True
 
-            process.wait()
-            self.finished.emit(process.returncode == 0)
-            
+
+def compute_waveform(ffmpeg_cmd, path, duration=None, buckets=WAVEFORM_BUCKETS, sample_rate=WAVEFORM_RATE,
+                     cancel=None):
+    """Обзор аудио файла (см. summarize_waveform) или None, если построение отменили.
+
+    Длинный файл с известной длительностью режется на отрезки по WAVEFORM_SEGMENT_MIN секунд
+    (не больше WAVEFORM_MAX_SEGMENTS и числа ядер), каждый декодирует свой ffmpeg со своим
+    reducer'ом: декодер аудио однопоточный, и на трёхчасовом файле упирается именно в него.
+    """
+    segments = 1
+    if duration and duration > 0:
+        segments = max(1, min(WAVEFORM_MAX_SEGMENTS, os.cpu_count() or 1, int(duration // WAVEFORM_SEGMENT_MIN)))
+    if segments == 1:
+        spb = math.ceil(duration * sample_rate / buckets) if duration else sample_rate
+        reducer = WaveformReducer(buckets, spb)
+        if not stream_pcm(ffmpeg_cmd, path, reducer, sample_rate=sample_rate, cancel=cancel):
+            return None
+        return summarize_waveform([reducer], sample_rate)
+
+    cancel = cancel or threading.Event()
+    step = duration / segments
+    share = buckets // segments
+    reducers = [WaveformReducer(share, math.ceil(step * sample_rate / share)) for _ in range(segments)]
+    errors = []
+
+    def _run(i):
+        try:
+            # Последний отрезок без -t: дочитывает до конца, даже если длительность занижена
+            stream_pcm(ffmpeg_cmd, path, reducers[i], start=i * step,
+                       length=step if i < segments - 1 else None, sample_rate=sample_rate, cancel=cancel)
         except Exception as e:
-            self.outputReceived.emit(f"Ошибка: {str(e)}")
-            self.finished.emit(False)
+            errors.append(e)
+            cancel.set()
+
+    threads = [threading.Thread(target=_run, args=(i,), daemon=True) for i in range(segments)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    if cancel.is_set():
+        return None
+    return summarize_waveform(reducers, sample_rate)
+
+
+class WaveformCache(SpriteCache):
+    """Кэш обзоров аудио: JSON по идентичности файла, вытеснение — как у спрайтов."""
+    SUFFIX = ".json"
+
+    def __init__(self, directory=None, budget_bytes=32 * 1024 * 1024):
+        super().__init__(directory or os.path.join(CACHE_DIR, "waveforms"), budget_bytes)
+
+    @staticmethod
+    def key(path, buckets=WAVEFORM_BUCKETS, sample_rate=WAVEFORM_RATE):
+        return JsonCache.key(media_fingerprint(path), "waveform", buckets, sample_rate)
+
+    def load(self, path):
+        try:
+            cached = self.get(self.key(path))
+            if cached is None:
+                return None
+            with open(cached, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def store(self, path, overview):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(overview, f)
+        return self.put(self.key(path), tmp_path)
+
+
+def audio_overview(ffmpeg_cmd, path, duration=None, cache=None, cancel=None):
+    """Обзор аудио из кэша или построенный заново (и сохранённый в кэш). None — отменено."""
+    if cache is not None:
+        cached = cache.load(path)
+        if cached is not None:
+            return cached
+    overview = compute_waveform(ffmpeg_cmd, path, duration, cancel=cancel)
+    if overview is not None and cache is not None:
+        try:
+            cache.store(path, overview)
+        except OSError:
+            pass
+    return overview
+
+
+# ========== Нагрузочный тест пакета на подставном ffmpeg ==========
+# Windows не запускает .py как программу — там подставной ffmpeg вызывается через .cmd
+FAKE_FFMPEG = os.path.join(RESOURCE_DIR, "tools", "fake_ffmpeg.cmd" if sys.platform == 'win32' else "fake_ffmpeg.py")
+
+
+class EventLoopProbe:
+    """Задержка цикла событий Qt: таймер с периодом INTERVAL_MS и опоздание каждого срабатывания."""
+    INTERVAL_MS = 20
+
+    def __init__(self):
+        self.lags = []
+        self._last = None
+        self._timer = QTimer()
+        self._timer.timeout.connect(self._tick)
+
+    def start(self):
+        self._last = time.perf_counter()
+        self._timer.start(self.INTERVAL_MS)
+
+    def stop(self):
+        self._timer.stop()
+
+    def _tick(self):
+        now = time.perf_counter()
+        self.lags.append(max(0.0, now - self._last - self.INTERVAL_MS / 1000))
+        self._last = now
+
+    def percentile(self, q):
+        if not self.lags:
+            return 0.0
+        ordered = sorted(self.lags)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run_load_test(jobs=1000, parallel=4, scenario=None, verify=False, timeout=3600):
+    """Прогоняет пакет из jobs заданий через VideoConverter с подставным ffmpeg (tools/fake_ffmpeg.py).
+
+    Нужен запущенный QApplication (подойдёт QT_QPA_PLATFORM=offscreen). scenario — параметры
+    fake_ffmpeg (по умолчанию 10-секундные файлы со скоростью 50x). Через timeout секунд пакет
+    отменяется (на случай сценариев с зависаниями). Возвращает словарь замеров.
+    """
+    scenario = dict({"speed": 50.0, "duration": 10.0, "tick": 0.1, "write_bytes": 512}, **(scenario or {}))
+    os.environ["CINECONVERT_FAKE_FFMPEG"] = json.dumps(scenario)  # наследуют дочерние процессы
+    workdir = tempfile.mkdtemp(prefix="loadtest_")
+    window = VideoConverter()
+    window.ffmpeg_path = window.ffprobe_path = FAKE_FFMPEG
+    window.settings.update(show_video_notifications=False, verify_integrity=verify, verify_quality=False,
+                           scratch_dir="", prefetch_inputs=False, cluster_enabled=False, api_enabled=False)
+    window.batch_parallel.setMaximum(max(parallel, window.batch_parallel.maximum()))
+    window.batch_parallel.setValue(parallel)
+    probe = EventLoopProbe()
+    marks = {}
+    app = QCoreApplication.instance()
+
+    def _watch():
+        if "queued" not in marks and window.batch_queue is not None and not window.batch_probing:
+            marks["queued"] = time.perf_counter()
+        if "queued" in marks and window.batch_queue is None:
+            marks["finished"] = time.perf_counter()
+            app.quit()
+
+    def _timeout():
+        marks["timed_out"] = True
+        window.cancel_batch()
+
+    files = [os.path.join(workdir, f"job{n:05d}.mp4") for n in range(jobs)]  # файлы не нужны подставному ffprobe
+    watcher = QTimer()
+    watcher.timeout.connect(_watch)
+    cpu_start, marks["start"] = time.process_time(), time.perf_counter()
+    probe.start()
+    watcher.start(50)
+    QTimer.singleShot(int(timeout * 1000), _timeout)
+    window.start_batch(files)
+    app.exec()
+    probe.stop()
+    watcher.stop()
+    cpu = time.process_time() - cpu_start
+    states = window.jobs_board.status()
+    lines = window.log_text.document().blockCount()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    wall = marks.get("finished", time.perf_counter()) - marks["start"]
+    encode_wall = marks.get("finished", time.perf_counter()) - marks.get("queued", marks["start"])
+    ideal = jobs * scenario["duration"] / scenario["speed"] if scenario["speed"] else 0.0
+    return {
+        "jobs": jobs, "parallel": parallel, "wall": wall, "probe_wall": encode_wall and wall - encode_wall,
+        # Сколько слот простаивал или тратил на запуск процесса в расчёте на задание
+        "slot_overhead_ms": max(0.0, encode_wall * parallel - ideal) * 1000 / jobs,
+        "cpu_per_job_ms": cpu * 1000 / jobs,
+        "events_per_s": states["seq"] / wall if wall else 0.0,
+        "log_lines": lines,
+        "lag_p50_ms": probe.percentile(0.5) * 1000, "lag_p99_ms": probe.percentile(0.99) * 1000,
+        "lag_max_ms": max(probe.lags, default=0.0) * 1000,
+        "states": {k: v for k, v in states["jobs"].items() if v}, "timed_out": marks.get("timed_out", False),
+    }
+
+
+# ========== Командная строка ==========
+def load_tool_paths():
+    """Возвращает (ffmpeg, ffprobe) из config.json или имена из PATH."""
+    return CONFIG.get("ffmpeg_path") or "ffmpeg", CONFIG.get("ffprobe_path") or "ffprobe"
+
+
+def run_cli(argv):
+    """Обрабатывает консольные режимы без GUI. Возвращает код выхода или None, если нужно запустить GUI."""
+    import argparse
+    parser = argparse.ArgumentParser(prog="CineConvert", add_help=True)
+    parser.add_argument('--bench-frames', metavar='FILE', help="замер скорости FrameReader на нескольких разрешениях")
+    parser.add_argument('--frames', type=int, default=300, help="сколько кадров читать в замере")
+    parser.add_argument('--pix-fmt', default='rgb24', help="формат пикселей для замера")
+    parser.add_argument('--bench-filters', action='store_true',
+                        help="сравнить прежнюю и запланированную цепочку масштабирования (мс на кадр)")
+    parser.add_argument('--catalog-scan', nargs='+', metavar='DIR', help="просканировать папки в каталог медиатеки")
+    parser.add_argument('--catalog-query', metavar='EXPR', help='отбор из каталога, например "vcodec=h264 height>1080 acodec=ac3"')
+    parser.add_argument('--catalog-manifest', metavar='FILE', help="сохранить результат --catalog-query как манифест пакета")
+    parser.add_argument('--catalog-db', metavar='FILE', default=CATALOG_FILE, help="файл каталога SQLite")
+    parser.add_argument('--worker', metavar='URL', help="работать узлом распределённого рендеринга, например http://host:8765")
+    parser.add_argument('--worker-name', default=platform.node(), help="имя узла (по умолчанию — имя компьютера)")
+    parser.add_argument('--worker-slots', type=int, default=1, help="сколько заданий узел выполняет одновременно")
+    parser.add_argument('--worker-token', default="", help="токен координатора (Настройки → Распределённый рендеринг)")
+    parser.add_argument('--ffmpeg', metavar='PATH', help="путь к ffmpeg (по умолчанию из config.json или PATH)")
+    parser.add_argument('--audio-overview', metavar='FILE',
+                        help="обзор аудио файла без кэша: уровни, клиппинг и время построения")
+    parser.add_argument('--load-test', type=int, metavar='JOBS',
+                        help="нагрузочный тест пакета на подставном ffmpeg (tools/fake_ffmpeg.py)")
+    parser.add_argument('--load-parallel', type=int, default=4, help="одновременных заданий в нагрузочном тесте")
+    parser.add_argument('--load-scenario', metavar='JSON', help="сценарий fake_ffmpeg: JSON или путь к файлу")
+    parser.add_argument('--load-verify', action='store_true', help="проверять целостность результатов в нагрузочном тесте")
+    parser.add_argument('--load-timeout', type=float, default=3600, help="отменить нагрузочный тест через столько секунд")
+    parser.add_argument('--profile-startup', action='store_true', help="вывести время запуска по фазам до первой отрисовки")
+    args, _ = parser.parse_known_args(argv)
+
+    ffmpeg_path, ffprobe_path = load_tool_paths()
+    if args.bench_frames:
+        print(f"FrameReader: {args.bench_frames}, {args.frames} кадров, {args.pix_fmt}")
+        for row in benchmark_frame_reader(ffmpeg_path, args.bench_frames, args.frames, args.pix_fmt):
+            print(f"{row['size']:>10}  {row['frames']:>6} кадров  {row['fps']:>9.1f} fps  {row['mb_per_s']:>8.1f} MB/s")
+        return 0
+    if args.ffmpeg:
+        ffmpeg_path = args.ffmpeg
+    if args.worker:
+        node = RenderNode(args.worker, args.worker_name, args.worker_slots, ffmpeg_path, args.worker_token)
+        print(f"Узел {node.name}: координатор {node.url}, слотов {node.slots}")
+        try:
+            node.run()
+        except KeyboardInterrupt:
+            pass
+        return 0
+    if args.catalog_scan or args.catalog_query is not None:
+        return run_catalog_cli(args, ffprobe_path)
+    if args.load_test:
+        return run_load_test_cli(args)
+    if args.audio_overview:
+        return run_audio_overview_cli(args.audio_overview, ffmpeg_path, ffprobe_path)
+    if args.bench_filters:
+        print(f"Цепочка фильтров: {args.frames} кадров testsrc2, мс на кадр")
+        try:
+            rows = benchmark_filters(ffmpeg_path, args.frames)
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"Ошибка запуска ffmpeg: {e}")
+            return 1
+        for row in rows:
+            saved = row['legacy_ms'] - row['planned_ms']
+            print(f"{row['case']:>24}  было {row['legacy_ms']:>7.2f}  стало {row['planned_ms']:>7.2f}  "
+                  f"экономия {saved:>6.2f}  [{row['filters']}]")
+        return 0
+    return None
+
+
+def run_load_test_cli(args):
+    scenario = None
+    if args.load_scenario:
+        try:
+            if os.path.exists(args.load_scenario):
+                with open(args.load_scenario, 'r', encoding='utf-8') as f:
+                    scenario = json.load(f)
+            else:
+                scenario = json.loads(args.load_scenario)
+        except (OSError, ValueError) as e:
+            print(f"Ошибка сценария: {e}")
+            return 2
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    app = QApplication.instance() or QApplication(sys.argv[:1])  # noqa: F841 — нужен на время теста
+    print(f"Нагрузочный тест: {args.load_test} заданий, {args.load_parallel} одновременно")
+    try:
+        result = run_load_test(args.load_test, args.load_parallel, scenario, args.load_verify, args.load_timeout)
+    finally:
+        get_supervisor().shutdown()
+    print(f"Время: {format_eta(result['wall'])} (анализ файлов {format_eta(result['probe_wall'])})"
+          + (" — прервано по таймауту" if result['timed_out'] else ""))
+    print(f"Накладные расходы слота: {result['slot_overhead_ms']:.1f} мс на задание; "
+          f"CPU процесса: {result['cpu_per_job_ms']:.1f} мс на задание")
+    print(f"События прогресса: {result['events_per_s']:.0f}/с; строк журнала: {result['log_lines']}")
+    print(f"Задержка цикла событий: p50 {result['lag_p50_ms']:.1f} мс, p99 {result['lag_p99_ms']:.1f} мс, "
+          f"макс. {result['lag_max_ms']:.1f} мс")
+    print("Задания: " + ", ".join(f"{state} {count}" for state, count in result['states'].items()))
+    return 0 if not result['timed_out'] else 1
+
+
+def run_audio_overview_cli(path, ffmpeg_path, ffprobe_path):
+    supervisor = get_supervisor()
+    try:
+        duration = supervisor.run_coroutine(probe_media(supervisor, ffprobe_path, path)).result()['duration']
+    finally:
+        supervisor.shutdown()
+    started = time.perf_counter()
+    try:
+        overview = compute_waveform(ffmpeg_path, path, duration)
+    except (OSError, RuntimeError) as e:
+        print(f"Ошибка: {e}")
+        return 1
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    print(f"Обзор аудио: {path}")
+    print(f"Длительность: {format_eta(overview['duration'])}, построено за {elapsed:.1f} с "
+          f"({overview['duration'] / elapsed:.0f}x реального времени), корзин: {len(overview['rms'])}")
+    print(f"Пик: {level_db(overview['peak']):.1f} dBFS, RMS: {level_db(overview['rms_level']):.1f} dBFS, "
+          f"тишина: {overview['silence'] * 100:.0f}%, клиппинг: {overview['clipped']} отсч.")
+    return 0
+
+
+def run_catalog_cli(args, ffprobe_path):
+    catalog = MediaCatalog(args.catalog_db)
+    if args.catalog_scan:
+        def _progress(done, total):
+            print(f"\rАнализ файлов: {done} из {total}", end="", flush=True)
+        stats = catalog.scan(get_supervisor(), ffprobe_path, args.catalog_scan, on_progress=_progress)
+        print(f"\rФайлов: {stats['files']}, проанализировано: {stats['probed']}, удалено: {stats['removed']}, "
+              f"не открылись: {stats['failed']}. В каталоге: {catalog.count()}")
+    if args.catalog_query is not None:
+        try:
+            query = CatalogQuery.parse(args.catalog_query)
+        except ValueError as e:
+            print(f"Ошибка запроса: {e}")
+            return 2
+        records = catalog.query(query)
+        for record in records:
+            print(f"{record.path}\t{record.video_codec or '-'}\t{record.width or '?'}x{record.height or '?'}\t"
+                  f"{record.duration or 0:.0f} с")
+        print(f"Найдено файлов: {len(records)}")
+        if args.catalog_manifest:
+            write_batch_manifest(args.catalog_manifest, records)
+            print(f"Манифест пакета: {args.catalog_manifest}")
+    return 0
+
 
 # ========== Запуск приложения ==========
 if __name__ == "__main__":
+    cli_code = run_cli(sys.argv[1:])
+    if cli_code is not None:
+        sys.exit(cli_code)
+
+    PROFILER.mark("импорт модулей")
     app = QApplication(sys.argv)
     app.setStyle("Fusion")
+    # Все дочерние процессы ffmpeg обслуживает один фоновый поток; при выходе прерываем их
+    app.aboutToQuit.connect(lambda: get_supervisor().shutdown())
+    app.aboutToQuit.connect(CONFIG.flush)
+    PROFILER.mark("создание QApplication")
 
-    ffmpeg_path = ""
-    ffprobe_path = ""
-
-    # Проверка config.json
-    if os.path.exists(CONFIG_FILE):
-        try:
-            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-                cfg = json.load(f)
-            if cfg.get("ffmpeg_installed"):
-                ffmpeg_path = cfg.get("ffmpeg_path", "")
-                ffprobe_path = cfg.get("ffprobe_path", "")
-        except:
-            pass
+    # config.json читается один раз за запуск — дальше все обращения идут в память
+    ffmpeg_path = CONFIG.get("ffmpeg_path") if CONFIG.get("ffmpeg_installed") else ""
+    ffprobe_path = CONFIG.get("ffprobe_path") if CONFIG.get("ffmpeg_installed") else ""
+    PROFILER.mark("чтение конфигурации")
 
     # Если FFmpeg ещё не установлен — установка
     if not ffmpeg_path or not os.path.exists(ffmpeg_path):
         setup_dialog = FFmpegSetupDialog()
         setup_dialog.exec()
-
-        # Повторная загрузка конфигурации
-        if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-                cfg = json.load(f)
-                ffmpeg_path = cfg.get("ffmpeg_path", "")
-                ffprobe_path = cfg.get("ffprobe_path", "")
+        # Пути уже в хранилище конфигурации — перечитывать config.json не нужно
+        ffmpeg_path, ffprobe_path = setup_dialog.thread.result_paths
 
     # Если всё ок — запуск основного окна
     if ffmpeg_path and os.path.exists(ffmpeg_path):
@@ -1672,7 +7943,14 @@ if __name__ == "__main__":
         window.ffmpeg_path = ffmpeg_path
         window.ffprobe_path = ffprobe_path if ffprobe_path else ffmpeg_path.replace("ffmpeg.exe", "ffprobe.exe")
         window.show()
+        PROFILER.mark("показ окна")
+        if PROFILER.enabled:
+            def _report_startup():
+                PROFILER.mark("первая отрисовка")
+                for line in PROFILER.report():
+                    window.log_text.append(line)
+            QTimer.singleShot(0, _report_startup)
         sys.exit(app.exec())
     else:
         QMessageBox.critical(None, "Ошибка", "Не удалось установить FFmpeg.")
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
@@ -0,0 +1,78 @@
+"""Аренда заданий RenderCoordinator: истечение, повторная выдача и файлы результатов аренд."""
+import os
+import tempfile
+import unittest
+
+from CineConvert import RenderCoordinator
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class LeaseExpiryTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.events = []
+        self.coordinator = RenderCoordinator(on_event=lambda *event: self.events.append(event), clock=self.clock)
+        self.dir = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.dir.name, "clip_1.mp4")
+        self.job_id = self.coordinator.submit({"args": ["-i", "clip.mp4", self.output], "duration": 10.0,
+                                               "memory_limit": None, "output": self.output})
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def _expire(self, worker_alive=None):
+        self.clock.now += RenderCoordinator.LEASE_SECONDS + 1
+        if worker_alive:
+            self.coordinator.heartbeat(worker_alive, {})
+        self.coordinator.expire()
+
+    def test_expired_lease_goes_to_another_node_with_its_own_output(self):
+        first = self.coordinator.lease("a")
+        self.assertNotEqual(first["args"][-1], self.output)
+        self.assertEqual(os.path.splitext(first["args"][-1])[1], ".mp4")
+        with open(first["args"][-1], "wb") as f:
+            f.write(b"partial")  # узел a пропал, не дописав файл
+
+        self._expire(worker_alive="b")
+        self.assertIn((self.job_id, 'requeued', {"worker": "a"}), self.events)
+        self.assertFalse(os.path.exists(first["args"][-1]))
+
+        second = self.coordinator.lease("b")
+        self.assertEqual(second["id"], self.job_id)
+        self.assertNotEqual(second["args"][-1], first["args"][-1])
+        self.assertEqual(second["args"][:-1], first["args"][:-1])
+        with open(second["args"][-1], "wb") as f:
+            f.write(b"done")
+
+        self.assertFalse(self.coordinator.complete("a", self.job_id, True))  # устаревшая аренда
+        self.assertTrue(self.coordinator.complete("b", self.job_id, True))
+        with open(self.output, "rb") as f:
+            self.assertEqual(f.read(), b"done")
+        self.assertFalse(os.path.exists(second["args"][-1]))
+        self.assertEqual(self.events[-1][:2], (self.job_id, 'finished'))
+        self.assertTrue(self.events[-1][2]["success"])
+
+    def test_failed_lease_leaves_no_output(self):
+        lease = self.coordinator.lease("a")
+        with open(lease["args"][-1], "wb") as f:
+            f.write(b"partial")
+        self.assertTrue(self.coordinator.complete("a", self.job_id, False))
+        self.assertEqual(os.listdir(self.dir.name), [])
+
+    def test_job_returns_to_sender_when_no_nodes_are_left(self):
+        self.coordinator.lease("a")
+        self.clock.now += RenderCoordinator.LEASE_SECONDS + RenderCoordinator.WORKER_TIMEOUT + 1
+        self.coordinator.expire()
+        self.assertEqual(self.events[-1], (self.job_id, 'returned', {}))
+        self.assertIsNone(self.coordinator.lease("b"))
+
+
+if __name__ == "__main__":
+    unittest.main()
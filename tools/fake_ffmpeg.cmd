@@ -0,0 +1,3 @@
+@echo off
+rem Windows не запускает .py напрямую: укажите этот файл как ffmpeg_path и ffprobe_path
+python "%~dp0fake_ffmpeg.py" %*
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""Подставной ffmpeg/ffprobe для нагрузочного и сценарного тестирования CineConvert.
+
+Укажите этот файл как ffmpeg_path и ffprobe_path (режим ffprobe выбирается по имени файла
+или по аргументам -show_entries/-show_format/-show_streams). В Windows укажите fake_ffmpeg.cmd
+рядом с ним: файл .py там нельзя запустить как программу. Настоящего кодирования нет:
+выводится правдоподобный заголовок и строки прогресса с заданной скоростью, результат —
+небольшой файл с описанием «медиа», который подставной ffprobe потом читает обратно.
+
+Сценарий — JSON из переменной окружения CINECONVERT_FAKE_FFMPEG (текст или путь к файлу),
+иначе из fake_ffmpeg.json рядом с этим файлом:
+
+    {"speed": 20, "duration": 60, "width": 1920, "height": 1080, "fps": 25, "vcodec": "h264",
+     "fail_rate": 0.01, "seed": 1,
+     "rules": [{"match": "*crash*", "crash_at": 0.5}, {"match": "*/slow/*", "speed": 0.5}]}
+
+Параметры (в корне — для всех файлов, в rules — для входов, подходящих под шаблон fnmatch):
+  speed        секунд медиа за секунду (0 — мгновенно); jitter — разброс скорости ±доля
+  duration, width, height, fps, vcodec, acodec, pix_fmt, sar, size — что «видит» ffprobe
+  tick         период строк прогресса, секунд (как -stats_period у ffmpeg)
+  start_delay  задержка перед началом кодирования; probe_delay — задержка ffprobe
+  fail_at      доля файла, после которой «Conversion failed!» с кодом exit_code (по умолчанию 1)
+  hang_at      доля, после которой процесс перестаёт выводить прогресс и ждёт, пока его не убьют
+  crash_at     доля, после которой процесс аварийно завершается (abort) с недописанным результатом
+  probe_fail   ffprobe не может открыть файл
+  fail_rate, hang_rate, crash_rate, probe_fail_rate — доля файлов с таким поведением;
+               выбор детерминирован: зависит только от пути и seed
+  ssim         что сообщает фильтр ssim при проверке качества
+  write_bytes  размер файла результата (по умолчанию 4096)
+"""
+import fnmatch
+import json
+import os
+import random
+import sys
+import time
+import zlib
+
+MAGIC = b"CINECONVERT-FAKE-MEDIA\n"
+DEFAULTS = {
+    "speed": 10.0, "jitter": 0.0, "duration": 60.0, "width": 1920, "height": 1080, "fps": 25.0,
+    "vcodec": "h264", "acodec": "aac", "pix_fmt": "yuv420p", "sar": "1:1", "size": None,
+    "tick": 0.5, "start_delay": 0.0, "probe_delay": 0.0, "exit_code": 1, "seed": 0,
+    "fail_at": None, "hang_at": None, "crash_at": None, "probe_fail": False,
+    "fail_rate": 0.0, "hang_rate": 0.0, "crash_rate": 0.0, "probe_fail_rate": 0.0,
+    "ssim": 0.985, "write_bytes": 4096,
+}
+# Кодек результата по энкодеру -c:v (его и покажет ffprobe)
+CODEC_OF_ENCODER = {"libx264": "h264", "h264_nvenc": "h264", "libx265": "hevc", "hevc_nvenc": "hevc",
+                    "libvpx-vp9": "vp9", "libaom-av1": "av1", "libsvtav1": "av1"}
+QUIET_LEVELS = ("quiet", "panic", "fatal", "error", "warning")
+ENCODERS = ("libx264", "libx265", "h264_nvenc", "hevc_nvenc", "libvpx-vp9", "libaom-av1", "libsvtav1",
+            "aac", "libmp3lame", "flac", "libopus", "ac3")
+
+
+def load_scenario():
+    raw = os.environ.get("CINECONVERT_FAKE_FFMPEG")
+    if not raw:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_ffmpeg.json")
+        if not os.path.exists(path):
+            return {}
+        raw = path
+    if not raw.lstrip().startswith("{"):
+        with open(raw, "r", encoding="utf-8") as f:
+            raw = f.read()
+    return json.loads(raw)
+
+
+def settings_for(scenario, path):
+    """Параметры для входного файла: значения по умолчанию, корень сценария, подходящие правила.
+
+    Случайные сбои (*_rate) достаются только исходникам: результат самого подставного ffmpeg
+    при проверке читается честно, иначе проверка «ломала» бы уже готовые файлы.
+    """
+    options = dict(DEFAULTS)
+    options.update({k: v for k, v in scenario.items() if k != "rules"})
+    for rule in scenario.get("rules") or ():
+        if fnmatch.fnmatch(path, rule.get("match", "*")):
+            options.update({k: v for k, v in rule.items() if k != "match"})
+    if is_result(path):
+        return options
+    # Случайные сбои — по хешу имени файла, чтобы повтор прогона (в другом каталоге) давал те же сбои
+    roll = random.Random(zlib.crc32(os.path.basename(path).encode("utf-8")) ^ int(options["seed"]))
+    for name, key in (("fail_rate", "fail_at"), ("hang_rate", "hang_at"), ("crash_rate", "crash_at")):
+        chance, at = roll.random(), roll.random()
+        if options[key] is None and chance < options[name]:
+            options[key] = round(at, 3)
+    if roll.random() < options["probe_fail_rate"]:
+        options["probe_fail"] = True
+    if options["jitter"]:
+        options["speed"] = options["speed"] * (1 + options["jitter"] * (2 * roll.random() - 1))
+    return options
+
+
+def is_result(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def read_media(path, options):
+    """Описание файла: из заголовка результата подставного ffmpeg, иначе из сценария."""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(4096)
+    except OSError:
+        head = b""
+    if head.startswith(MAGIC):
+        header, _, rest = head[len(MAGIC):].partition(b"\n")
+        media = json.loads(header)
+        if not rest.rstrip(b"\0").endswith(b"END"):
+            media["truncated"] = True
+        return media
+    return {k: options[k] for k in ("duration", "width", "height", "fps", "vcodec", "acodec", "pix_fmt", "sar", "size")}
+
+
+def timestamp(seconds):
+    hours, rest = divmod(max(seconds, 0.0), 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{secs:05.2f}"
+
+
+def option(args, name, default=None):
+    if name in args:
+        index = args.index(name)
+        if index + 1 < len(args):
+            return args[index + 1]
+    return default
+
+
+def ffprobe(args, scenario):
+    path = args[-1] if args else ""
+    options = settings_for(scenario, path)
+    time.sleep(options["probe_delay"])
+    media = read_media(path, options)
+    if options["probe_fail"] or media.get("truncated"):
+        sys.stderr.write(f"{path}: Invalid data found when processing input\n")
+        return 1
+    duration = float(media["duration"])
+    fps = float(media["fps"])
+    frames = int(duration * fps)
+    video = {
+        "index": 0, "codec_name": media["vcodec"], "codec_type": "video", "width": media["width"],
+        "height": media["height"], "pix_fmt": media["pix_fmt"], "sample_aspect_ratio": media["sar"],
+        "avg_frame_rate": f"{int(fps * 1000)}/1000", "r_frame_rate": f"{int(fps * 1000)}/1000",
+        "duration": f"{duration:.6f}", "nb_frames": str(frames),
+    }
+    if "-count_packets" in args:
+        video["nb_read_packets"] = str(frames)
+    audio = {"index": 1, "codec_name": media["acodec"], "codec_type": "audio", "channels": 2,
+             "sample_rate": "48000", "duration": f"{duration:.6f}", "tags": {"language": "eng"}}
+    size = media.get("size") or int(duration * 250_000)
+    info = {
+        "streams": [video] if option(args, "-select_streams") == "v:0" else [video, audio],
+        "format": {"filename": path, "format_name": "mov,mp4,m4a,3gp,3g2,mj2", "duration": f"{duration:.6f}",
+                   "size": str(size), "bit_rate": str(int(size * 8 / duration)) if duration else "0"},
+    }
+    sys.stdout.write(json.dumps(info, indent=2) + "\n")
+    return 0
+
+
+def ffmpeg(args, scenario):
+    err = sys.stderr
+    if "-version" in args:
+        sys.stdout.write("ffmpeg version 6.1-cineconvert-fake Copyright (c) 2000-2023 the FFmpeg developers\n")
+        return 0
+    if "-encoders" in args:
+        sys.stdout.write("Encoders:\n" + "".join(f" V....D {name:<20} fake {name}\n" for name in ENCODERS))
+        return 0
+    inputs = [args[i + 1] for i, arg in enumerate(args[:-1]) if arg == "-i"]
+    if not inputs:
+        err.write("At least one output file must be specified\n")
+        return 1
+    source = inputs[0]
+    options = settings_for(scenario, source)
+    media = read_media(source, options)
+    duration = float(media["duration"])
+    # Фрагмент: -ss/-t перед первым входом, -sseof — последние секунды
+    first_input = args.index("-i")
+    before = args[:first_input]
+    seek = float(option(before, "-ss", 0) or 0)
+    if option(before, "-sseof"):
+        seek = max(0.0, duration + float(option(before, "-sseof")))
+    length = max(0.0, duration - seek)
+    limit = option(before, "-t") or option(args[first_input:], "-t")
+    if limit:
+        length = min(length, float(limit))
+    output = args[-1]
+    null_output = output == "-" or option(args, "-f") == "null"
+    width, height = media["width"], media["height"]
+    scale = option(args, "-vf") or ""
+    if scale.startswith("scale="):
+        try:
+            width, height = (int(v) for v in scale[6:].split(":")[:2])
+        except ValueError:
+            pass
+
+    # -v error и тише: как у ffmpeg, в stderr только ошибки
+    verbose = (option(args, "-v") or option(args, "-loglevel") or "info") not in QUIET_LEVELS
+    if verbose and "-hide_banner" not in args:
+        err.write("ffmpeg version 6.1-cineconvert-fake Copyright (c) 2000-2023 the FFmpeg developers\n")
+    if verbose:
+        err.write(f"Input #0, mov,mp4,m4a,3gp,3g2,mj2, from '{source}':\n")
+        err.write(f"  Duration: {timestamp(duration)}, start: 0.000000, bitrate: 2000 kb/s\n")
+        err.write(f"  Stream #0:0(und): Video: {media['vcodec']} (High), {media['pix_fmt']}, "
+                  f"{media['width']}x{media['height']}, {media['fps']} fps\n")
+        err.write(f"  Stream #0:1(eng): Audio: {media['acodec']}, 48000 Hz, stereo, fltp\n")
+        err.write(f"Output #0, {'null' if null_output else 'mp4'}, to '{output}':\n")
+    err.flush()
+
+    time.sleep(options["start_delay"])
+    handle = None
+    if not null_output:
+        handle = open(output, "wb")
+        encoder = option(args, "-c:v", "copy")
+        described = dict(media, duration=round(length, 3), width=width, height=height,
+                         vcodec=CODEC_OF_ENCODER.get(encoder, media["vcodec"] if encoder == "copy" else encoder),
+                         size=None)
+        handle.write(MAGIC + json.dumps(described).encode("utf-8") + b"\n")
+        handle.flush()
+
+    speed = float(options["speed"])
+    tick = float(options["tick"])
+    # Явный -stats печатает прогресс и при -v error, как у ffmpeg
+    stats = "-nostats" not in args and (verbose or "-stats" in args)
+    position, started = 0.0, time.monotonic()
+    events = sorted((float(options[key]) * length, key) for key in ("fail_at", "hang_at", "crash_at")
+                    if options[key] is not None)
+    while True:
+        if speed > 0:
+            time.sleep(tick)
+            position = min(length, (time.monotonic() - started) * speed)
+        else:
+            position = length
+        if events and position >= events[0][0]:
+            position, event = events[0]
+            if stats:
+                err.write(progress_line(position, media, started) + "\n")
+            return misbehave(event, options, handle, err)
+        if stats:
+            err.write(progress_line(position, media, started) + ("\r" if position < length else "\n"))
+            err.flush()
+        if position >= length:
+            break
+
+    if verbose and "ssim" in (option(args, "-lavfi") or option(args, "-filter_complex") or ""):
+        err.write(f"[Parsed_ssim_0 @ 0x0] SSIM Y:{options['ssim']:.6f} U:{options['ssim']:.6f} "
+                  f"V:{options['ssim']:.6f} All:{options['ssim']:.6f} (18.2)\n")
+        err.write("[Parsed_psnr_1 @ 0x0] PSNR y:40.10 u:44.20 v:44.50 average:41.30 min:38.00 max:45.00\n")
+    if handle is not None:
+        handle.write(b"\0" * max(0, int(options["write_bytes"]) - handle.tell() - 3) + b"END")
+        handle.close()
+    if verbose:
+        err.write("video:1024kB audio:128kB subtitle:0kB other streams:0kB global headers:0kB muxing overhead: 0.5%\n")
+    return 0
+
+
+def progress_line(position, media, started):
+    elapsed = max(time.monotonic() - started, 1e-3)
+    frame = int(position * float(media["fps"]))
+    return (f"frame={frame:5d} fps={frame / elapsed:.0f} q=28.0 size={int(position * 250):8d}kB "
+            f"time={timestamp(position)} bitrate=2000.0kbits/s speed={position / elapsed:.3g}x")
+
+
+def misbehave(event, options, handle, err):
+    if event == "fail_at":
+        err.write("Error while encoding: Invalid argument\nConversion failed!\n")
+        if handle is not None:
+            handle.close()
+        return int(options["exit_code"])
+    err.flush()
+    if event == "hang_at":
+        while True:  # как зависший кодировщик: ни вывода, ни выхода
+            time.sleep(3600)
+    os.abort()  # crash_at: сигнал SIGABRT, результат недописан
+
+
+def main(argv):
+    scenario = load_scenario()
+    args = argv[1:]
+    name = os.path.basename(argv[0]).lower()
+    probe_args = {"-show_entries", "-show_format", "-show_streams"}
+    if "ffprobe" in name or probe_args & set(args):
+        return ffprobe(args, scenario)
+    return ffmpeg(args, scenario)
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main(sys.argv))
+    except BrokenPipeError:
+        sys.exit(1)